@@ -0,0 +1,134 @@
+import cv2
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+# 动图格式
+ANIMATION_FORMATS = {
+    "GIF": {"ext": "gif", "mime": "image/gif"},
+    "WebP": {"ext": "webp", "mime": "image/webp"},
+}
+
+# 计算全局调色板时抽样的帧数和每帧缩略图的最长边
+PALETTE_SAMPLE_FRAMES = 16
+PALETTE_SAMPLE_SIDE = 128
+
+# Pillow 编码 WebP 动图前需要在内存中保留全部缩放后的帧，这里限制其总大小
+WEBP_MAX_BUFFER_BYTES = 512 * 1024 * 1024
+
+
+def scaled_size(width, height, max_side=None):
+    """按最长边限制计算缩放后的尺寸（只缩小不放大）"""
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def webp_frame_limit(size):
+    """给定输出尺寸下 WebP 动图允许的最大帧数"""
+    return max(1, WEBP_MAX_BUFFER_BYTES // (size[0] * size[1] * 3))
+
+
+def _to_rgb(frame, size):
+    """BGR 图像缩放到 size 并转换为 RGB"""
+    if (frame.shape[1], frame.shape[0]) != size:
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def build_global_palette(read_frame, frame_count, colors=256, sample_frames=PALETTE_SAMPLE_FRAMES):
+    """从均匀抽样的帧拼成的缩略图马赛克计算一次全局调色板，返回 P 模式的调色板图像"""
+    if frame_count == 0:
+        raise ValueError("没有可用于计算调色板的帧")
+    sample_indices = np.unique(np.linspace(0, frame_count - 1, min(sample_frames, frame_count)).astype(int))
+    thumbnails = []
+    size = None
+    for index in sample_indices:
+        frame = read_frame(int(index))
+        if size is None:
+            size = scaled_size(frame.shape[1], frame.shape[0], PALETTE_SAMPLE_SIDE)
+        # 保留背景且不强制参考尺寸时各帧尺寸可能不同，统一缩放到首帧的缩略图尺寸后再纵向拼接
+        thumbnails.append(_to_rgb(frame, size))
+    mosaic = Image.fromarray(np.concatenate(thumbnails, axis=0))
+    return mosaic.quantize(colors=colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+
+
+class AnimatedGifWriter:
+    """流式 GIF 写入器：所有帧共用一个全局调色板，逐帧量化并立即写入文件
+
+    Pillow 的多帧 GIF 保存会先收集所有帧，这里直接写出文件头和每帧数据，
+    任何时刻内存中只有当前一帧。
+    """
+
+    def __init__(self, path, fps, palette, loop=0, dither=True):
+        self.path = path
+        self.duration = int(round(1000 / fps))
+        self.palette = palette
+        self.loop = loop
+        self.dither = Image.Dither.FLOYDSTEINBERG if dither else Image.Dither.NONE
+        self._file = None
+
+    def write(self, frame):
+        """写入一帧 RGB 图像（numpy 数组或 PIL 图像）"""
+        image = frame if isinstance(frame, Image.Image) else Image.fromarray(frame)
+        indexed = image.quantize(palette=self.palette, dither=self.dither)
+        if self._file is None:
+            self._file = open(self.path, "wb")
+            header, _ = GifImagePlugin.getheader(
+                indexed, info={"loop": self.loop, "duration": self.duration, "optimize": False}
+            )
+            for block in header:
+                self._file.write(block)
+        for block in GifImagePlugin.getdata(indexed, duration=self.duration):
+            self._file.write(block)
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(b";")  # GIF 文件结束标记
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def export_animation(path, read_frame, frame_count, fps, fmt="GIF", max_side=None, loop=0,
+                     quality=80, progress=None):
+    """将帧序列导出为动图
+
+    read_frame(i) 返回第 i 帧（BGR 图像）；max_side 限制输出最长边；
+    progress(已完成帧数, 总帧数) 用于报告进度。
+    GIF 逐帧流式写入；WebP 由 Pillow 编码，需要保留缩放后的帧列表，
+    帧数超过 webp_frame_limit(size) 时抛出 ValueError。
+    """
+    if frame_count == 0:
+        raise ValueError("没有可导出的帧")
+    first = read_frame(0)
+    size = scaled_size(first.shape[1], first.shape[0], max_side)
+    if fmt == "WebP" and frame_count > webp_frame_limit(size):
+        raise ValueError(
+            f"WebP 动图在 {size[0]}x{size[1]} 尺寸下最多 {webp_frame_limit(size)} 帧（当前 {frame_count} 帧），"
+            f"请减小最长边或改用 GIF"
+        )
+
+    if fmt == "GIF":
+        palette = build_global_palette(read_frame, frame_count)
+        with AnimatedGifWriter(path, fps, palette, loop=loop) as writer:
+            for i in range(frame_count):
+                writer.write(_to_rgb(read_frame(i), size))
+                if progress:
+                    progress(i + 1, frame_count)
+    elif fmt == "WebP":
+        frames = []
+        for i in range(frame_count):
+            frames.append(Image.fromarray(_to_rgb(read_frame(i), size)))
+            if progress:
+                progress(i + 1, frame_count)
+        frames[0].save(path, format="WEBP", save_all=True, append_images=frames[1:],
+                       duration=int(round(1000 / fps)), loop=loop, quality=quality)
+    else:
+        raise ValueError(f"不支持的动图格式: {fmt}")
+    return path
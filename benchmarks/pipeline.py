@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+对齐流水线基准测试：使用合成人脸帧测量各阶段的吞吐量
+Alignment pipeline benchmark on synthetic face frames
+
+用法:
+    python benchmarks/pipeline.py                                  # 默认扫描
+    python benchmarks/pipeline.py --sizes 1920x1080,4032x3024 --workers 1,2,4 --batch 16,64 --output after.json
+    python benchmarks/pipeline.py --compare before.json after.json # 比较两次结果
+
+阶段：decode（JPEG 解码）、detect（_get_stable_landmarks）、transform（相似变换）、
+warp（warpAffine）、watermark（日期水印）、encode（视频编码）。
+合成帧的真实关键点已知，未安装 MediaPipe 或检测失败时其余阶段照常测量。
+完全离线运行，只需要 CPU。
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_landmarks import FaceLandmarks  # noqa: E402
+from head_stabilizer import HeadStabilizer  # noqa: E402
+from video_export import open_video_writer  # noqa: E402
+from watermark import DateWatermarker  # noqa: E402
+
+STAGES = ("decode", "detect", "transform", "warp", "watermark", "encode")
+
+
+def synthetic_face(width, height, seed):
+    """生成一张带人脸轮廓的合成图片，返回 (BGR 图像, 真实关键点)"""
+    rng = np.random.default_rng(seed)
+    # 渐变背景加噪声，避免 JPEG 压缩后过于平坦
+    gradient = np.linspace(60, 180, width, dtype=np.float32)[None, :, None]
+    image = np.broadcast_to(gradient, (height, width, 3)).copy()
+    image += rng.normal(0, 8, size=image.shape).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    face_w = 0.35 * min(width, height) * rng.uniform(0.9, 1.1)
+    face_h = face_w * 1.3
+    cx = width / 2 + rng.uniform(-0.05, 0.05) * width
+    cy = height / 2 + rng.uniform(-0.05, 0.05) * height
+    cv2.ellipse(image, (int(cx), int(cy)), (int(face_w / 2), int(face_h / 2)), 0, 0, 360, (140, 170, 220), -1)
+
+    eye_w = 0.18 * face_w
+    eye_y = cy - 0.1 * face_h
+    detected = []
+    for side in (-1, 1):
+        ex = cx + side * 0.22 * face_w
+        cv2.ellipse(image, (int(ex), int(eye_y)), (int(eye_w / 2), int(eye_w / 4)), 0, 0, 360, (245, 245, 245), -1)
+        cv2.circle(image, (int(ex), int(eye_y)), max(1, int(eye_w / 6)), (50, 40, 30), -1)
+        outer, inner = ex + side * eye_w / 2, ex - side * eye_w / 2
+        detected.append((outer, inner) if side < 0 else (inner, outer))
+    nose = (cx, cy + 0.12 * face_h)
+    cv2.circle(image, (int(nose[0]), int(nose[1])), max(1, int(face_w * 0.04)), (110, 130, 190), -1)
+    cv2.ellipse(image, (int(cx), int(cy + 0.3 * face_h)), (int(face_w * 0.15), int(face_w * 0.05)),
+                0, 0, 180, (80, 80, 160), max(1, int(face_w * 0.02)))
+
+    points = [
+        (detected[0][0], eye_y), (detected[0][1], eye_y),
+        (detected[1][0], eye_y), (detected[1][1], eye_y),
+        nose,
+    ]
+
+    # 轻微旋转，接近真实照片中的头部姿态变化
+    angle = rng.uniform(-8, 8)
+    R = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+    image = cv2.warpAffine(image, R, (width, height), borderMode=cv2.BORDER_REFLECT_101)
+    points = np.hstack([np.asarray(points), np.ones((5, 1))]) @ R.T
+    return image, FaceLandmarks.from_detected(points)
+
+
+def make_frames(width, height, count, seed=0):
+    """生成 count 帧合成图片，以 JPEG 数据保存，返回 [(JPEG 数据, 真实关键点)]"""
+    frames = []
+    for i in range(count):
+        image, landmarks = synthetic_face(width, height, seed + i)
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ok:
+            raise RuntimeError("无法编码合成帧")
+        frames.append((data, landmarks))
+    return frames
+
+
+def detection_available():
+    """检查 MediaPipe 是否可用，不可用时返回原因"""
+    try:
+        import mediapipe  # noqa: F401
+    except Exception as e:
+        return False, str(e)
+    return True, None
+
+
+def summarize(samples, frames):
+    """将逐帧耗时（秒）汇总为吞吐量和分位数"""
+    if not samples:
+        return None
+    total = float(sum(samples))
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "frames": frames,
+        "seconds": round(total, 6),
+        "fps": round(frames / total, 3) if total > 0 else None,
+        "ms_mean": round(float(ms.mean()), 4),
+        "ms_p50": round(float(np.percentile(ms, 50)), 4),
+        "ms_p95": round(float(np.percentile(ms, 95)), 4),
+    }
+
+
+def new_stabilizer(output_size, quality):
+    stabilizer = HeadStabilizer(output_size=output_size, preserve_background=False, warp_quality=quality)
+    stabilizer.set_reference_eyes_position(30)
+    return stabilizer
+
+
+def new_watermarker():
+    return DateWatermarker("position_bottom_right", 8.0, "white", 0.3, 20)
+
+
+def run_stages(frames, output_size, quality, detect):
+    """单线程逐帧测量各阶段耗时（每帧处理完即释放，内存中只保留一帧）"""
+    stabilizer = new_stabilizer(output_size, quality)
+    watermarker = new_watermarker()
+    samples = {stage: [] for stage in STAGES}
+    detected = 0
+    start_date = date(2020, 1, 1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = open_video_writer(os.path.join(tmp_dir, "bench.mp4"), "mp4v", 30, output_size)
+        try:
+            for i, (data, truth) in enumerate(frames):
+                t0 = time.perf_counter()
+                image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+                t1 = time.perf_counter()
+                samples["decode"].append(t1 - t0)
+
+                if detect:
+                    t0 = time.perf_counter()
+                    found = stabilizer._get_stable_landmarks(image)
+                    samples["detect"].append(time.perf_counter() - t0)
+                    detected += found is not None
+
+                t0 = time.perf_counter()
+                M = stabilizer.compute_transform(truth)
+                t1 = time.perf_counter()
+                aligned = stabilizer._warp_to_output(image, M, output_size, quality=quality)
+                t2 = time.perf_counter()
+                watermarker.apply(aligned, (start_date + timedelta(days=i)).isoformat())
+                t3 = time.perf_counter()
+                writer.write(aligned)
+                t4 = time.perf_counter()
+                samples["transform"].append(t1 - t0)
+                samples["warp"].append(t2 - t1)
+                samples["watermark"].append(t3 - t2)
+                samples["encode"].append(t4 - t3)
+        finally:
+            writer.release()
+
+    stages = {stage: summarize(values, len(values)) for stage, values in samples.items()}
+    if detect:
+        stages["detect"]["hit_rate"] = round(detected / len(frames), 3)
+        # 检测阶梯中各步骤的成功次数
+        counters = stabilizer.metrics.snapshot()["counters"]
+        stages["detect"]["steps"] = {
+            name[len("detect_step_"):]: count for name, count in counters.items() if name.startswith("detect_step_")
+        }
+    return stages
+
+
+def run_parallel(frames, output_size, quality, workers, detect):
+    """多线程整体吞吐量：每帧 decode → (detect) → transform → warp → watermark
+
+    每个工作线程使用自己的稳定器和水印器：稳定器保存每次检测的状态（如 last_detection_step），
+    水印精灵缓存不是线程安全的；检测模型仍在进程内共享，与实际任务相同
+    """
+    local = threading.local()
+    start_date = date(2020, 1, 1)
+
+    def process(item):
+        i, (data, truth) = item
+        if not hasattr(local, "stabilizer"):
+            local.stabilizer = new_stabilizer(output_size, quality)
+            local.watermarker = new_watermarker()
+        stabilizer, watermarker = local.stabilizer, local.watermarker
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if detect:
+            stabilizer._get_stable_landmarks(image)
+        M = stabilizer.compute_transform(truth)
+        aligned = stabilizer._warp_to_output(image, M, output_size, quality=quality)
+        watermarker.apply(aligned, (start_date + timedelta(days=i)).isoformat())
+        return aligned.shape
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(process, enumerate(frames)):
+            pass
+    elapsed = time.perf_counter() - t0
+    return {"frames": len(frames), "seconds": round(elapsed, 6), "fps": round(len(frames) / elapsed, 3)}
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def parse_list(text, convert=int):
+    return [convert(item) for item in text.split(",") if item.strip()]
+
+
+def environment():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+    }
+    try:
+        import mediapipe
+        info["mediapipe"] = getattr(mediapipe, "__version__", "unknown")
+    except Exception:
+        info["mediapipe"] = None
+    return info
+
+
+def benchmark(sizes, workers_list, batches, output_size, quality, repeat, detect):
+    results = []
+    for width, height in sizes:
+        for batch in batches:
+            frames = make_frames(width, height, batch)
+            # 预热：构建模型、初始化编码器，不计入结果
+            run_stages(frames[:1], output_size, quality, detect)
+
+            runs = [run_stages(frames, output_size, quality, detect) for _ in range(repeat)]
+            # 多次重复时取每个阶段 fps 的中位数那一次
+            stages = {}
+            for stage in STAGES:
+                candidates = [run[stage] for run in runs if run.get(stage)]
+                if candidates:
+                    candidates.sort(key=lambda r: r["fps"] or 0)
+                    stages[stage] = candidates[len(candidates) // 2]
+
+            parallel = {}
+            for workers in workers_list:
+                fps_runs = [run_parallel(frames, output_size, quality, workers, detect) for _ in range(repeat)]
+                parallel[str(workers)] = {
+                    "frames": batch,
+                    "fps": round(statistics.median(r["fps"] for r in fps_runs), 3),
+                }
+
+            result = {
+                "size": f"{width}x{height}",
+                "batch": batch,
+                "stages": stages,
+                "parallel": parallel,
+            }
+            results.append(result)
+            line = ", ".join(f"{stage} {info['fps']:.1f}" for stage, info in stages.items())
+            par = ", ".join(f"{w}w {info['fps']:.1f}" for w, info in parallel.items())
+            print(f"{width}x{height} × {batch}: {line} fps | 并行 {par} fps")
+    return results
+
+
+def result_key(result):
+    return result["size"], result["batch"]
+
+
+def compare(before_path, after_path):
+    """比较两次结果，打印各阶段 fps 的变化"""
+    with open(before_path, "r", encoding="utf-8") as f:
+        before = {result_key(r): r for r in json.load(f)["results"]}
+    with open(after_path, "r", encoding="utf-8") as f:
+        after = {result_key(r): r for r in json.load(f)["results"]}
+
+    print(f"{'尺寸':<12}{'帧数':>6}  {'阶段':<12}{'之前 fps':>12}{'之后 fps':>12}{'变化':>9}")
+    for key in sorted(set(before) & set(after)):
+        rows = [(stage, before[key]["stages"].get(stage), after[key]["stages"].get(stage)) for stage in STAGES]
+        rows += [(f"parallel×{w}", before[key]["parallel"].get(w), after[key]["parallel"].get(w))
+                 for w in after[key]["parallel"]]
+        for stage, old, new in rows:
+            if not old or not new or not old.get("fps") or not new.get("fps"):
+                continue
+            change = (new["fps"] / old["fps"] - 1) * 100
+            print(f"{key[0]:<12}{key[1]:>6}  {stage:<12}{old['fps']:>12.1f}{new['fps']:>12.1f}{change:>+8.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对齐流水线基准测试")
+    parser.add_argument("--sizes", default="640x480,1920x1080", help="输入尺寸列表，如 640x480,4032x3024")
+    parser.add_argument("--workers", default="1,4", help="并行吞吐量测试的线程数列表")
+    parser.add_argument("--batch", default="32", help="批次长度（帧数）列表")
+    parser.add_argument("--output-size", default="512x512", help="对齐输出尺寸")
+    parser.add_argument("--quality", default="standard", help="插值质量档位 fast/standard/high")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取中位数）")
+    parser.add_argument("--no-detect", action="store_true", help="不测量关键点检测阶段")
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="比较两个结果文件后退出")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    detect = not args.no_detect
+    skipped = {}
+    if detect:
+        detect, reason = detection_available()
+        if not detect:
+            skipped["detect"] = f"MediaPipe 不可用: {reason}"
+            print(f"跳过 detect 阶段: {reason}")
+
+    report = {
+        "meta": {
+            "environment": environment(),
+            "output_size": args.output_size,
+            "quality": args.quality,
+            "repeat": args.repeat,
+            "skipped": skipped,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": benchmark(
+            [parse_size(s) for s in args.sizes.split(",")],
+            parse_list(args.workers),
+            parse_list(args.batch),
+            parse_size(args.output_size),
+            args.quality,
+            max(1, args.repeat),
+            detect,
+        ),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+启动时间基准测试：比较单文件版本和单文件夹版本打开第一个页面所需的时间
+Startup benchmark: time-to-first-page of the onefile and onedir builds
+
+用法:
+    python benchmarks/startup_time.py --onefile dist/HeadAlignmentTool \
+        --onedir dist/HeadAlignmentToolDir/HeadAlignmentTool --runs 5
+    python benchmarks/startup_time.py --source      # 直接运行 run_streamlit.py 作为对照
+
+每次启动记录两个时间点：服务器健康检查通过（/_stcore/health），以及首个页面渲染完成——
+像浏览器一样连接 /_stcore/stream websocket 请求运行脚本，直到收到 script_finished 消息，
+因此包含了导入应用模块和第一次执行脚本的时间（预编译 .pyc 影响的正是这一部分）。
+需要在运行基准测试的 Python 环境中安装 streamlit（使用其 protobuf 消息定义和 tornado）。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    """轮询 url 直到返回 200，返回是否成功"""
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    response.read()
+                    return True
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.05)
+    return False
+
+
+async def _first_script_run(port, deadline):
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    from tornado.websocket import websocket_connect
+
+    def remaining():
+        return max(0.1, deadline - time.monotonic())
+
+    connection = await asyncio.wait_for(
+        websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"]), remaining()
+    )
+    try:
+        # 与浏览器打开页面时相同：请求一次脚本运行
+        back_msg = BackMsg()
+        back_msg.rerun_script.SetInParent()
+        await connection.write_message(back_msg.SerializeToString(), binary=True)
+        while True:
+            message = await asyncio.wait_for(connection.read_message(), remaining())
+            if message is None:
+                return False  # 服务器关闭了连接
+            forward_msg = ForwardMsg()
+            forward_msg.ParseFromString(message)
+            if forward_msg.WhichOneof("type") != "script_finished":
+                continue
+            if forward_msg.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                return True
+            if forward_msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                return False
+            # 脚本调用了 st.rerun() 等提前结束的情况，继续等待下一次运行完成
+    finally:
+        connection.close()
+
+
+def wait_for_first_run(port, deadline):
+    """连接应用的 websocket 并等待第一次脚本运行完成，返回是否成功"""
+    try:
+        return asyncio.run(_first_script_run(port, deadline))
+    except (asyncio.TimeoutError, OSError):
+        return False
+
+
+def stop(process):
+    """结束进程及其子进程（单文件版本由引导程序启动子进程）"""
+    if process.poll() is not None:
+        return
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)], capture_output=True)
+    else:
+        os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        if sys.platform != "win32":
+            os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def measure(command, timeout):
+    """启动一次，返回 (健康检查耗时, 首个页面渲染完成耗时)，超时或脚本运行失败返回 None"""
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "STREAMLIT_SERVER_PORT": str(port),
+        "STREAMLIT_SERVER_HEADLESS": "true",
+        "STREAMLIT_BROWSER_GATHER_USAGE_STATS": "false",
+    })
+    start = time.monotonic()
+    process = subprocess.Popen(
+        command, cwd=PROJECT_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=sys.platform != "win32"
+    )
+    try:
+        deadline = start + timeout
+        if not wait_for(f"http://127.0.0.1:{port}/_stcore/health", deadline):
+            return None
+        ready = time.monotonic() - start
+        if not wait_for_first_run(port, deadline):
+            return None
+        return ready, time.monotonic() - start
+    finally:
+        stop(process)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较打包版本的启动时间")
+    parser.add_argument("--onefile", help="单文件版本的可执行文件路径")
+    parser.add_argument("--onedir", help="单文件夹版本中的可执行文件路径")
+    parser.add_argument("--source", action="store_true", help="同时测量直接运行 run_streamlit.py 的启动时间")
+    parser.add_argument("--runs", type=int, default=3, help="每个版本的启动次数")
+    parser.add_argument("--timeout", type=float, default=180.0, help="单次启动的超时时间（秒）")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    targets = {}
+    if args.onefile:
+        targets["onefile"] = [os.path.abspath(args.onefile)]
+    if args.onedir:
+        targets["onedir"] = [os.path.abspath(args.onedir)]
+    if args.source:
+        targets["source"] = [sys.executable, os.path.join(PROJECT_DIR, "run_streamlit.py")]
+    if not targets:
+        parser.error("请至少指定 --onefile、--onedir 或 --source 之一")
+
+    results = {}
+    for name, command in targets.items():
+        ready_times, page_times = [], []
+        for run in range(args.runs):
+            timing = measure(command, args.timeout)
+            if timing is None:
+                print(f"{name} #{run + 1}: 超时或脚本运行失败")
+                continue
+            ready, page = timing
+            ready_times.append(ready)
+            page_times.append(page)
+            print(f"{name} #{run + 1}: 服务就绪 {ready:.2f}s, 首个页面渲染完成 {page:.2f}s")
+        results[name] = {
+            "runs": len(page_times),
+            "ready_median": statistics.median(ready_times) if ready_times else None,
+            "first_page_median": statistics.median(page_times) if page_times else None,
+            "first_page_min": min(page_times) if page_times else None,
+        }
+
+    print()
+    print(f"{'版本':<10}{'服务就绪(中位数)':>18}{'首次渲染(中位数)':>16}{'首次渲染(最快)':>14}")
+    for name, result in results.items():
+        if result["runs"]:
+            print(f"{name:<10}{result['ready_median']:>17.2f}s{result['first_page_median']:>15.2f}s"
+                  f"{result['first_page_min']:>13.2f}s")
+        else:
+            print(f"{name:<10}{'-':>18}{'-':>16}{'-':>14}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,7 @@ def check_pyinstaller():
 def check_dependencies():
     """检查项目依赖"""
     print("🔍 检查项目依赖...")
-    required_files = ["streamlit_app.py", "head_stabilizer.py", "requirements.txt", "run_streamlit.py"]
+    required_files = ["streamlit_app.py", "head_stabilizer.py", "face_landmarks.py", "watermark.py", "date_resolver.py", "folder_index.py", "video_export.py", "animated_export.py", "frame_store.py", "jobs.py", "checkpoint.py", "metrics.py", "prefilter.py", "dedup.py", "reference_manager.py", "requirements.txt", "run_streamlit.py"]
     
     for file in required_files:
         if not os.path.exists(file):
@@ -88,10 +88,48 @@ def build_with_pyinstaller():
         print(f"❌ 构建失败: {e}")
         return False
 
+def build_onedir():
+    """构建单文件夹版本：启动时无需解压，只打包需要的 MediaPipe 模块，并预编译应用模块"""
+    print("🔨 开始构建单文件夹版本...")
+    
+    try:
+        # 生成单文件夹 spec 文件（同时预编译应用模块）
+        print("📝 生成单文件夹spec文件...")
+        subprocess.run([sys.executable, "prepare_build.py", "--onedir"], check=True)
+        
+        subprocess.run([
+            sys.executable, "-m", "PyInstaller",
+            "HeadAlignmentToolDir.spec",
+            "--clean",
+            "--noconfirm"
+        ], check=True)
+        
+        # 检查输出目录
+        app_dir = os.path.join("dist", "HeadAlignmentToolDir")
+        exe_name = "HeadAlignmentTool.exe" if platform.system().lower() == "windows" else "HeadAlignmentTool"
+        exe_path = os.path.join(app_dir, exe_name)
+        
+        if os.path.exists(exe_path):
+            total_size = 0
+            for root, _, files in os.walk(app_dir):
+                total_size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+            print("✅ 应用构建成功！")
+            print(f"📦 应用目录: {app_dir}")
+            print(f"📏 目录大小: {total_size / (1024 * 1024):.1f} MB")
+            print(f"🎯 运行 {exe_path} 即可启动（请分发整个目录）")
+            return True
+        else:
+            print("❌ 未找到构建的应用文件")
+            return False
+    
+    except subprocess.CalledProcessError as e:
+        print(f"❌ 构建失败: {e}")
+        return False
+
 def cleanup():
     """清理临时文件"""
     print("🧹 清理临时文件...")
-    temp_files = ["run_streamlit.spec"]
+    temp_files = ["run_streamlit.spec", "HeadAlignmentToolDir.spec"]
     temp_dirs = ["build", "__pycache__"]
     
     for file in temp_files:
@@ -117,8 +155,10 @@ def main():
     if not check_dependencies():
         return
     
-    # 构建应用
-    if build_with_pyinstaller():
+    # 构建应用（--onedir 构建单文件夹版本，启动更快）
+    onedir = "--onedir" in sys.argv
+    build = build_onedir if onedir else build_with_pyinstaller
+    if build():
         print("\n🎉 打包完成！")
         print("📦 在 dist/ 目录中找到可执行文件")
         print("💡 提示：首次运行可能需要几秒钟启动时间")
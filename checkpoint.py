@@ -0,0 +1,138 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import cv2
+
+from face_landmarks import LandmarkCache
+
+CHECKPOINT_FILENAME = "checkpoint.json"
+LANDMARKS_FILENAME = "landmarks.npz"
+
+
+def job_fingerprint(source_keys, settings):
+    """根据输入图片的键和处理参数计算任务指纹，任何一项变化都会得到新的指纹"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str).encode())
+    for key in source_keys:
+        digest.update(b"\0")
+        digest.update(str(key).encode())
+    return digest.hexdigest()
+
+
+class BatchCheckpoint:
+    """批处理断点：定期记录已完成的输入索引、关键点和输出文件位置
+
+    同一任务（指纹相同）重新运行时跳过已完成的图片，从中断处继续；
+    指纹不同时丢弃旧的完成记录。关键点缓存和查重哈希按图片文件标识保存，不随指纹失效。
+    """
+
+    def __init__(self, directory, fingerprint, save_every=50, save_interval=10.0):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.outputs_dir = os.path.join(directory, "outputs")
+        self.path = os.path.join(directory, CHECKPOINT_FILENAME)
+        self.save_every = save_every
+        self.save_interval = save_interval
+        # {输入索引: {'output': 输出文件, 'debug': 调试图像文件, 'date': 日期字符串, 'date_iso': ISO 日期, 'skip': 跳过原因}}
+        self.completed = {}
+        self.landmark_cache = LandmarkCache(os.path.join(directory, LANDMARKS_FILENAME))
+        # {缓存键: [dHash, 清晰度]}，重新运行时查重无需再次读取缩略图
+        self.dedup_hashes = {}
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+        os.makedirs(self.outputs_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.dedup_hashes = state.get("dedup_hashes", {})
+        if state.get("fingerprint") == self.fingerprint:
+            self.completed = {int(index): entry for index, entry in state.get("completed", {}).items()}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "completed": self.completed, "dedup_hashes": self.dedup_hashes},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.landmark_cache.save()
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def remove(self):
+        """删除断点目录（整批完成后断点不再需要）"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @contextlib.contextmanager
+    def attach(self, stabilizer):
+        """在 with 块内让稳定器使用断点的关键点缓存，检测结果随断点一起保存
+
+        退出时把断点缓存合并回稳定器原来的缓存并恢复它，不会替换调用方的缓存
+        """
+        original = stabilizer.landmark_cache
+        self.landmark_cache.update(original)
+        stabilizer.landmark_cache = self.landmark_cache
+        try:
+            yield self
+        finally:
+            original.update(self.landmark_cache)
+            stabilizer.landmark_cache = original
+
+    def maybe_save(self):
+        """累计到一定数量或间隔一定时间后写入磁盘"""
+        if self._unsaved >= self.save_every or time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def __len__(self):
+        return len(self.completed)
+
+    def entry(self, index):
+        """返回已完成的记录；未完成或输出文件已丢失时返回 None"""
+        entry = self.completed.get(index)
+        if entry is None:
+            return None
+        for key in ("output", "debug"):
+            if entry.get(key) and not os.path.exists(entry[key]):
+                return None
+        return entry
+
+    def output_path(self, index, prefix=""):
+        return os.path.join(self.outputs_dir, f"{prefix}{index:06d}.png")
+
+    def write_output(self, index, image, prefix=""):
+        """将输出图像写入断点目录，返回文件路径"""
+        path = self.output_path(index, prefix)
+        if not cv2.imwrite(path, image):
+            raise ValueError(f"无法写入输出文件: {path}")
+        return path
+
+    def record_output(self, index, output_path, debug_path=None, date_str=None, date=None):
+        self.completed[index] = {
+            "output": output_path,
+            "debug": debug_path,
+            "date": date_str,
+            "date_iso": date.isoformat() if date else None,
+            "skip": None,
+        }
+        self._unsaved += 1
+        self.maybe_save()
+
+    def record_skip(self, index, reason):
+        self.completed[index] = {"output": None, "debug": None, "date": None, "date_iso": None, "skip": reason}
+        self._unsaved += 1
+        self.maybe_save()
+
+    @staticmethod
+    def read_image(path):
+        image = cv2.imread(path)
+        if image is None:
+            raise ValueError(f"无法读取输出文件: {path}")
+        return image
@@ -0,0 +1,302 @@
+import functools
+import io
+import os
+import re
+from datetime import datetime, timedelta
+
+import PIL.ExifTags
+import numpy as np
+from PIL import Image
+
+# 日期来源
+DATE_SOURCE_INPUT = "date_from_input"
+DATE_SOURCE_FILENAME = "date_from_filename"
+DATE_SOURCE_METADATA = "date_from_metadata"
+
+# 水印和文件名中使用的日期显示格式
+DATE_DISPLAY_FORMATS = {
+    "YYYY-MM-DD": "%Y-%m-%d",
+    "MM-DD-YYYY": "%m-%d-%Y",
+    "DD-MM-YYYY": "%d-%m-%Y",
+}
+
+
+# 内置的文件名日期模式
+BUILTIN_DATE_PATTERNS = ("YYYY-MM-DD", "YYYY_MM_DD", "YYYYMMDD", "MM-DD-YYYY", "DD-MM-YYYY")
+
+# 模板中的日期/时间占位符及对应的正则分组
+_TEMPLATE_TOKENS = {
+    'YYYY': ('year', r'\d{4}'),
+    'MM': ('month', r'\d{2}'),
+    'DD': ('day', r'\d{2}'),
+    'HH': ('hour', r'\d{2}'),
+    'SS': ('second', r'\d{2}'),
+}
+
+
+# 文件名日期解析结果的缓存条目上限（按 (文件名, 模式) 缓存）
+DATE_PARSE_CACHE_SIZE = 8192
+
+
+def _tokenize_template(template):
+    """将模板拆分为 [(文本, 字段名)]，普通字符的字段名为 None
+
+    出现 HH 之后的 MM 表示分钟，例如 IMG_YYYYMMDD_HHMMSS
+    """
+    tokens = []
+    fields = set()
+    i = 0
+    while i < len(template):
+        token = template[i:i + 4] if template.startswith('YYYY', i) else template[i:i + 2]
+        if token in _TEMPLATE_TOKENS:
+            field = _TEMPLATE_TOKENS[token][0]
+            if token == 'MM' and 'hour' in fields:
+                field = 'minute'
+            if field in fields:
+                raise ValueError(f"日期模式中重复的占位符: {token}")
+            fields.add(field)
+            tokens.append((token, field))
+            i += len(token)
+        else:
+            tokens.append((template[i], None))
+            i += 1
+    if not {'year', 'month', 'day'} <= fields:
+        raise ValueError(f"日期模式必须包含 YYYY、MM 和 DD: {template}")
+    return tokens
+
+
+@functools.lru_cache(maxsize=256)
+def compile_date_template(template):
+    """将 YYYY/MM/DD/HH/MM/SS 模板编译为正则表达式（按模板缓存）"""
+    parts = []
+    for token, field in _tokenize_template(template):
+        if field is None:
+            parts.append(re.escape(token))
+        else:
+            parts.append(f"(?P<{field}>{_TEMPLATE_TOKENS[token][1]})")
+    return re.compile(''.join(parts))
+
+
+def render_date_template(template, value):
+    """按模板生成包含日期时间的文本，是解析的逆操作，例如 IMG_YYYYMMDD_HHMMSS → IMG_20240131_081500"""
+    fields = {
+        'year': f"{value.year:04d}",
+        'month': f"{value.month:02d}",
+        'day': f"{value.day:02d}",
+        'hour': f"{getattr(value, 'hour', 0):02d}",
+        'minute': f"{getattr(value, 'minute', 0):02d}",
+        'second': f"{getattr(value, 'second', 0):02d}",
+    }
+    return ''.join(token if field is None else fields[field] for token, field in _tokenize_template(template))
+
+
+@functools.lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def parse_filename_datetime(filename, template):
+    """按模板从文件名（忽略扩展名）解析日期时间，失败时返回 None
+
+    纯函数，结果按 (文件名, 模板) 缓存在有上限的 LRU 缓存中，可在多个线程中调用
+    """
+    match = compile_date_template(template).search(os.path.splitext(filename)[0])
+    if not match:
+        return None
+    values = {k: int(v) for k, v in match.groupdict().items()}
+    try:
+        return datetime(values['year'], values['month'], values['day'],
+                        values.get('hour', 0), values.get('minute', 0), values.get('second', 0))
+    except ValueError:
+        return None
+
+
+class DatePatternRegistry:
+    """文件名日期模式注册表：内置模式加上用户自定义模式
+
+    注册表只保存模式名称（模板本身），编译和解析结果缓存在模块级的 LRU 缓存中；
+    每个会话使用 copy() 得到的独立注册表，自定义模式不会出现在其他会话中。
+    """
+
+    def __init__(self, templates=BUILTIN_DATE_PATTERNS):
+        self._templates = []
+        for template in templates:
+            self.register(template)
+
+    def register(self, template):
+        """注册一个模板（如 IMG_YYYYMMDD_HHMMSS），模板本身即为模式名称；模板无效时抛出 ValueError"""
+        compile_date_template(template)
+        if template not in self._templates:
+            self._templates.append(template)
+        return template
+
+    def copy(self):
+        return DatePatternRegistry(self._templates)
+
+    def names(self):
+        return list(self._templates)
+
+    def __contains__(self, template):
+        return template in self._templates
+
+    def parse_datetime(self, filename, pattern):
+        """从文件名解析日期时间，模式未注册或解析失败时返回 None"""
+        if pattern not in self._templates:
+            return None
+        return parse_filename_datetime(filename, pattern)
+
+    def parse(self, filename, pattern):
+        """从文件名解析日期，失败时返回 None"""
+        result = self.parse_datetime(filename, pattern)
+        return result.date() if result is not None else None
+
+    def format(self, value, pattern):
+        """按已注册的模式生成文件名中的日期部分"""
+        if pattern not in self._templates:
+            raise ValueError(f"未注册的日期模式: {pattern}")
+        return render_date_template(pattern, value)
+
+    def parse_many(self, filenames, pattern):
+        """一次解析整个文件列表，返回 datetime64[s] 数组（未解析到的为 NaT）"""
+        values = np.full(len(filenames), np.datetime64('NaT'), dtype='datetime64[s]')
+        for i, filename in enumerate(filenames):
+            result = self.parse_datetime(os.path.basename(filename), pattern)
+            if result is not None:
+                values[i] = np.datetime64(result, 's')
+        return values
+
+
+# 默认注册表，只包含内置模式；会话中的自定义模式注册到 copy() 得到的注册表
+DEFAULT_PATTERN_REGISTRY = DatePatternRegistry()
+
+
+def parse_date_from_filename(filename, pattern):
+    """从文件名中解析日期"""
+    return DEFAULT_PATTERN_REGISTRY.parse(filename, pattern)
+
+
+def argsort_dates(values, descending=False):
+    """对 datetime64 数组做稳定排序：有日期的在前，NaT 保持原顺序排在后面"""
+    values = np.asarray(values, dtype='datetime64[s]')
+    valid = np.flatnonzero(~np.isnat(values))
+    keys = values[valid].astype(np.int64)
+    if descending:
+        keys = -keys
+    dated = valid[np.argsort(keys, kind='stable')]
+    undated = np.flatnonzero(np.isnat(values))
+    return np.concatenate([dated, undated])
+
+
+def get_exif_date(image_source):
+    """从图片EXIF数据中获取拍摄日期，image_source 可以是文件路径或图片的二进制数据"""
+    try:
+        if isinstance(image_source, (bytes, bytearray, memoryview)):
+            image_source = io.BytesIO(image_source)
+        image = Image.open(image_source)
+        exifdata = image.getexif()
+
+        # 尝试获取拍摄日期
+        for tag_id in exifdata:
+            tag = PIL.ExifTags.TAGS.get(tag_id, tag_id)
+            if tag in ['DateTime', 'DateTimeOriginal', 'DateTimeDigitized']:
+                date_str = exifdata.get(tag_id)
+                if date_str:
+                    # EXIF日期格式通常是 "YYYY:MM:DD HH:MM:SS"
+                    return datetime.strptime(date_str.split()[0], "%Y:%m:%d").date()
+    except:
+        pass
+    return None
+
+
+def format_date(date, date_format):
+    """按显示格式将日期转换为字符串"""
+    if date is None:
+        return None
+    return date.strftime(DATE_DISPLAY_FORMATS.get(date_format, DATE_DISPLAY_FORMATS["YYYY-MM-DD"]))
+
+
+class DateTable:
+    """每个任务只计算一次的日期表
+
+    对排序后的输入集合解析一次日期（文件名或EXIF），水印、文件名生成和排序都从这里读取。
+    用户输入模式下日期按成功处理的帧序号递增，因此通过 date_for(输入索引, 帧序号) 查询。
+    """
+
+    def __init__(self, source=DATE_SOURCE_INPUT, date_format="YYYY-MM-DD", parse_pattern="YYYY-MM-DD",
+                 start_date=None, interval_days=1, input_dates=None, sort_values=None, registry=None):
+        self.source = source
+        self.date_format = date_format
+        self.parse_pattern = parse_pattern
+        self.start_date = start_date
+        self.interval_days = interval_days
+        self.registry = registry or DEFAULT_PATTERN_REGISTRY
+        self.input_dates = list(input_dates) if input_dates is not None else []
+        # 排序用的 datetime64 数组（文件名模式可包含时分秒）
+        self.sort_values = sort_values
+
+    @classmethod
+    def resolve(cls, names, exif_sources=None, known_dates=None, **settings):
+        """为输入集合解析日期
+
+        names 为文件名或路径列表；exif_sources 与之对应，元素为文件路径、二进制数据或 None；
+        known_dates 为 {名称: 日期} 的已知EXIF日期（如文件夹清单），命中时不再读取EXIF
+        """
+        table = cls(**settings)
+        if table.source == DATE_SOURCE_INPUT:
+            table.input_dates = [None] * len(names)
+            return table
+        if table.source == DATE_SOURCE_FILENAME:
+            # 文件名模式：整个列表一次性批量解析
+            table.sort_values = table.registry.parse_many(names, table.parse_pattern)
+            table.input_dates = [None if np.isnat(v) else v.astype(datetime).date() for v in table.sort_values]
+            return table
+        if exif_sources is None:
+            exif_sources = [None] * len(names)
+        for name, exif_source in zip(names, exif_sources):
+            if known_dates is not None and name in known_dates:
+                table.input_dates.append(known_dates[name])
+            else:
+                table.input_dates.append(table._resolve_one(name, exif_source))
+        return table
+
+    def _resolve_one(self, name, exif_source):
+        filename = os.path.basename(name)
+        if self.source == DATE_SOURCE_METADATA:
+            date = get_exif_date(exif_source) if exif_source is not None else None
+            if date is None and not (isinstance(exif_source, str) and os.path.isfile(exif_source)):
+                # 上传的文件读不到EXIF时，退回到从文件名解析
+                date = self.registry.parse(filename, self.parse_pattern)
+            return date
+        return None
+
+    def __len__(self):
+        return len(self.input_dates)
+
+    def _sort_values(self):
+        if self.sort_values is None:
+            self.sort_values = np.array(
+                [np.datetime64(date, 's') if date is not None else np.datetime64('NaT') for date in self.input_dates],
+                dtype='datetime64[s]'
+            )
+        return self.sort_values
+
+    def sort_order(self, descending=False):
+        """返回按日期排序的输入索引：有日期的在前（稳定排序），无日期的保持原顺序排在后面"""
+        return argsort_dates(self._sort_values(), descending=descending).tolist()
+
+    def reordered(self, order):
+        """返回按 order 重新排列输入后的日期表"""
+        order = list(order)
+        sort_values = self.sort_values[order] if self.sort_values is not None else None
+        return DateTable(self.source, self.date_format, self.parse_pattern, self.start_date,
+                         self.interval_days, [self.input_dates[i] for i in order], sort_values, self.registry)
+
+    def date_for(self, input_index, frame_index):
+        """查询日期：input_index 为输入集合中的位置，frame_index 为成功处理的帧序号"""
+        if self.source == DATE_SOURCE_INPUT:
+            if self.start_date is None:
+                return None
+            return self.start_date + timedelta(days=frame_index * self.interval_days)
+        if 0 <= input_index < len(self.input_dates):
+            return self.input_dates[input_index]
+        return None
+
+    def date_str_for(self, input_index, frame_index):
+        """查询格式化后的日期字符串，无日期时返回 None"""
+        return format_date(self.date_for(input_index, frame_index), self.date_format)
@@ -0,0 +1,183 @@
+import os
+
+import cv2
+import numpy as np
+
+# 跳过原因代码：与保留的照片近似重复，详情为保留的照片名
+SKIP_DUPLICATE = "duplicate_frame"
+
+# dHash 边长（8 → 64 位哈希）
+DHASH_SIZE = 8
+# 两张照片的哈希距离不超过该值时视为近似重复
+DEFAULT_MAX_DISTANCE = 4
+# 只比较输入顺序中相距不超过该数量的照片（连拍照片在排序后相邻）；None 表示全局比较
+DEFAULT_DEDUP_WINDOW = 10
+
+
+def read_thumbnail(source):
+    """以 1/8 分辨率解码灰度缩略图（JPEG 直接按 DCT 缩小解码），读取失败返回 None
+
+    source 为文件路径或图片的二进制数据
+    """
+    flags = cv2.IMREAD_REDUCED_GRAYSCALE_8
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, np.uint8), flags)
+    return cv2.imread(source, flags)
+
+
+def dhash(gray, hash_size=DHASH_SIZE):
+    """差值哈希：缩小到 (hash_size + 1) x hash_size，比较水平相邻像素，返回整数"""
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def sharpness(gray):
+    """拉普拉斯方差，越大越清晰"""
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHashTable:
+    """多索引哈希表：把哈希切成 max_distance + 1 段，每段一个查找表
+
+    距离不超过 max_distance 的两个哈希至少有一段完全相同（抽屉原理），
+    因此只需在各段的同值桶中找候选，再核对完整距离，无需两两比较。
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, bits=DHASH_SIZE * DHASH_SIZE):
+        chunks = max_distance + 1
+        if chunks > bits:
+            raise ValueError("最大距离不能超过哈希位数")
+        self.max_distance = max_distance
+        # 各段的 (位移, 掩码)，尽量等长
+        self._segments = []
+        start = 0
+        for i in range(chunks):
+            width = bits // chunks + (1 if i < bits % chunks else 0)
+            self._segments.append((start, (1 << width) - 1))
+            start += width
+        self._tables = [{} for _ in self._segments]
+        self._hashes = {}
+
+    def add(self, item_id, value):
+        self._hashes[item_id] = value
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            table.setdefault((value >> shift) & mask, []).append(item_id)
+
+    def remove(self, item_id):
+        value = self._hashes.pop(item_id)
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            key = (value >> shift) & mask
+            bucket = table[key]
+            bucket.remove(item_id)
+            if not bucket:
+                del table[key]
+
+    def query(self, value):
+        """返回 [(条目ID, 距离)]，包含所有距离不超过 max_distance 的条目"""
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            candidates.update(table.get((value >> shift) & mask, ()))
+        matches = []
+        for item_id in candidates:
+            distance = hamming_distance(value, self._hashes[item_id])
+            if distance <= self.max_distance:
+                matches.append((item_id, distance))
+        return matches
+
+
+def cluster_hashes(hashes, max_distance=DEFAULT_MAX_DISTANCE, window=DEFAULT_DEDUP_WINDOW):
+    """将哈希列表按近似重复聚类，返回 [[索引, ...], ...]（每簇按索引排序，簇按首个索引排序）
+
+    每簇以第一张照片为代表，新照片只与各簇的代表比较并加入距离最近的一簇，
+    因此簇内每个成员与代表的距离都不超过 max_distance，缓慢漂移的构图不会串成一个大簇。
+    hashes 中为 None 的条目（缩略图读取失败）各自单独成簇；
+    window 不为 None 时，簇的最后一个成员与当前照片相距超过 window 后该簇不再接收新成员
+    """
+    table = MultiIndexHashTable(max_distance)
+    clusters = []       # [[索引, ...]]，按代表的索引排列
+    last_member = {}    # {仍在表中的簇序号: 最后一个成员的索引}
+    for index, value in enumerate(hashes):
+        if window is not None:
+            for cluster_id in [c for c, last in last_member.items() if index - last > window]:
+                table.remove(cluster_id)
+                del last_member[cluster_id]
+        if value is None:
+            clusters.append([index])
+            continue
+        matches = table.query(value)
+        if matches:
+            cluster_id = min(matches, key=lambda match: (match[1], match[0]))[0]
+            clusters[cluster_id].append(index)
+        else:
+            cluster_id = len(clusters)
+            clusters.append([index])
+            table.add(cluster_id, value)
+        last_member[cluster_id] = index
+    return clusters
+
+
+class DuplicatePruner:
+    """近似重复照片筛选：计算每张照片缩略图的 dHash 和清晰度，每簇只保留最清晰的一张
+
+    在关键点检测和对齐之前运行，被剔除的照片不做任何后续处理。
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, window=DEFAULT_DEDUP_WINDOW):
+        self.max_distance = max_distance
+        self.window = window
+
+    def settings(self):
+        """筛选参数（用于任务指纹）"""
+        return {"max_distance": self.max_distance, "window": self.window, "hash_size": DHASH_SIZE}
+
+    def find_duplicates(self, sources, progress=None, cache=None):
+        """sources 为 [(名称, 路径或二进制数据, 缓存键)]，返回 {被剔除的索引: 保留的索引}
+
+        cache 为 {缓存键: [哈希, 清晰度]}（如断点中保存的结果），命中时不再读取缩略图，新结果写回 cache；
+        progress(已完成数, 总数) 用于报告读取缩略图的进度
+        """
+        hashes, scores = [], []
+        for i, (_, source, cache_key) in enumerate(sources):
+            cached = cache.get(cache_key) if cache is not None and cache_key is not None else None
+            if cached is not None:
+                value, score = cached
+            else:
+                gray = read_thumbnail(source)
+                if gray is None or gray.size == 0:
+                    # 读取失败的照片留给后续步骤报告错误
+                    value, score = None, 0.0
+                else:
+                    value, score = dhash(gray), sharpness(gray)
+                    if cache is not None and cache_key is not None:
+                        cache[cache_key] = [value, score]
+            hashes.append(value)
+            scores.append(score)
+            if progress:
+                progress(i + 1, len(sources))
+        return self.duplicates_from_hashes(hashes, scores)
+
+    def duplicates_from_hashes(self, hashes, scores):
+        """按哈希聚类，每簇保留最清晰的一张，返回 {被剔除的索引: 保留的索引}
+
+        只剔除与保留的照片距离不超过 max_distance 的成员，其余成员照常处理
+        """
+        duplicates = {}
+        for cluster in cluster_hashes(hashes, self.max_distance, self.window):
+            if len(cluster) < 2:
+                continue
+            # 清晰度相同时保留较早的一张
+            keep = max(cluster, key=lambda i: (scores[i], -i))
+            for index in cluster:
+                if index != keep and hamming_distance(hashes[index], hashes[keep]) <= self.max_distance:
+                    duplicates[index] = keep
+        return duplicates
+
+    @staticmethod
+    def skip_reason(sources, kept_index):
+        """被剔除照片的跳过原因 [原因代码, 保留的照片名]"""
+        return [SKIP_DUPLICATE, os.path.basename(sources[kept_index][0])]
@@ -0,0 +1,236 @@
+import os
+import numpy as np
+
+# 固定布局的关键点名称，顺序即为缓冲区中的行号
+LANDMARK_NAMES = (
+    'left_eye_outer',   # 左眼外角
+    'left_eye_inner',   # 左眼内角
+    'right_eye_inner',  # 右眼内角
+    'right_eye_outer',  # 右眼外角
+    'nose_tip',         # 鼻尖
+    'left_eye',         # 左眼中心（由眼角推导）
+    'right_eye',        # 右眼中心（由眼角推导）
+    'eye_center',       # 双眼中点（由眼睛中心推导）
+)
+LANDMARK_INDEX = {name: i for i, name in enumerate(LANDMARK_NAMES)}
+NUM_LANDMARKS = len(LANDMARK_NAMES)
+
+# MediaPipe FaceMesh 中对应前5个检测点的编号
+MESH_INDICES = (33, 133, 362, 263, 4)
+
+
+class FaceLandmarks:
+    """单帧稳定关键点记录，底层为 (8, 2) 的 float32 缓冲区
+
+    保留字典风格的访问方式（landmarks['nose_tip'] 返回整数坐标元组），
+    便于旧代码和 OpenCV 绘图函数直接使用；计算时请使用 points 数组。
+    """
+    __slots__ = ('points',)
+
+    def __init__(self, points):
+        self.points = np.ascontiguousarray(points, dtype=np.float32).reshape(NUM_LANDMARKS, 2)
+
+    @classmethod
+    def from_detected(cls, detected):
+        """由5个检测点（眼角和鼻尖）构建完整记录，推导眼睛中心和双眼中点"""
+        detected = np.asarray(detected, dtype=np.float32).reshape(len(MESH_INDICES), 2)
+        points = np.empty((NUM_LANDMARKS, 2), dtype=np.float32)
+        points[:5] = detected
+        points[5] = (detected[0] + detected[1]) / 2
+        points[6] = (detected[2] + detected[3]) / 2
+        points[7] = (points[5] + points[6]) / 2
+        return cls(points)
+
+    @classmethod
+    def from_mesh(cls, mesh_landmarks, width, height, offset=(0, 0)):
+        """从 MediaPipe 的归一化关键点列表构建记录
+
+        检测输入为原图中的一块区域时，width/height 为该区域在原图中的尺寸，offset 为区域左上角
+        """
+        x0, y0 = offset
+        detected = [(x0 + mesh_landmarks[i].x * width, y0 + mesh_landmarks[i].y * height) for i in MESH_INDICES]
+        return cls.from_detected(detected)
+
+    @classmethod
+    def from_dict(cls, mapping):
+        """从旧的字典格式构建记录，缺失的推导点会被自动补全"""
+        if isinstance(mapping, FaceLandmarks):
+            return mapping
+        points = np.full((NUM_LANDMARKS, 2), np.nan, dtype=np.float32)
+        for name, point in mapping.items():
+            if name in LANDMARK_INDEX:
+                points[LANDMARK_INDEX[name]] = point
+        if np.isnan(points[5]).any():
+            points[5] = (points[0] + points[1]) / 2
+        if np.isnan(points[6]).any():
+            points[6] = (points[2] + points[3]) / 2
+        if np.isnan(points[7]).any():
+            points[7] = (points[5] + points[6]) / 2
+        return cls(points)
+
+    def point(self, name):
+        """返回指定关键点的浮点坐标"""
+        return self.points[LANDMARK_INDEX[name]]
+
+    def scaled(self, sx, sy=None):
+        """返回按比例缩放后的新记录"""
+        sy = sx if sy is None else sy
+        return FaceLandmarks(self.points * np.array([sx, sy], dtype=np.float32))
+
+    def translated(self, dx, dy):
+        """返回平移后的新记录"""
+        return FaceLandmarks(self.points + np.array([dx, dy], dtype=np.float32))
+
+    # ---- 字典风格访问（向后兼容） ----
+    def __getitem__(self, name):
+        x, y = self.points[LANDMARK_INDEX[name]]
+        return (int(x), int(y))
+
+    def __contains__(self, name):
+        return name in LANDMARK_INDEX
+
+    def __iter__(self):
+        return iter(LANDMARK_NAMES)
+
+    def __len__(self):
+        return NUM_LANDMARKS
+
+    def get(self, name, default=None):
+        return self[name] if name in LANDMARK_INDEX else default
+
+    def keys(self):
+        return LANDMARK_NAMES
+
+    def values(self):
+        return [self[name] for name in LANDMARK_NAMES]
+
+    def items(self):
+        return [(name, self[name]) for name in LANDMARK_NAMES]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"FaceLandmarks({self.to_dict()})"
+
+
+def stack_landmarks(landmarks_list):
+    """将多帧关键点堆叠为 (N, 8, 2) 的数组，未检测到的帧填充 NaN"""
+    stacked = np.full((len(landmarks_list), NUM_LANDMARKS, 2), np.nan, dtype=np.float32)
+    for i, landmarks in enumerate(landmarks_list):
+        if landmarks is not None:
+            stacked[i] = FaceLandmarks.from_dict(landmarks).points
+    return stacked
+
+
+def unstack_landmarks(stacked):
+    """将 (N, 8, 2) 数组还原为 FaceLandmarks 列表，NaN 行还原为 None"""
+    return [None if np.isnan(row).any() else FaceLandmarks(row) for row in stacked]
+
+
+def landmark_geometry(stacked):
+    """由 (N, 8, 2) 关键点数组计算每帧的几何特征 (N, 4)：
+
+    双眼连线倾角（度）、眼距（像素）、鼻尖相对双眼中点的水平和垂直偏移（以眼距为单位）。
+    未检测到的帧为 NaN
+    """
+    left = stacked[:, LANDMARK_INDEX['left_eye']].astype(np.float64)
+    right = stacked[:, LANDMARK_INDEX['right_eye']].astype(np.float64)
+    nose = stacked[:, LANDMARK_INDEX['nose_tip']].astype(np.float64)
+    eye_vector = right - left
+    eye_distance = np.hypot(eye_vector[:, 0], eye_vector[:, 1])
+    tilt = np.degrees(np.arctan2(eye_vector[:, 1], eye_vector[:, 0]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 鼻尖偏移投影到眼睛连线方向和其法线方向，不受倾斜影响
+        unit = eye_vector / eye_distance[:, None]
+        offset = nose - (left + right) / 2
+        nose_x = (offset * unit).sum(axis=1) / eye_distance
+        nose_y = (offset[:, 1] * unit[:, 0] - offset[:, 0] * unit[:, 1]) / eye_distance
+    return np.stack([tilt, eye_distance, nose_x, nose_y], axis=1)
+
+
+# 选择参考帧时各几何特征归一化尺度的下限：倾角（度）、眼距（像素）、鼻尖水平和垂直偏移（眼距）
+GEOMETRY_SPREAD_FLOOR = np.array([0.1, 0.5, 0.005, 0.005])
+
+
+def select_reference_frame(stacked):
+    """选择几何特征最接近整个序列中位数的一帧作为参考，返回其索引；没有可用帧时返回 None
+
+    各特征按中位数绝对偏差（MAD）归一化后计算距离，个别异常帧不影响中位数
+    """
+    geometry = landmark_geometry(stacked)
+    valid = ~np.isnan(geometry).any(axis=1) & (geometry[:, 1] > 0)
+    if not valid.any():
+        return None
+    features = geometry[valid]
+    median = np.median(features, axis=0)
+    # 特征几乎不变时 MAD 只剩 float32 舍入误差，按下限归一化，避免误差被放大成主要距离
+    spread = np.maximum(np.median(np.abs(features - median), axis=0), GEOMETRY_SPREAD_FLOOR)
+    distances = (((features - median) / spread) ** 2).sum(axis=1)
+    return int(np.flatnonzero(valid)[np.argmin(distances)])
+
+
+class LandmarkCache:
+    """关键点缓存：按图片键保存检测结果（包括未检测到人脸的结果）
+
+    序列化为紧凑的 .npz 文件：keys 为字符串数组，points 为 (N, 8, 2) float32 数组。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def key_for_path(image_path):
+        """根据文件路径、大小和修改时间生成缓存键，文件变化后缓存自动失效"""
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return os.path.abspath(image_path)
+        return f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """返回缓存的 FaceLandmarks；未检测到人脸或未缓存时返回 None"""
+        return self._entries.get(key)
+
+    def put(self, key, landmarks):
+        self._entries[key] = None if landmarks is None else FaceLandmarks.from_dict(landmarks)
+
+    def update(self, other):
+        """合并另一个缓存的条目"""
+        self._entries.update(other._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def to_arrays(self):
+        """返回 (keys, points) 两个数组"""
+        keys = list(self._entries.keys())
+        return np.array(keys, dtype=str), stack_landmarks([self._entries[k] for k in keys])
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            raise ValueError("未指定关键点缓存文件路径")
+        keys, points = self.to_arrays()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, keys=keys, points=points)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        with np.load(path, allow_pickle=False) as data:
+            keys = data['keys']
+            points = data['points']
+        for key, landmarks in zip(keys.tolist(), unstack_landmarks(points)):
+            self._entries[key] = landmarks
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+from datetime import date as date_type
+
+from date_resolver import get_exif_date
+
+# 支持的图片扩展名（匹配时不区分大小写）
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# 清单目录（程序运行目录下），每个文件夹一个清单，按文件夹路径的哈希命名；不写入用户的照片文件夹
+MANIFEST_DIR_NAME = 'deforum_index'
+MANIFEST_VERSION = 2
+
+
+def scan_images(root, recursive=True, extensions=IMAGE_EXTENSIONS):
+    """基于 os.scandir 遍历文件夹，返回 (路径, stat) 迭代器
+
+    扩展名不区分大小写；递归时跳过以点开头的隐藏目录
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            iterator = os.scandir(directory)
+        except OSError:
+            continue
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not entry.name.startswith('.'):
+                            stack.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                        yield entry.path, entry.stat()
+                except OSError:
+                    continue
+
+
+def file_content_hash(data):
+    """计算文件内容的哈希（blake2b，16字节）"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def manifest_path_for(root, manifest_dir=None):
+    """文件夹对应的清单路径：清单目录下以文件夹绝对路径的哈希命名"""
+    manifest_dir = manifest_dir or os.path.join(os.getcwd(), MANIFEST_DIR_NAME)
+    digest = hashlib.blake2b(os.path.abspath(root).encode(), digest_size=16).hexdigest()
+    return os.path.join(manifest_dir, f"{digest}.json")
+
+
+class FolderIndex:
+    """带持久化清单的文件夹索引
+
+    清单记录每个图片的 (相对路径, 大小, 修改时间, 内容哈希, EXIF日期)。
+    扫描只读取目录项，大小和修改时间足以发现新增或变化的文件；
+    内容哈希和EXIF日期在第一次用到时才读取，并随清单保存，文件变化后重新读取。
+    """
+
+    def __init__(self, root, manifest_path=None, recursive=True):
+        self.root = os.path.abspath(root)
+        self.manifest_path = manifest_path or manifest_path_for(self.root)
+        self.recursive = recursive
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """读取已有清单，清单不存在或损坏时从空索引开始"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.entries = manifest.get('entries', {})
+
+    def save(self):
+        """写入清单；清单目录不可写时静默跳过，只保留内存中的索引"""
+        manifest = {'version': MANIFEST_VERSION, 'root': self.root, 'entries': self.entries}
+        tmp_path = f"{self.manifest_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, self.manifest_path)
+            return True
+        except OSError:
+            return False
+
+    def refresh(self):
+        """重新扫描文件夹，返回 (新增, 变化, 删除) 的相对路径列表"""
+        added, changed = [], []
+        seen = set()
+        for path, stat in scan_images(self.root, recursive=self.recursive):
+            rel_path = os.path.relpath(path, self.root)
+            seen.add(rel_path)
+            entry = self.entries.get(rel_path)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            # 哈希和EXIF日期留到用到时再读取
+            self.entries[rel_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            (changed if entry else added).append(rel_path)
+        removed = [rel_path for rel_path in self.entries if rel_path not in seen]
+        for rel_path in removed:
+            del self.entries[rel_path]
+        return added, changed, removed
+
+    def __len__(self):
+        return len(self.entries)
+
+    def paths(self):
+        """按相对路径排序的绝对路径列表"""
+        return [os.path.join(self.root, rel_path) for rel_path in sorted(self.entries)]
+
+    def signatures(self):
+        """返回 {绝对路径: (大小, 修改时间)} 字典，用于判断文件是否已写入完成"""
+        return {
+            os.path.join(self.root, rel_path): (entry['size'], entry['mtime_ns'])
+            for rel_path, entry in self.entries.items()
+        }
+
+    def content_hash(self, path):
+        """文件内容的哈希，第一次查询时读取文件计算；不在索引中或无法读取时返回 None"""
+        entry = self.entries.get(os.path.relpath(os.path.abspath(path), self.root))
+        if entry is None:
+            return None
+        if 'hash' not in entry:
+            try:
+                with open(path, 'rb') as f:
+                    entry['hash'] = file_content_hash(f.read())
+            except OSError:
+                return None
+        return entry['hash']
+
+    def exif_dates(self):
+        """返回 {绝对路径: EXIF日期} 字典，供日期表直接使用而不重复读取EXIF
+
+        尚未读取过的文件在这里读取EXIF（只解析文件头），有新读取的日期时保存清单，下次直接使用
+        """
+        dates = {}
+        read = 0
+        for rel_path, entry in self.entries.items():
+            path = os.path.join(self.root, rel_path)
+            if 'date' not in entry:
+                exif_date = get_exif_date(path)
+                entry['date'] = exif_date.isoformat() if exif_date else None
+                read += 1
+            dates[path] = date_type.fromisoformat(entry['date']) if entry['date'] else None
+        if read:
+            self.save()
+        return dates
+
+
+def index_folder(root, recursive=True, manifest_path=None):
+    """扫描文件夹并更新清单，返回 FolderIndex（只读取目录项，不读取图片内容）"""
+    index = FolderIndex(root, manifest_path=manifest_path, recursive=recursive)
+    added, changed, removed = index.refresh()
+    if added or changed or removed or not os.path.exists(index.manifest_path):
+        index.save()
+    return index
@@ -0,0 +1,114 @@
+import json
+import os
+from datetime import date as date_type
+
+import cv2
+
+from video_export import frame_hash
+
+STORE_INDEX_FILENAME = "frames.json"
+
+
+class FrameStore:
+    """对齐结果的磁盘帧库：按顺序保存对齐后的帧，并记录每帧的来源图片
+
+    index 文件记录帧的顺序、来源和被跳过的图片，进程重启后可继续追加。
+    """
+
+    def __init__(self, directory, frame_ext=".png"):
+        self.directory = directory
+        self.frames_dir = os.path.join(directory, "frames")
+        self.index_path = os.path.join(directory, STORE_INDEX_FILENAME)
+        self.frame_ext = frame_ext
+        # [{'source': 来源路径, 'file': 帧文件名, 'date': 日期字符串, 'date_iso': ISO 日期, 'hash': 帧内容哈希}]
+        self.frames = []
+        # {输入索引或来源路径: {'source': 来源路径, 'reason': 原因}}，同名的不同输入按输入索引区分
+        self.skipped = {}
+        os.makedirs(self.frames_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.frames = index.get("frames", [])
+        # 旧索引的跳过记录为 {来源路径: 原因}
+        self.skipped = {
+            key: value if isinstance(value, dict) else {"source": key, "reason": value}
+            for key, value in index.get("skipped", {}).items()
+        }
+
+    def save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"frames": self.frames, "skipped": self.skipped}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        """按序号读取帧（支持负数序号），帧只在访问时从磁盘读取"""
+        if index < 0:
+            index += len(self.frames)
+        if not 0 <= index < len(self.frames):
+            raise IndexError("帧序号超出范围")
+        return self.read_frame(index)
+
+    def __iter__(self):
+        for index in range(len(self.frames)):
+            yield self.read_frame(index)
+
+    def known_sources(self):
+        """已处理过（包括被跳过）的来源路径集合"""
+        return {frame["source"] for frame in self.frames} | {entry["source"] for entry in self.skipped.values()}
+
+    def frame_path(self, index):
+        return os.path.join(self.frames_dir, self.frames[index]["file"])
+
+    def read_frame(self, index):
+        frame = cv2.imread(self.frame_path(index))
+        if frame is None:
+            raise ValueError(f"无法读取帧文件: {self.frame_path(index)}")
+        return frame
+
+    def frame_date(self, index):
+        """帧的日期（date），没有日期时返回 None；保存文件时可按任意格式重新格式化"""
+        value = self.frames[index].get("date_iso")
+        return date_type.fromisoformat(value) if value else None
+
+    def frame_hashes(self):
+        """每帧内容的哈希列表，旧索引中缺少哈希的帧会读取帧文件补算"""
+        for i, frame in enumerate(self.frames):
+            if not frame.get("hash"):
+                frame["hash"] = frame_hash(self.read_frame(i))
+        return [frame["hash"] for frame in self.frames]
+
+    def append(self, source, image, date_str=None, date=None):
+        """追加一帧并写入磁盘，返回帧序号（调用 save() 持久化索引）
+
+        date_str 为水印中的日期字符串，date 为对应的日期（date）
+        """
+        index = len(self.frames)
+        filename = f"{index:06d}{self.frame_ext}"
+        if not cv2.imwrite(os.path.join(self.frames_dir, filename), image):
+            raise ValueError(f"无法写入帧文件: {filename}")
+        self.frames.append({
+            "source": source,
+            "file": filename,
+            "date": date_str,
+            "date_iso": date.isoformat() if date else None,
+            "hash": frame_hash(image),
+        })
+        return index
+
+    def skip(self, source, reason, input_index=None):
+        """记录被跳过的图片：提供 input_index 时按输入索引记录（上传的同名图片不会互相覆盖），否则按来源路径记录"""
+        key = str(input_index) if input_index is not None else source
+        self.skipped[key] = {"source": source, "reason": reason}
+
+    def unskip(self, source):
+        """删除来源图片的跳过记录，使其重新处理"""
+        self.skipped = {key: entry for key, entry in self.skipped.items() if entry["source"] != source}
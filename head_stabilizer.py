@@ -1,20 +1,266 @@
+import contextlib
 import cv2
+import io
 import numpy as np
-import mediapipe as mp
 import os
 import glob
+import logging
+import math
+import threading
+import time
+from PIL import Image
+from face_landmarks import FaceLandmarks, LandmarkCache, LANDMARK_INDEX, select_reference_frame, stack_landmarks
+from checkpoint import BatchCheckpoint, job_fingerprint
+from metrics import StageMetrics, format_stage_totals
+
+logger = logging.getLogger(__name__)
+
+# 裁剪区域需要额外保留的边距（覆盖插值核的采样范围）
+WARP_ROI_MARGIN = 5
+
+# 变换插值质量档位：(插值方式, 预缩小阈值)
+# 缩放比例低于预缩小阈值时先用 INTER_AREA 缩小源区域，避免混叠
+WARP_QUALITY_TIERS = {
+    'fast': (cv2.INTER_LINEAR, 0.0),       # 预览和草稿
+    'standard': (cv2.INTER_CUBIC, 0.5),    # 默认
+    'high': (cv2.INTER_LANCZOS4, 1.0),     # 最终导出
+}
+
+# 关键点检测阶梯：步骤名 -> (检测输入, FaceMesh 置信度阈值)
+# 检测输入：full 原图，proxy 缩小的代理图，roi 人脸检测器找到的原分辨率人脸区域，
+# roi_or_proxy 有人脸区域时用人脸区域否则用代理图，upscaled_roi 放大后的人脸区域
+DETECTION_STEPS = {
+    'full': ('full', 0.7),
+    'proxy': ('proxy', 0.7),
+    'roi': ('roi', 0.7),
+    'low_threshold': ('roi_or_proxy', 0.3),
+    'upscaled_roi': ('upscaled_roi', 0.3),
+}
+DEFAULT_DETECTION_LADDER = ('proxy', 'roi', 'low_threshold', 'upscaled_roi')
+
+# 代理图的最长边；FaceMesh 内部以 192x192 处理人脸区域，代理图中人脸足够大时精度不受影响
+DETECTION_PROXY_SIDE = 1280
+# 人脸检测器的置信度阈值，以及人脸框向四周扩展的比例（FaceMesh 需要人脸周围的上下文）
+DETECTION_ROI_CONFIDENCE = 0.5
+DETECTION_ROI_MARGIN = 0.5
+# 人脸区域放大后的最长边
+DETECTION_UPSCALE_SIDE = 640
+# 自动参考帧第一遍可用的缩小解码倍数（JPEG 直接按 DCT 缩小解码）
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# 参考图片路径为该值时，从批次的关键点中自动选择参考帧
+AUTO_REFERENCE = 'auto'
+
+# 跳过原因代码：跳过原因记录为 [原因代码, 详情]，界面按当前语言显示
+SKIP_READ_ERROR = "image_read_error"
+SKIP_HEAD_TILT = "head_tilt_skipped"
+SKIP_FAILED = "processing_failed"
+
+# 进度说明代码：批处理报告的当前步骤为 [代码, 参数...] 时界面按当前语言格式化
+PROGRESS_DEDUP = "dedup_progress"
+PROGRESS_AUTO_REFERENCE = "auto_reference_progress"
+
+# MediaPipe 在第一次检测时才导入，模型按参数缓存并在进程内共享
+# _models_lock 只保护 _models 的读写，导入和构建模型都在锁外进行，不会阻塞其他线程
+_mediapipe = None
+_models = {}
+_models_lock = threading.Lock()
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+class _SharedModel:
+    """进程内共享的 MediaPipe 模型，process() 加锁以便在多个线程中使用"""
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+
+    def process(self, rgb_image):
+        with self.lock:
+            return self.model.process(rgb_image)
+
+
+def _load_mediapipe():
+    global _mediapipe
+    if _mediapipe is None:
+        import mediapipe
+        _mediapipe = mediapipe
+    return _mediapipe
+
+
+def _get_model(key, build):
+    """按 key 获取共享模型，不存在时在锁外调用 build() 构建；多个线程同时构建时只保留先插入的一个"""
+    with _models_lock:
+        model = _models.get(key)
+    if model is not None:
+        return model
+    built = _SharedModel(build(_load_mediapipe()))
+    with _models_lock:
+        model = _models.setdefault(key, built)
+    if model is not built and hasattr(built.model, 'close'):
+        built.model.close()
+    return model
+
+
+def get_face_mesh(min_detection_confidence):
+    """获取（第一次调用时构建）静态图片模式的 FaceMesh 模型"""
+    return _get_model(('face_mesh', min_detection_confidence), lambda mp: mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=True,
+        max_num_faces=1,
+        refine_landmarks=True,  # 启用精细化标记点
+        min_detection_confidence=min_detection_confidence,
+        min_tracking_confidence=0.5
+    ))
+
+
+def get_face_detection(min_detection_confidence=0.7):
+    """获取（第一次调用时构建）FaceDetection 模型"""
+    return _get_model(('face_detection', min_detection_confidence), lambda mp: mp.solutions.face_detection.FaceDetection(
+        min_detection_confidence=min_detection_confidence
+    ))
+
+
+def warm_up_models(background=True):
+    """预先导入 MediaPipe 并构建关键点检测模型
+
+    background=True 时在后台线程中进行，界面无需等待；重复调用不会重复预热，也不会等待预热完成
+    """
+    global _warm_up_thread
+
+    def build():
+        try:
+            get_face_mesh(0.7)
+        except Exception as e:
+            logger.warning("预热检测模型失败: %s", e)
+
+    if not background:
+        build()
+        return None
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=build, name="mediapipe-warm-up", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
+
+class _DetectionInputs:
+    """一张图片在检测阶梯中共用的中间图像：每种输入只在第一次用到时生成一次
+
+    view() 返回 (RGB 图像, (x0, y0, 区域宽, 区域高))，区域为该输入在原图中对应的范围；
+    输入不可用（例如人脸检测器没有找到人脸）时返回 None
+    """
+
+    def __init__(self, image, proxy_side=DETECTION_PROXY_SIDE):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.proxy_side = proxy_side
+        self._views = {}
+
+    def view(self, name):
+        if name not in self._views:
+            self._views[name] = getattr(self, f'_build_{name}')()
+        return self._views[name]
+
+    def _build_full(self):
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB), (0, 0, self.width, self.height)
+
+    def _build_proxy(self):
+        scale = self.proxy_side / max(self.width, self.height)
+        if scale >= 1:
+            # 原图不大于代理尺寸，代理图即原图
+            return self.view('full')
+        size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+        small = cv2.resize(self.image, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2RGB), (0, 0, self.width, self.height)
+
+    def _build_roi(self):
+        # 人脸检测器在代理图上运行，只裁剪并转换人脸区域
+        results = get_face_detection(DETECTION_ROI_CONFIDENCE).process(self.view('proxy')[0])
+        if not results.detections:
+            return None
+        box = results.detections[0].location_data.relative_bounding_box
+        margin_x, margin_y = box.width * DETECTION_ROI_MARGIN, box.height * DETECTION_ROI_MARGIN
+        x0 = max(0, int((box.xmin - margin_x) * self.width))
+        y0 = max(0, int((box.ymin - margin_y) * self.height))
+        x1 = min(self.width, math.ceil((box.xmin + box.width + margin_x) * self.width))
+        y1 = min(self.height, math.ceil((box.ymin + box.height + margin_y) * self.height))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        rgb = cv2.cvtColor(self.image[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        return rgb, (x0, y0, x1 - x0, y1 - y0)
+
+    def _build_roi_or_proxy(self):
+        return self.view('roi') or self.view('proxy')
+
+    def _build_upscaled_roi(self):
+        roi = self.view('roi')
+        if roi is None:
+            return None
+        rgb, region = roi
+        scale = DETECTION_UPSCALE_SIDE / max(rgb.shape[:2])
+        if scale <= 1:
+            # 人脸区域已经足够大，放大没有意义
+            return None
+        size = (round(rgb.shape[1] * scale), round(rgb.shape[0] * scale))
+        return cv2.resize(rgb, size, interpolation=cv2.INTER_CUBIC), region
+
+
+def read_source(source):
+    """读取输入图片，source 为文件路径或图片的二进制数据，读取失败时返回 None"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(source)
+
+
+def read_image_reduced(source, min_side=DETECTION_PROXY_SIDE):
+    """按最大的倍数缩小解码图片，且最长边不小于 min_side，返回 (图像, 换算回原图坐标的倍数)
+
+    source 为文件路径或图片的二进制数据，读取失败时图像为 None。
+    检测第一步本来就把图片缩小到代理图尺寸，min_side 取代理图最长边时检测结果基本不变
+    """
+    is_data = isinstance(source, (bytes, bytearray, memoryview))
+    try:
+        # 只读取文件头获取尺寸，不解码像素
+        with Image.open(io.BytesIO(source) if is_data else source) as image:
+            full_side = max(image.size)
+    except (OSError, ValueError):
+        full_side = 0
+    factor, flags = 1, cv2.IMREAD_COLOR
+    for candidate, candidate_flags in REDUCED_DECODE_FLAGS:
+        if full_side // candidate >= min_side:
+            factor, flags = candidate, candidate_flags
+            break
+    if is_data:
+        img = cv2.imdecode(np.frombuffer(source, np.uint8), flags)
+    else:
+        img = cv2.imread(source, flags)
+    return img, float(factor)
+
 
 def euclidean_distance(p1, p2):
     """计算两点间的欧几里得距离"""
     return np.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
 
+def _reflect_range(lo, hi, size):
+    """计算采样区间 [lo, hi) 在 BORDER_REFLECT_101 下实际用到的源像素区间"""
+    if lo < -(size - 1) or hi > 2 * size - 1:
+        # 需要多次镜像，直接使用整幅图像
+        return 0, size
+    start = max(lo, 0)
+    end = min(hi, size)
+    if lo < 0:
+        end = max(end, min(size, -lo + 1))
+    if hi > size:
+        start = min(start, max(0, 2 * (size - 1) - (hi - 1)))
+    return int(start), int(end)
+
 class HeadStabilizer:
-    def __init__(self, output_size=(512, 512), face_scale=1.5, preserve_background=True, force_reference_size=True, tilt_threshold=5.0):
-        # 初始化面部检测模型
-        self.mp_face = mp.solutions.face_mesh
-        self.face = self.mp_face.FaceMesh(static_image_mode=True, max_num_faces=1, min_detection_confidence=0.5)
-        self.mp_face_detection = mp.solutions.face_detection
-        self.face_detection = self.mp_face_detection.FaceDetection(min_detection_confidence=0.7)
+    def __init__(self, output_size=(512, 512), face_scale=1.5, preserve_background=True, force_reference_size=True, tilt_threshold=5.0, warp_quality='standard', detection_ladder=DEFAULT_DETECTION_LADDER):
+        # 检测模型在第一次检测时才构建（见 get_face_mesh / get_face_detection）
         
         # 设置输出尺寸和人脸缩放比例
         self.output_size = output_size
@@ -36,70 +282,70 @@ class HeadStabilizer:
         self.alignment_tolerance = 2.0  # 对齐容差（像素）
         self.max_iterations = 3  # 最大优化迭代次数
         self.quality_threshold = 0.95  # 对齐质量阈值
-
-    def _get_stable_landmarks(self, image):
-        """获取最稳定的关键点组合，专注于眼睛和鼻子的精确定位"""
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # 使用更高精度的检测
-        face_mesh = self.mp_face.FaceMesh(
-            static_image_mode=True, 
-            max_num_faces=1, 
-            refine_landmarks=True,  # 启用精细化标记点
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.5
-        )
         
-        results = face_mesh.process(rgb_image)
-        if not results.multi_face_landmarks:
-            # 降低阈值重试
-            face_mesh = self.mp_face.FaceMesh(
-                static_image_mode=True, 
-                max_num_faces=1, 
-                refine_landmarks=True,
-                min_detection_confidence=0.3
-            )
-            results = face_mesh.process(rgb_image)
-            if not results.multi_face_landmarks:
-                return None
-
-        landmarks = results.multi_face_landmarks[0].landmark
-        h, w = image.shape[:2]
+        # 先裁剪后变换：只对映射到输出的源区域做 warpAffine
+        self.crop_then_warp = True
+        self.warp_quality = warp_quality  # 插值质量档位，见 WARP_QUALITY_TIERS
         
-        # 选择最稳定的关键点 - 只使用眼角和鼻尖
-        # 这些点在不同表情下最稳定
-        stable_points = {
-            # 眼角（最稳定的点）
-            'left_eye_outer': (int(landmarks[33].x*w), int(landmarks[33].y*h)),    # 左眼外角
-            'left_eye_inner': (int(landmarks[133].x*w), int(landmarks[133].y*h)),  # 左眼内角
-            'right_eye_inner': (int(landmarks[362].x*w), int(landmarks[362].y*h)), # 右眼内角  
-            'right_eye_outer': (int(landmarks[263].x*w), int(landmarks[263].y*h)), # 右眼外角
-            
-            # 鼻尖（第二稳定）
-            'nose_tip': (int(landmarks[4].x*w), int(landmarks[4].y*h)),            # 鼻尖
-        }
+        # 关键点缓存（按图片键保存，避免重复检测）
+        self.landmark_cache = LandmarkCache()
         
-        # 计算眼睛中心（通过内外角计算，更精确）
-        left_eye_center = (
-            (stable_points['left_eye_outer'][0] + stable_points['left_eye_inner'][0]) // 2,
-            (stable_points['left_eye_outer'][1] + stable_points['left_eye_inner'][1]) // 2
-        )
-        right_eye_center = (
-            (stable_points['right_eye_inner'][0] + stable_points['right_eye_outer'][0]) // 2,
-            (stable_points['right_eye_inner'][1] + stable_points['right_eye_outer'][1]) // 2
-        )
+        # 关键点检测阶梯（见 DETECTION_STEPS），依次尝试直到检测到人脸
+        unknown = [step for step in detection_ladder if step not in DETECTION_STEPS]
+        if unknown:
+            raise ValueError(f"未知的检测步骤: {', '.join(unknown)}")
+        self.detection_ladder = tuple(detection_ladder)
+        self.detection_proxy_side = DETECTION_PROXY_SIDE
+        self.last_detection_step = None  # 最近一次检测成功的步骤，未检测到时为 None
+        self.auto_reference_source = None  # 最近一次批处理自动选择的参考帧名称
         
-        stable_points['left_eye'] = left_eye_center
-        stable_points['right_eye'] = right_eye_center
+        # 各阶段耗时和事件计数（检测、低阈值重试、变换、仿射、水印）
+        self.metrics = StageMetrics()
+
+    def _get_stable_landmarks(self, image):
+        """获取最稳定的关键点组合，专注于眼睛和鼻子的精确定位
+
+        按检测阶梯依次尝试（默认：代理图 → 人脸区域 → 低阈值 → 放大的人脸区域），
+        各步骤共用同一组中间图像，相同的输入和阈值不会重复检测；
+        成功的步骤记录在 last_detection_step 和 detect_step_<步骤> 计数中
+        """
+        inputs = _DetectionInputs(image, self.detection_proxy_side)
+        self.last_detection_step = None
+        tried = set()
         
-        # 计算眼睛中点（面部中心）
-        eye_center = (
-            (left_eye_center[0] + right_eye_center[0]) // 2,
-            (left_eye_center[1] + right_eye_center[1]) // 2
-        )
-        stable_points['eye_center'] = eye_center
+        for step in self.detection_ladder:
+            view_name, confidence = DETECTION_STEPS[step]
+            # 第一次尝试计入 detect，之后的步骤计入 detect_retry
+            stage = 'detect_retry' if tried else 'detect'
+            with self.metrics.time(stage):
+                view = inputs.view(view_name)
+                if view is None or (id(view[0]), confidence) in tried:
+                    continue
+                if tried:
+                    self.metrics.increment('detect_retry')
+                tried.add((id(view[0]), confidence))
+                rgb, (x0, y0, region_w, region_h) = view
+                results = get_face_mesh(confidence).process(rgb)
+            if results.multi_face_landmarks:
+                self.last_detection_step = step
+                self.metrics.increment(f'detect_step_{step}')
+                # 选择最稳定的关键点 - 只使用眼角和鼻尖（这些点在不同表情下最稳定），
+                # 眼睛中心和双眼中点由眼角推导
+                landmarks = results.multi_face_landmarks[0].landmark
+                return FaceLandmarks.from_mesh(landmarks, region_w, region_h, offset=(x0, y0))
         
-        return stable_points
+        self.metrics.increment('detect_miss')
+        return None
+
+    def get_landmarks(self, image, cache_key=None):
+        """获取关键点，提供 cache_key 时优先使用缓存的检测结果"""
+        if cache_key is not None and cache_key in self.landmark_cache:
+            self.metrics.increment('landmark_cache_hit')
+            return self.landmark_cache.get(cache_key)
+        landmarks = self._get_stable_landmarks(image)
+        if cache_key is not None:
+            self.landmark_cache.put(cache_key, landmarks)
+        return landmarks
 
     def _calculate_similarity_transform(self, src_points, dst_points):
         """计算相似变换矩阵（只包含旋转、缩放、平移，无拉伸）"""
@@ -150,9 +396,9 @@ class HeadStabilizer:
             return M
             
         # 使用鼻尖进行验证和微调
-        src_nose = np.array([src_landmarks['nose_tip'][0], src_landmarks['nose_tip'][1], 1])
-        transformed_nose = M @ src_nose
-        dst_nose = np.array(dst_landmarks['nose_tip'])
+        src_nose = FaceLandmarks.from_dict(src_landmarks).point('nose_tip')
+        transformed_nose = M[:, :2] @ src_nose + M[:, 2]
+        dst_nose = FaceLandmarks.from_dict(dst_landmarks).point('nose_tip')
         
         # 计算鼻尖的对齐误差
         nose_error = euclidean_distance(transformed_nose[:2], dst_nose)
@@ -177,19 +423,16 @@ class HeadStabilizer:
         if M is None:
             return 0.0
             
-        # 计算关键点的对齐误差
-        errors = []
+        # 计算关键点的对齐误差（一次矩阵运算完成所有点的变换）
         key_points = ['left_eye', 'right_eye', 'nose_tip']
+        rows = [LANDMARK_INDEX[name] for name in key_points]
+        src_points = FaceLandmarks.from_dict(src_landmarks).points[rows]
+        dst_points = FaceLandmarks.from_dict(dst_landmarks).points[rows]
+        transformed = src_points @ M[:, :2].T + M[:, 2]
+        errors = np.linalg.norm(transformed - dst_points, axis=1)
+        errors = errors[~np.isnan(errors)]
         
-        for point_name in key_points:
-            if point_name in src_landmarks and point_name in dst_landmarks:
-                src_point = np.array([src_landmarks[point_name][0], src_landmarks[point_name][1], 1])
-                transformed_point = M @ src_point
-                dst_point = np.array(dst_landmarks[point_name])
-                error = euclidean_distance(transformed_point[:2], dst_point)
-                errors.append(error)
-        
-        if not errors:
+        if errors.size == 0:
             return 0.0
             
         # 根据输出尺寸动态调整误差阈值
@@ -203,15 +446,13 @@ class HeadStabilizer:
         avg_error = np.mean(errors)
         quality_score = max(0, (max_acceptable_error - avg_error) / max_acceptable_error)
         
-        # 添加详细的调试信息（仅在调试模式下）
-        if self.debug:
-            print(f"  质量评估详情:")
-            print(f"    平均误差: {avg_error:.2f} 像素")
-            print(f"    最大可接受误差: {max_acceptable_error:.2f} 像素")
-            print(f"    质量分数: {quality_score:.3f}")
-            for i, (point_name, error) in enumerate(zip(key_points, errors)):
-                if i < len(errors):
-                    print(f"    {point_name}: {error:.2f} 像素")
+        # 详细的质量评估信息（仅在启用 DEBUG 日志时生成）
+        if logger.isEnabledFor(logging.DEBUG):
+            point_errors = ", ".join(f"{name}: {error:.2f}" for name, error in zip(key_points, errors))
+            logger.debug(
+                "质量评估: 平均误差 %.2f 像素, 最大可接受误差 %.2f 像素, 质量分数 %.3f (%s)",
+                avg_error, max_acceptable_error, quality_score, point_errors
+            )
         
         return quality_score
 
@@ -243,7 +484,7 @@ class HeadStabilizer:
         right_eye_inner_x = right_eye_x - int(0.03 * output_w)
         right_eye_outer_x = right_eye_x + int(0.05 * output_w)
         
-        self.ref_eyes = {
+        self.ref_eyes = FaceLandmarks.from_dict({
             'left_eye': (left_eye_x, eye_y),
             'right_eye': (right_eye_x, eye_y),
             'nose_tip': (nose_tip_x, nose_tip_y),
@@ -252,44 +493,82 @@ class HeadStabilizer:
             'left_eye_inner': (left_eye_inner_x, eye_y),
             'right_eye_inner': (right_eye_inner_x, eye_y),
             'right_eye_outer': (right_eye_outer_x, eye_y)
-        }
-        print(f"参考人脸关键点已设置")
+        })
+        logger.debug("参考人脸关键点已设置")
 
     def set_reference_from_image(self, ref_image):
         """从参考图片中提取人脸特征作为对齐基准（改进版）"""
-        # 保存参考图像用于显示
-        self.ref_image = ref_image.copy()
-        self.ref_image_size = ref_image.shape[:2]
-        
-        # 如果强制使用参考图片尺寸，更新输出尺寸
-        if self.force_reference_size:
-            self.output_size = (ref_image.shape[1], ref_image.shape[0])
-            print(f"已更新输出尺寸为参考图片尺寸: {self.output_size}")
-        
         # 获取参考图片中的稳定关键点
         ref_landmarks = self._get_stable_landmarks(ref_image)
         if ref_landmarks is None:
             raise ValueError("参考图片中未检测到面部关键点，请选择清晰的正面人像照片")
+        return self.set_reference_from_landmarks(ref_landmarks, ref_image)
+
+    def set_reference_from_landmarks(self, ref_landmarks, ref_image=None):
+        """使用已检测的关键点作为对齐基准，无需再次检测
+
+        提供 ref_image 时与 set_reference_from_image 相同：保存参考图像，强制使用参考尺寸时更新输出尺寸
+        """
+        if ref_image is not None:
+            # 保存参考图像用于显示
+            self.ref_image = ref_image.copy()
+            self.ref_image_size = ref_image.shape[:2]
+            
+            # 如果强制使用参考图片尺寸，更新输出尺寸
+            if self.force_reference_size:
+                self.output_size = (ref_image.shape[1], ref_image.shape[0])
+                logger.debug("已更新输出尺寸为参考图片尺寸: %s", self.output_size)
         
         # 保存参考图片中的面部关键点
-        self.ref_eyes = ref_landmarks
-        print(f"从参考图片中提取的稳定面部特征已设置为对齐基准")
+        self.ref_eyes = FaceLandmarks.from_dict(ref_landmarks)
+        logger.debug("从参考图片中提取的稳定面部特征已设置为对齐基准")
         
-        return ref_landmarks
+        return self.ref_eyes
 
-    def align_and_crop_face(self, image, crop_size=None, show_landmarks=False):
-        """改进的对齐算法 - 使用相似变换确保无拉伸变形"""
-        # 确定输出尺寸
-        if crop_size is None:
-            if self.force_reference_size and self.ref_image_size is not None:
-                crop_size = (self.ref_image.shape[1], self.ref_image.shape[0])
-            else:
-                crop_size = self.output_size
+    def choose_reference(self, landmarks_list):
+        """自动参考帧：在一批关键点中选择几何形态（倾角、眼距、鼻尖偏移）最接近中位数的一帧
+
+        返回该帧在列表中的索引，没有检测到人脸的帧不参与选择；全部未检测到时返回 None
+        """
+        return select_reference_frame(stack_landmarks(landmarks_list))
+
+    def select_auto_reference(self, items, read_image, prefilter=None, should_stop=None, read_preview=None):
+        """自动参考帧的第一遍：获取每张图片的关键点（优先使用缓存）并选择参考帧
+
+        items 为 [(索引, 关键点缓存键)]，read_image(索引) 读取原图（失败时返回 None）；
+        提供 read_preview(索引) 时，未缓存的图片改用它返回的 (缩小的图像, 缩放倍数) 检测，关键点换算回原图坐标。
+        选中的帧设为对齐基准（重新读取该帧的原图作为参考图像）。
+        返回 (参考帧索引或 None, {索引: 关键点})，对齐时直接使用这些关键点，不再重复检测
+        """
+        detected = {}
+        for index, cache_key in items:
+            if should_stop is not None and should_stop():
+                break
+            if cache_key is not None and cache_key in self.landmark_cache:
+                detected[index] = self.get_landmarks(None, cache_key=cache_key)
+                continue
+            img, scale = read_preview(index) if read_preview is not None else (read_image(index), 1.0)
+            if img is None or (prefilter is not None and prefilter.evaluate(img) is not None):
+                continue
+            landmarks = self._get_stable_landmarks(img)
+            if landmarks is not None and scale != 1.0:
+                landmarks = FaceLandmarks(landmarks.points * scale)
+            if cache_key is not None:
+                self.landmark_cache.put(cache_key, landmarks)
+            detected[index] = landmarks
         
-        # 获取稳定的人脸关键点
-        face_landmarks = self._get_stable_landmarks(image)
-        if face_landmarks is None:
-            raise ValueError("未检测到面部关键点，请确保图片中有清晰的人脸")
+        indices = [index for index, landmarks in detected.items() if landmarks is not None]
+        chosen = self.choose_reference([detected[index] for index in indices])
+        if chosen is None:
+            logger.warning("没有检测到人脸，无法自动选择参考帧")
+            return None, detected
+        ref_index = indices[chosen]
+        self.set_reference_from_landmarks(detected[ref_index], read_image(ref_index))
+        return ref_index, detected
+
+    def compute_transform(self, face_landmarks):
+        """计算将关键点对齐到参考位置的相似变换矩阵"""
+        face_landmarks = FaceLandmarks.from_dict(face_landmarks)
         
         # 如果还没有参考关键点，设置默认的
         if self.ref_eyes is None:
@@ -297,13 +576,14 @@ class HeadStabilizer:
         
         # 准备用于相似变换的关键点对
         # 使用最稳定的眼睛中心点对
+        ref_landmarks = FaceLandmarks.from_dict(self.ref_eyes)
         src_points = [
-            face_landmarks['left_eye'],
-            face_landmarks['right_eye']
+            face_landmarks.point('left_eye'),
+            face_landmarks.point('right_eye')
         ]
         dst_points = [
-            self.ref_eyes['left_eye'],
-            self.ref_eyes['right_eye']
+            ref_landmarks.point('left_eye'),
+            ref_landmarks.point('right_eye')
         ]
         
         # 计算初始相似变换矩阵
@@ -313,30 +593,56 @@ class HeadStabilizer:
             raise ValueError("无法计算变换矩阵")
         
         # 使用额外点进行优化
-        M = self._refine_transform_with_additional_points(M, face_landmarks, self.ref_eyes)
+        M = self._refine_transform_with_additional_points(M, face_landmarks, ref_landmarks)
         
         # 验证对齐质量
-        quality_score = self._validate_alignment_quality(M, face_landmarks, self.ref_eyes)
+        quality_score = self._validate_alignment_quality(M, face_landmarks, ref_landmarks)
         
         if quality_score < self.quality_threshold:
-            if self.debug:
-                print(f"提示：对齐质量为 {quality_score:.2f}，建议检查图片质量和光照条件")
-            # 非调试模式下不显示警告，避免干扰用户
+            self.metrics.increment('low_alignment_quality')
+            logger.debug("提示：对齐质量为 %.2f，建议检查图片质量和光照条件", quality_score)
+        
+        return M
+
+    def align_and_crop_face(self, image, crop_size=None, show_landmarks=False, landmarks=None, quality=None, max_output_side=None):
+        """改进的对齐算法 - 使用相似变换确保无拉伸变形
+
+        landmarks 可传入已检测的关键点，避免重复检测；
+        quality 为插值质量档位（fast/standard/high），默认使用 self.warp_quality；
+        max_output_side 限制输出的最长边（用于草稿预览），变换会等比缩小
+        """
+        # 确定输出尺寸
+        if crop_size is None:
+            if self.force_reference_size and self.ref_image_size is not None:
+                crop_size = (self.ref_image.shape[1], self.ref_image.shape[0])
+            else:
+                crop_size = self.output_size
+        
+        # 获取稳定的人脸关键点
+        face_landmarks = landmarks if landmarks is not None else self._get_stable_landmarks(image)
+        if face_landmarks is None:
+            raise ValueError("未检测到面部关键点，请确保图片中有清晰的人脸")
+        face_landmarks = FaceLandmarks.from_dict(face_landmarks)
+        
+        # 计算相似变换矩阵（含额外点优化和质量检查）
+        with self.metrics.time('transform'):
+            M = self.compute_transform(face_landmarks)
         
         # 应用变换 - 使用高质量插值
         if self.preserve_background and not self.force_reference_size:
             h, w = image.shape[:2]
-            aligned = cv2.warpAffine(
-                image, M, (w, h), 
-                flags=cv2.INTER_CUBIC,  # 使用立方插值获得更好质量
-                borderMode=cv2.BORDER_REFLECT_101  # 使用镜像边界减少伪影
-            )
+            dsize = (w, h)
         else:
-            aligned = cv2.warpAffine(
-                image, M, (crop_size[0], crop_size[1]), 
-                flags=cv2.INTER_CUBIC,
-                borderMode=cv2.BORDER_REFLECT_101
-            )
+            dsize = (crop_size[0], crop_size[1])
+        
+        # 限制输出尺寸时，将变换整体缩放到较小的画布上
+        if max_output_side and max(dsize) > max_output_side:
+            output_scale = max_output_side / max(dsize)
+            M = M * output_scale
+            dsize = (max(1, int(round(dsize[0] * output_scale))), max(1, int(round(dsize[1] * output_scale))))
+        
+        with self.metrics.time('warp'):
+            aligned = self._warp_to_output(image, M, dsize, quality=quality)
         
         # 调试模式
         if show_landmarks or self.debug:
@@ -345,9 +651,57 @@ class HeadStabilizer:
         
         return aligned
 
+    def _warp_to_output(self, image, M, dsize, quality=None):
+        """先裁剪后变换：将输出区域逆映射回源图像，只对该区域做 warpAffine
+
+        缩放比例低于质量档位的预缩小阈值时先用 INTER_AREA 预缩小裁剪区域，减少混叠
+        """
+        quality = quality or self.warp_quality
+        if quality not in WARP_QUALITY_TIERS:
+            raise ValueError(f"未知的插值质量档位: {quality}")
+        interpolation, prefilter_scale = WARP_QUALITY_TIERS[quality]
+        
+        if not self.crop_then_warp:
+            return cv2.warpAffine(image, M, dsize, flags=interpolation, borderMode=cv2.BORDER_REFLECT_101)
+        
+        h, w = image.shape[:2]
+        out_w, out_h = dsize
+        M = M.astype(np.float64)
+        A = M[:, :2]
+        
+        # 输出四角逆映射到源图像，得到需要采样的源区域
+        M_inv = cv2.invertAffineTransform(M)
+        corners = np.array([[0, 0], [out_w - 1, 0], [0, out_h - 1], [out_w - 1, out_h - 1]], dtype=np.float64)
+        src_corners = corners @ M_inv[:, :2].T + M_inv[:, 2]
+        lo = np.floor(src_corners.min(axis=0)) - WARP_ROI_MARGIN
+        hi = np.ceil(src_corners.max(axis=0)) + WARP_ROI_MARGIN + 1
+        x0, x1 = _reflect_range(int(lo[0]), int(hi[0]), w)
+        y0, y1 = _reflect_range(int(lo[1]), int(hi[1]), h)
+        
+        scale = np.sqrt(abs(np.linalg.det(A)))
+        prefilter = scale < prefilter_scale
+        if (x0, y0, x1, y1) == (0, 0, w, h) and not prefilter:
+            return cv2.warpAffine(image, M, dsize, flags=interpolation, borderMode=cv2.BORDER_REFLECT_101)
+        
+        roi = image[y0:y1, x0:x1]
+        offset = np.array([x0, y0], dtype=np.float64)
+        if prefilter:
+            # 预缩小裁剪区域，使剩余变换的缩放比例接近1
+            roi_h, roi_w = roi.shape[:2]
+            new_w = max(1, int(round(roi_w * scale)))
+            new_h = max(1, int(round(roi_h * scale)))
+            roi = cv2.resize(roi, (new_w, new_h), interpolation=cv2.INTER_AREA)
+            fx, fy = new_w / roi_w, new_h / roi_h
+            # 缩小后像素 p 对应裁剪区域坐标 (p + 0.5) / f - 0.5
+            offset = offset + np.array([0.5 / fx - 0.5, 0.5 / fy - 0.5])
+            A = A @ np.diag([1.0 / fx, 1.0 / fy])
+        
+        M_roi = np.hstack([A, (M[:, :2] @ offset + M[:, 2])[:, None]])
+        return cv2.warpAffine(roi, M_roi, dsize, flags=interpolation, borderMode=cv2.BORDER_REFLECT_101)
+
     def _get_face_bbox(self, image):
         """获取人脸边界框"""
-        results = self.face_detection.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        results = get_face_detection(0.7).process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
         if not results.detections:
             return None
         
@@ -391,21 +745,25 @@ class HeadStabilizer:
         
         return debug_img
 
-    def check_head_tilt(self, image):
-        """检查头部倾斜度，返回是否端正和倾斜角度"""
+    def check_head_tilt(self, image, landmarks=None):
+        """检查头部倾斜度，返回是否端正和倾斜角度
+
+        landmarks 可传入已检测的关键点，避免重复检测
+        """
         # 获取稳定的面部关键点
-        face_landmarks = self._get_stable_landmarks(image)
+        face_landmarks = landmarks if landmarks is not None else self._get_stable_landmarks(image)
         if face_landmarks is None:
             return False, None, "未检测到面部关键点"
+        face_landmarks = FaceLandmarks.from_dict(face_landmarks)
         
         # 计算眼睛连线与水平线的夹角
-        left_eye = face_landmarks['left_eye']
-        right_eye = face_landmarks['right_eye']
+        left_eye = face_landmarks.point('left_eye')
+        right_eye = face_landmarks.point('right_eye')
         
         # 计算双眼连线角度
         dx = right_eye[0] - left_eye[0]
         dy = right_eye[1] - left_eye[1]
-        horizontal_angle = np.degrees(np.arctan2(dy, dx))
+        horizontal_angle = float(np.degrees(np.arctan2(dy, dx)))
         
         # 判断是否倾斜
         is_tilted = abs(horizontal_angle) > self.tilt_threshold
@@ -421,61 +779,278 @@ class HeadStabilizer:
         
         return not is_tilted, tilt_info, reason
 
-    def process_batch(self, image_paths, reference_image_path=None, eye_distance_percent=30, filter_tilted=True):
-        """批量处理多张图片，可以指定参考图片路径"""
-        # 如果提供了参考图片路径，则从参考图片中设置基准
-        if reference_image_path and os.path.exists(reference_image_path):
+    def process_batch(self, image_paths, reference_image_path=None, eye_distance_percent=30, filter_tilted=True,
+                      warp_quality=None, max_output_side=None, checkpoint_dir=None, prefilter=None, dedup=None,
+                      checkpoint=None, sink=None, progress=None, should_stop=None):
+        """批量处理多张图片，可以指定参考图片路径和插值质量档位
+
+        image_paths 中每一项为图片路径，或 (名称, 路径或二进制数据, 关键点缓存键)（如上传的图片）；
+        reference_image_path 为 AUTO_REFERENCE 时从批次的关键点中自动选择参考帧，
+        与 eye_distance_percent 都为 None 时沿用稳定器当前的参考基准。
+        提供 prefilter（FramePrefilter）时，未通过预筛选的图片在关键点检测前跳过；
+        提供 dedup（DuplicatePruner）时，近似重复的照片每簇只处理最清晰的一张。
+        跳过原因统一为 [原因代码, 详情]，见 SKIP_* 和预筛选、查重的原因代码。
+
+        指定 checkpoint_dir（或直接提供 checkpoint）时定期记录断点（已完成的图片、关键点和输出文件），
+        同一任务重新运行时跳过已完成的图片，从中断处继续；整批完成、未中止且没有失败时删除断点。
+
+        结果交给 sink（接口见 BatchResults），progress(已完成数, 当前步骤) 报告进度，
+        当前步骤为图片名称或 [进度代码, 参数...]；should_stop() 返回 True 时在下一张图片前停止。
+        未提供 sink 时返回 (对齐结果, 成功的图片, [调试图像,] 跳过的图片及原因)，否则返回 None
+        """
+        auto_reference = reference_image_path == AUTO_REFERENCE
+        if auto_reference:
+            # 先使用默认基准，检测完所有关键点后再选择参考帧
+            if eye_distance_percent is not None:
+                self.set_reference_eyes_position(eye_distance_percent)
+        elif reference_image_path and os.path.exists(reference_image_path):
             try:
                 ref_img = cv2.imread(reference_image_path)
                 if ref_img is not None:
                     self.set_reference_from_image(ref_img)
-                    print(f"已使用参考图片: {reference_image_path}")
+                    logger.info("已使用参考图片: %s", reference_image_path)
                 else:
-                    print(f"无法读取参考图片: {reference_image_path}")
-                    self.set_reference_eyes_position(eye_distance_percent)
+                    logger.warning("无法读取参考图片: %s", reference_image_path)
+                    self.set_reference_eyes_position(eye_distance_percent or 30)
             except Exception as e:
-                print(f"使用参考图片失败: {e}")
-                self.set_reference_eyes_position(eye_distance_percent)
-        else:
-            print(f"警告：未提供参考图片，使用眼睛间距百分比: {eye_distance_percent}%")
+                logger.warning("使用参考图片失败: %s", e)
+                self.set_reference_eyes_position(eye_distance_percent or 30)
+        elif eye_distance_percent is not None:
+            logger.info("未提供参考图片，使用眼睛间距百分比: %s%%", eye_distance_percent)
             self.set_reference_eyes_position(eye_distance_percent)
         
-        aligned_images = []
-        successful_images = []
-        debug_images = []
-        skipped_images = []  # 记录被跳过的图片及原因
+        sources = [
+            item if isinstance(item, (tuple, list)) else (item, item, LandmarkCache.key_for_path(item))
+            for item in image_paths
+        ]
+        if checkpoint is None and checkpoint_dir:
+            settings = {
+                'reference': LandmarkCache.key_for_path(reference_image_path) if reference_image_path and not auto_reference else reference_image_path,
+                'eye_distance_percent': eye_distance_percent,
+                'filter_tilted': filter_tilted,
+                'warp_quality': warp_quality or self.warp_quality,
+                'max_output_side': max_output_side,
+                'output_size': self.output_size,
+                'preserve_background': self.preserve_background,
+                'force_reference_size': self.force_reference_size,
+                'tilt_threshold': self.tilt_threshold,
+                'debug': self.debug,
+                'prefilter': prefilter.settings() if prefilter else None,
+                'dedup': dedup.settings() if dedup else None,
+            }
+            fingerprint = job_fingerprint([cache_key for _, _, cache_key in sources], settings)
+            checkpoint = BatchCheckpoint(checkpoint_dir, fingerprint)
+        if checkpoint is not None and len(checkpoint):
+            logger.info("从断点继续：已完成 %d/%d 张图片", len(checkpoint), len(sources))
+        
+        results = BatchResults() if sink is None else sink
+        # 有断点时关键点检测结果随断点一起保存，结束后合并回原来的缓存
+        with checkpoint.attach(self) if checkpoint is not None else contextlib.nullcontext():
+            completed = self._process_batch_sources(sources, auto_reference, filter_tilted, warp_quality,
+                                                    max_output_side, checkpoint, prefilter, dedup,
+                                                    results, progress, should_stop)
+        if checkpoint is not None and completed:
+            # 整批完成且没有失败的图片，结果已交给 sink，断点不再需要
+            checkpoint.remove()
+        if sink is None:
+            return results.as_tuple(self.debug)
+        return None
+
+    def _process_batch_sources(self, sources, auto_reference, filter_tilted, warp_quality, max_output_side,
+                               checkpoint, prefilter, dedup, sink, progress, should_stop):
+        """process_batch 的主体：依次处理 sources，整批完成、未中止且没有失败时返回 True"""
+        started = time.perf_counter()
+        metrics_before = self.metrics.snapshot()
+        total = len(sources)
+        counts = {'aligned': 0, 'skipped': 0, 'failed': 0, 'resumed': 0}
         
-        # 遍历处理所有图片
-        for img_path in image_paths:
+        def report(done, current):
+            if progress is not None:
+                progress(done, current)
+        
+        def stopped():
+            return should_stop is not None and should_stop()
+        
+        def skip(index, name, reason, record=True):
+            counts['skipped'] += 1
+            sink.skip(index, name, reason)
+            if record and checkpoint is not None:
+                checkpoint.record_skip(index, reason)
+        
+        duplicates = {}
+        if dedup is not None:
+            # 查重只读取缩略图，在检测和对齐之前完成，被剔除的照片不再读取原图
+            with self.metrics.time('dedup'):
+                duplicates = dedup.find_duplicates(
+                    sources,
+                    lambda done, count: report(0, [PROGRESS_DEDUP, done, count]),
+                    cache=checkpoint.dedup_hashes if checkpoint is not None else None
+                )
+            if duplicates:
+                logger.info("近似重复的照片: %d 张", len(duplicates))
+        
+        # 自动参考帧：第一遍获取所有关键点并选择参考帧，对齐时复用这些关键点
+        detected = {}
+        self.auto_reference_source = None
+        if auto_reference:
+            def read_reference_preview(index):
+                # 第一遍只用于检测关键点，按代理图尺寸缩小解码；选中的参考帧再读取原图
+                report(0, [PROGRESS_AUTO_REFERENCE, index + 1, total])
+                return read_image_reduced(sources[index][1], self.detection_proxy_side)
+
+            ref_index, detected = self.select_auto_reference(
+                [(index, cache_key) for index, (_, _, cache_key) in enumerate(sources) if index not in duplicates],
+                lambda index: read_source(sources[index][1]),
+                prefilter=prefilter,
+                should_stop=should_stop,
+                read_preview=read_reference_preview
+            )
+            if ref_index is not None:
+                self.auto_reference_source = sources[ref_index][0]
+                logger.info("自动选择的参考帧: %s", self.auto_reference_source)
+        
+        for index, (name, source, cache_key) in enumerate(sources):
+            if stopped():
+                break
+            report(index, os.path.basename(name))
+            entry = checkpoint.entry(index) if checkpoint is not None else None
+            if entry is not None and not sink.can_resume(index, entry):
+                # 结果已过期（如前面失败的图片这次成功，帧序号和日期随之后移），重新处理
+                entry = None
+            if entry is not None:
+                # 断点中已完成的图片直接复用之前的结果
+                counts['resumed'] += 1
+                self.metrics.increment('resumed')
+                if entry['skip']:
+                    skip(index, name, entry['skip'], record=False)
+                    continue
+                debug_img = checkpoint.read_image(entry['debug']) if self.debug and entry['debug'] else None
+                record = sink.add(index, name, checkpoint.read_image(entry['output']), debug_img, entry)
+                if record is not None:
+                    # sink 保存了新的文件，让断点指向它们
+                    checkpoint.record_output(index, *record)
+                counts['aligned'] += 1
+                continue
+            
+            if index in duplicates:
+                self.metrics.increment('skipped_duplicate')
+                skip(index, name, dedup.skip_reason(sources, duplicates[index]))
+                continue
+            
             try:
-                img = cv2.imread(img_path)
+                img = read_source(source)
                 if img is None:
-                    print(f"无法读取图片: {img_path}")
-                    skipped_images.append((img_path, "无法读取图片"))
+                    logger.warning("无法读取图片: %s", name)
+                    self.metrics.increment('skipped_read_error')
+                    skip(index, name, [SKIP_READ_ERROR, ""])
                     continue
                 
+                # 预筛选：过暗、过曝、模糊等明显不可用的图片不做关键点检测
+                if prefilter is not None:
+                    with self.metrics.time('prefilter'):
+                        rejected = prefilter.evaluate(img)
+                    if rejected is not None:
+                        self.metrics.increment(f'skipped_{rejected[0]}')
+                        logger.debug("预筛选跳过图片: %s, 原因: %s", name, rejected)
+                        skip(index, name, rejected)
+                        continue
+                
+                # 每张图片只检测一次关键点，倾斜检查和对齐共用结果
+                if index in detected:
+                    landmarks = detected[index]
+                else:
+                    landmarks = self.get_landmarks(img, cache_key=cache_key)
+                
                 # 如果启用了过滤倾斜头部，检查头部是否端正
                 if filter_tilted:
-                    is_straight, tilt_info, reason = self.check_head_tilt(img)
+                    is_straight, _, reason = self.check_head_tilt(img, landmarks=landmarks)
                     if not is_straight:
-                        print(f"跳过倾斜头部的图片: {img_path}, 原因: {reason}")
-                        skipped_images.append((img_path, f"头部倾斜: {reason}"))
+                        logger.debug("跳过倾斜头部的图片: %s, 原因: %s", name, reason)
+                        self.metrics.increment('skipped_head_tilt')
+                        skip(index, name, [SKIP_HEAD_TILT, reason])
                         continue
                 
                 # 处理图片，可选是否返回调试信息
+                debug_img = None
                 if self.debug:
-                    aligned, debug_img = self.align_and_crop_face(img, show_landmarks=True)
-                    debug_images.append(debug_img)
+                    aligned, debug_img = self.align_and_crop_face(img, show_landmarks=True, landmarks=landmarks, quality=warp_quality, max_output_side=max_output_side)
                 else:
-                    aligned = self.align_and_crop_face(img)
+                    aligned = self.align_and_crop_face(img, landmarks=landmarks, quality=warp_quality, max_output_side=max_output_side)
                 
-                aligned_images.append(aligned)
-                successful_images.append(img_path)
-                print(f"成功处理: {img_path}")
+                record = sink.add(index, name, aligned, debug_img)
+                counts['aligned'] += 1
+                self.metrics.increment('aligned')
+                if checkpoint is not None:
+                    if record is None:
+                        # sink 不保存文件时，输出写入断点目录
+                        output_path = checkpoint.write_output(index, aligned)
+                        debug_path = checkpoint.write_output(index, debug_img, prefix="debug_") if debug_img is not None else None
+                        record = (output_path, debug_path)
+                    checkpoint.record_output(index, *record)
+                logger.debug("成功处理: %s", name)
             except Exception as e:
-                print(f"处理图片失败 {img_path}: {e}")
-                skipped_images.append((img_path, f"处理失败: {e}"))
-                
-        if self.debug:
-            return aligned_images, successful_images, debug_images, skipped_images
-        return aligned_images, successful_images, skipped_images 
\ No newline at end of file
+                # 处理失败不写入断点，重新运行时再次尝试
+                logger.warning("处理图片失败 %s: %s", name, e)
+                self.metrics.increment('failed')
+                counts['failed'] += 1
+                skip(index, name, [SKIP_FAILED, str(e)], record=False)
+        
+        cancelled = stopped()
+        if not cancelled:
+            report(total, None)
+        if checkpoint is not None:
+            checkpoint.save()
+        
+        # 每批一条汇总记录；结构化数据放在 batch_summary 属性中，供日志处理器读取
+        elapsed = time.perf_counter() - started
+        stage_delta = self.metrics.delta(metrics_before)
+        logger.info(
+            "批处理完成: 共 %d 张, 成功 %d, 跳过 %d, 失败 %d, 断点复用 %d, 用时 %.1f 秒; 阶段耗时: %s",
+            total, counts['aligned'], counts['skipped'], counts['failed'], counts['resumed'], elapsed,
+            format_stage_totals(stage_delta["stages"]),
+            extra={"batch_summary": {
+                "total": total,
+                **counts,
+                "cancelled": cancelled,
+                "seconds": elapsed,
+                **stage_delta,
+            }}
+        )
+        return not cancelled and not counts['failed']
+
+
+class BatchResults:
+    """process_batch 的默认结果接收器：在内存中收集对齐结果
+
+    自定义的接收器（如后台任务的帧库）实现同样的 can_resume / add / skip 方法
+    """
+
+    def __init__(self):
+        self.aligned_images = []
+        self.successful_images = []
+        self.debug_images = []
+        self.skipped_images = []  # [(名称, [原因代码, 详情])]
+
+    def can_resume(self, input_index, entry):
+        """断点中的记录 entry 能否直接复用，返回 False 时重新处理该图片"""
+        return True
+
+    def add(self, input_index, name, aligned, debug_image=None, entry=None):
+        """保存一帧对齐结果；entry 为断点中复用的记录，新处理的帧为 None
+
+        返回写入断点的 (输出文件, 调试图像文件[, 日期字符串, 日期])；
+        返回 None 时新处理的帧由 process_batch 写入断点目录，复用的帧保持原来的断点记录
+        """
+        self.aligned_images.append(aligned)
+        self.successful_images.append(name)
+        if debug_image is not None:
+            self.debug_images.append(debug_image)
+        return None
+
+    def skip(self, input_index, name, reason):
+        self.skipped_images.append((name, reason))
+
+    def as_tuple(self, debug=False):
+        if debug:
+            return self.aligned_images, self.successful_images, self.debug_images, self.skipped_images
+        return self.aligned_images, self.successful_images, self.skipped_images
@@ -4,25 +4,46 @@ PyInstaller hook for MediaPipe
 Handles MediaPipe data files and dependencies properly
 """
 
+import os
+
 from PyInstaller.utils.hooks import collect_data_files, collect_submodules
 
-# Collect MediaPipe submodules
-hiddenimports = collect_submodules('mediapipe')
+# The one-dir spec sets DEFORUM_MEDIAPIPE_PRUNED=1 to bundle only what the
+# face_mesh / face_detection solutions need instead of every mediapipe module
+PRUNED = os.environ.get('DEFORUM_MEDIAPIPE_PRUNED') == '1'
+
+if PRUNED:
+    # PyInstaller follows the static imports of these solutions on its own
+    hiddenimports = [
+        'mediapipe.python._framework_bindings',
+        'mediapipe.python.solutions.face_mesh',
+        'mediapipe.python.solutions.face_detection',
+        'google.protobuf.pyext._message',
+    ]
+    # Only the face detection / face landmark graphs and models
+    datas = collect_data_files('mediapipe', includes=[
+        'modules/face_detection/**',
+        'modules/face_landmark/**',
+    ])
+else:
+    # Collect MediaPipe submodules
+    hiddenimports = collect_submodules('mediapipe')
 
-# Use automatic collection only to avoid duplicates
-# This is the recommended approach, PyInstaller handles paths automatically
-datas = collect_data_files('mediapipe')
+    # Use automatic collection only to avoid duplicates
+    # This is the recommended approach, PyInstaller handles paths automatically
+    datas = collect_data_files('mediapipe')
 
-# Add necessary hidden imports
-additional_hiddenimports = [
-    'mediapipe.python._framework_bindings',
-    'mediapipe.python.solutions.face_mesh',
-    'mediapipe.python.solutions.drawing_utils',
-    'mediapipe.python.solutions.drawing_styles',
-    'google.protobuf.pyext._message',
-]
+    # Add necessary hidden imports
+    additional_hiddenimports = [
+        'mediapipe.python._framework_bindings',
+        'mediapipe.python.solutions.face_mesh',
+        'mediapipe.python.solutions.drawing_utils',
+        'mediapipe.python.solutions.drawing_styles',
+        'google.protobuf.pyext._message',
+    ]
 
-hiddenimports.extend(additional_hiddenimports)
+    hiddenimports.extend(additional_hiddenimports)
 
+print(f"[MEDIAPIPE HOOK] Pruned: {PRUNED}")
 print(f"[MEDIAPIPE HOOK] Collected {len(datas)} data files")
-print(f"[MEDIAPIPE HOOK] Included {len(hiddenimports)} hidden imports") 
\ No newline at end of file
+print(f"[MEDIAPIPE HOOK] Included {len(hiddenimports)} hidden imports")
\ No newline at end of file
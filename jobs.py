@@ -0,0 +1,344 @@
+import contextlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import date as date_type, datetime
+
+from date_resolver import format_date
+from frame_store import FrameStore
+from head_stabilizer import AUTO_REFERENCE
+from metrics import StageMetrics
+
+logger = logging.getLogger(__name__)
+
+# 任务目录（程序运行目录下）
+JOBS_DIR_NAME = "deforum_jobs"
+JOB_STATE_FILENAME = "job.json"
+JOB_METRICS_FILENAME = "metrics.json"
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_INTERRUPTED = "interrupted"   # 进程退出时仍在运行的任务
+
+# 任务类型
+JOB_KIND_ALIGN = "align"
+JOB_KIND_DRAFT = "draft"   # 草稿预览：抽样图片低分辨率快速对齐
+
+# 进度写入磁盘的最小间隔（秒）
+PROGRESS_SAVE_INTERVAL = 0.5
+
+# 提交新任务时保留的已结束任务数和断点数，更早的任务目录和断点会被删除
+JOB_RETENTION = 10
+
+# 断点目录（任务目录下），按任务指纹分子目录
+CHECKPOINTS_DIR_NAME = "checkpoints"
+
+
+class Job:
+    """后台任务：状态和进度保存在任务目录的 job.json 中，结果保存在任务目录的帧库中"""
+
+    def __init__(self, job_id, directory, total=0, kind=JOB_KIND_ALIGN):
+        self.id = job_id
+        self.directory = directory
+        self.kind = kind
+        self.status = JOB_QUEUED
+        self.total = total
+        self.done = 0
+        self.current = None
+        self.error = None
+        self.reference = None  # 自动选择的参考帧名称
+        self.created = datetime.now().isoformat(timespec="seconds")
+        self.finished = None
+        self.thread = None
+        self._cancel_event = threading.Event()
+        self._last_save = 0.0
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, JOB_STATE_FILENAME)
+
+    @property
+    def metrics_path(self):
+        return os.path.join(self.directory, JOB_METRICS_FILENAME)
+
+    def load_metrics(self):
+        """读取任务结束时保存的阶段耗时统计，没有时返回 None"""
+        try:
+            with open(self.metrics_path, "r", encoding="utf-8") as f:
+                return StageMetrics.from_json(f.read())
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @property
+    def frames(self):
+        """对齐结果帧库"""
+        return FrameStore(os.path.join(self.directory, "result"))
+
+    @property
+    def debug_frames(self):
+        """调试图像帧库"""
+        return FrameStore(os.path.join(self.directory, "debug"))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "current": self.current,
+            "error": self.error,
+            "reference": self.reference,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+    @classmethod
+    def load(cls, directory):
+        """从任务目录读取任务状态，读取失败时返回 None"""
+        try:
+            with open(os.path.join(directory, JOB_STATE_FILENAME), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls(state["id"], directory, state.get("total", 0), state.get("kind", JOB_KIND_ALIGN))
+        job.status = state.get("status", JOB_INTERRUPTED)
+        job.done = state.get("done", 0)
+        job.current = state.get("current")
+        job.error = state.get("error")
+        job.reference = state.get("reference")
+        job.created = state.get("created")
+        job.finished = state.get("finished")
+        if job.status in (JOB_QUEUED, JOB_RUNNING):
+            # 没有线程在执行，说明进程在任务完成前退出了
+            job.status = JOB_INTERRUPTED
+        return job
+
+    def save_state(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.state_path)
+        self._last_save = time.monotonic()
+
+    def report(self, done, current=None):
+        """更新进度，按固定间隔写入磁盘，本次写入了磁盘时返回 True"""
+        self.done = done
+        self.current = current
+        if time.monotonic() - self._last_save >= PROGRESS_SAVE_INTERVAL:
+            self.save_state()
+            return True
+        return False
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def is_active(self):
+        return self.status in (JOB_QUEUED, JOB_RUNNING)
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 0.0
+
+
+class JobManager:
+    """在后台线程中运行任务，任务在 Streamlit 重新运行和浏览器断开后继续执行
+
+    管理器在进程内共享，正在运行的任务保存在内存中，已结束的任务可从任务目录读取；
+    每次提交时只保留最近 keep 个已结束的任务目录。
+    """
+
+    def __init__(self, root=None, keep=JOB_RETENTION):
+        self.root = root or os.path.join(os.getcwd(), JOBS_DIR_NAME)
+        self.keep = keep
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, work, total, kind=JOB_KIND_ALIGN):
+        """提交任务，work(job) 在后台线程中执行，返回 Job"""
+        self.prune()
+        job_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        job = Job(job_id, os.path.join(self.root, job_id), total=total, kind=kind)
+        job.save_state()
+        with self._lock:
+            self._jobs[job_id] = job
+        job.thread = threading.Thread(target=self._run, args=(job, work), name=f"job-{job_id}", daemon=True)
+        job.thread.start()
+        return job
+
+    def _run(self, job, work):
+        job.status = JOB_RUNNING
+        job.save_state()
+        try:
+            work(job)
+            job.status = JOB_CANCELLED if job.cancelled else JOB_COMPLETED
+        except Exception as e:
+            logger.exception("任务 %s 失败", job.id)
+            job.status = JOB_FAILED
+            job.error = str(e)
+        job.finished = datetime.now().isoformat(timespec="seconds")
+        job.save_state()
+
+    def get(self, job_id):
+        """按任务ID获取任务，不在内存中时从任务目录读取"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return Job.load(os.path.join(self.root, job_id))
+
+    def checkpoint_dir(self, fingerprint):
+        """任务指纹对应的断点目录"""
+        return os.path.join(self.root, CHECKPOINTS_DIR_NAME, fingerprint)
+
+    def prune(self, keep=None):
+        """删除最旧的已结束任务目录和断点，各只保留最近 keep 个（默认为 self.keep），返回删除的任务ID"""
+        keep = self.keep if keep is None else keep
+        finished = [job for job in self.list_jobs() if not job.is_active]
+        removed = []
+        for job in finished[keep:]:
+            shutil.rmtree(job.directory, ignore_errors=True)
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            removed.append(job.id)
+        self._prune_checkpoints(keep)
+        return removed
+
+    def _prune_checkpoints(self, keep):
+        # 完整结束的任务会删除自己的断点，这里清理取消、中断或有失败图片的任务留下的断点
+        try:
+            with os.scandir(os.path.join(self.root, CHECKPOINTS_DIR_NAME)) as iterator:
+                directories = [entry for entry in iterator if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        directories.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        for entry in directories[keep:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def list_jobs(self):
+        """列出所有任务，最新的在前"""
+        try:
+            job_ids = [name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name))]
+        except OSError:
+            job_ids = []
+        jobs = [self.get(job_id) for job_id in sorted(job_ids, reverse=True)]
+        return [job for job in jobs if job is not None]
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """进程内共享的任务管理器"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+        return _job_manager
+
+
+class JobFrameSink:
+    """后台任务的结果接收器：对齐结果加上日期水印后写入任务目录的帧库（接口见 BatchResults）
+
+    用户输入日期时按帧在帧库中的序号计算日期，被跳过的图片不占用日期；
+    返回的帧文件位置和日期写入断点，断点中复用的结果复制到当前任务的帧库
+    """
+
+    def __init__(self, frames, debug_frames=None, date_table=None, watermarker=None, metrics=None):
+        self.frames = frames
+        self.debug_frames = debug_frames
+        self.date_table = date_table
+        self.watermarker = watermarker
+        self.metrics = metrics
+
+    def _next_date(self, input_index):
+        """下一帧的 (日期, 日期字符串)，帧序号为帧库中已有的帧数"""
+        if not self.date_table:
+            return None, None
+        date = self.date_table.date_for(input_index, len(self.frames))
+        return date, format_date(date, self.date_table.date_format)
+
+    def can_resume(self, input_index, entry):
+        """断点中的结果带有处理时的日期水印，只有日期与这次的帧序号一致时才能复用"""
+        return bool(entry["skip"]) or entry["date"] == self._next_date(input_index)[1]
+
+    def add(self, input_index, name, aligned, debug_image=None, entry=None):
+        if entry is not None:
+            # 复用的结果已带有水印
+            date_str = entry["date"]
+            date = date_type.fromisoformat(entry["date_iso"]) if entry.get("date_iso") else None
+        else:
+            # 日期水印，日期从任务的日期表读取
+            date, date_str = self._next_date(input_index)
+            if date_str and self.watermarker is not None:
+                with self.metrics.time("watermark") if self.metrics is not None else contextlib.nullcontext():
+                    self.watermarker.apply(aligned, date_str)
+        frame_index = self.frames.append(name, aligned, date_str=date_str, date=date)
+        debug_path = None
+        if self.debug_frames is not None and debug_image is not None:
+            debug_path = self.debug_frames.frame_path(self.debug_frames.append(name, debug_image))
+        return self.frames.frame_path(frame_index), debug_path, date_str, date
+
+    def skip(self, input_index, name, reason):
+        self.frames.skip(name, reason, input_index)
+
+    def save(self):
+        self.frames.save()
+        if self.debug_frames is not None:
+            self.debug_frames.save()
+
+
+def run_alignment(job, stabilizer, sources, date_table=None, watermarker=None, filter_tilted=True,
+                  warp_quality=None, debug=False, checkpoint=None, prefilter=None, dedup=None,
+                  auto_reference=False, max_output_side=None):
+    """对齐任务主体（不依赖 Streamlit），可在后台线程中运行
+
+    sources 为 [(名称, 路径或二进制数据, 关键点缓存键)]，按顺序交给 HeadStabilizer.process_batch 处理；
+    这里只负责任务的进度、取消、日期水印和帧库：对齐结果、日期和跳过原因写入任务目录的帧库。
+    stabilizer 应已设置好参考基准；auto_reference 为 True 时改为从批次的关键点中自动选择参考帧。
+    checkpoint、prefilter、dedup、warp_quality、max_output_side 的含义见 process_batch
+    """
+    stabilizer.debug = debug
+    sink = JobFrameSink(job.frames, job.debug_frames if debug else None, date_table, watermarker, stabilizer.metrics)
+
+    def report(done, current):
+        if job.report(done, current):
+            # 与进度一起保存帧库索引，进程意外退出时已完成的结果仍可读取
+            sink.save()
+
+    try:
+        stabilizer.process_batch(
+            sources,
+            reference_image_path=AUTO_REFERENCE if auto_reference else None,
+            eye_distance_percent=None,
+            filter_tilted=filter_tilted,
+            warp_quality=warp_quality,
+            max_output_side=max_output_side,
+            prefilter=prefilter,
+            dedup=dedup,
+            checkpoint=checkpoint,
+            sink=sink,
+            progress=report,
+            should_stop=lambda: job.cancelled
+        )
+    finally:
+        sink.save()
+        if stabilizer.auto_reference_source is not None:
+            job.reference = os.path.basename(stabilizer.auto_reference_source)
+        with open(job.metrics_path, "w", encoding="utf-8") as f:
+            f.write(stabilizer.metrics.to_json(indent=1))
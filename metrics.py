@@ -0,0 +1,176 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = "deforum"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, upper in enumerate(self.buckets):
+            if seconds <= upper:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """各桶的累计计数（Prometheus 直方图语义）"""
+        result, running = [], 0
+        for count in self.counts:
+            running += count
+            result.append(running)
+        return result
+
+
+class StageMetrics:
+    """各处理阶段的耗时直方图和事件计数器（线程安全）
+
+    用法:
+        with metrics.time("detect"):
+            ...
+        metrics.increment("detect_retry")
+    snapshot() 返回可直接读取的字典，to_json() / to_prometheus() 导出文本。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        """计时上下文：退出时（包括抛出异常时）记录一次该阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """返回 {'stages': {阶段: 统计}, 'counters': {名称: 计数}}，耗时单位为秒"""
+        with self._lock:
+            stages = {}
+            for stage, histogram in self._histograms.items():
+                stages[stage] = {
+                    "count": histogram.count,
+                    "total": histogram.total,
+                    "mean": histogram.total / histogram.count if histogram.count else 0.0,
+                    "max": histogram.max,
+                    "buckets": dict(zip(self.buckets, histogram.cumulative())),
+                }
+            return {"stages": stages, "counters": dict(self._counters)}
+
+    @classmethod
+    def from_json(cls, text):
+        """从 to_json() 的输出恢复统计（例如读取任务目录中保存的结果）"""
+        data = json.loads(text) if isinstance(text, str) else text
+        stages = data.get("stages", {})
+        buckets = DEFAULT_BUCKETS
+        if stages:
+            buckets = tuple(sorted(float(upper) for upper in next(iter(stages.values()))["buckets"]))
+        metrics = cls(buckets)
+        for stage, stats in stages.items():
+            histogram = _Histogram(metrics.buckets)
+            cumulative = [stats["buckets"][key] for key in sorted(stats["buckets"], key=float)]
+            histogram.counts = [count - previous for count, previous in zip(cumulative, [0] + cumulative[:-1])]
+            histogram.count = stats["count"]
+            histogram.total = stats["total"]
+            histogram.max = stats["max"]
+            metrics._histograms[stage] = histogram
+        metrics._counters = dict(data.get("counters", {}))
+        return metrics
+
+    def to_json(self, indent=None):
+        snapshot = self.snapshot()
+        for stats in snapshot["stages"].values():
+            stats["buckets"] = {str(upper): count for upper, count in stats["buckets"].items()}
+        return json.dumps(snapshot, ensure_ascii=False, indent=indent)
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """导出 Prometheus 文本格式"""
+        snapshot = self.snapshot()
+        name = f"{prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each processing stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, stats in sorted(snapshot["stages"].items()):
+            for upper, count in stats["buckets"].items():
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{upper:g}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stats["total"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats["count"]}')
+
+        name = f"{prefix}_events_total"
+        lines += [
+            f"# HELP {name} Pipeline event counters.",
+            f"# TYPE {name} counter",
+        ]
+        for event, count in sorted(snapshot["counters"].items()):
+            lines.append(f'{name}{{event="{event}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def delta(self, before):
+        """自 before（之前的 snapshot()）以来新增的次数和耗时：{'stages': {阶段: {'count', 'total'}}, 'counters': {...}}"""
+        after = self.snapshot()
+        stages = {}
+        for stage, stats in after["stages"].items():
+            previous = before["stages"].get(stage, {"count": 0, "total": 0.0})
+            count = stats["count"] - previous["count"]
+            if count:
+                stages[stage] = {"count": count, "total": stats["total"] - previous["total"]}
+        counters = {}
+        for name, value in after["counters"].items():
+            value -= before["counters"].get(name, 0)
+            if value:
+                counters[name] = value
+        return {"stages": stages, "counters": counters}
+
+    def summary_rows(self):
+        """按总耗时从高到低排列的 (阶段, 次数, 总耗时秒, 平均毫秒, 占比)"""
+        stages = self.snapshot()["stages"]
+        grand_total = sum(stats["total"] for stats in stages.values()) or 1.0
+        rows = [
+            (stage, stats["count"], stats["total"], stats["mean"] * 1000, stats["total"] / grand_total)
+            for stage, stats in stages.items()
+        ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def format_stage_totals(stages):
+    """将 {阶段: {'count', 'total'}} 格式化为一行文字，按总耗时从高到低排列"""
+    ordered = sorted(stages.items(), key=lambda item: item[1]["total"], reverse=True)
+    return ", ".join(
+        f"{stage} {stats['total']:.2f}s/{stats['count']}" for stage, stats in ordered
+    ) or "-"
@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+# 跳过原因代码（与 jobs 中的跳过原因一样，界面按当前语言显示）
+SKIP_TOO_DARK = "prefilter_too_dark"
+SKIP_OVEREXPOSED = "prefilter_overexposed"
+SKIP_LOW_CONTRAST = "prefilter_low_contrast"
+SKIP_BLURRY = "prefilter_blurry"
+
+# 跳过原因的中文说明（批处理接口的跳过列表使用）
+PREFILTER_REASON_TEXT = {
+    SKIP_TOO_DARK: "照片过暗",
+    SKIP_OVEREXPOSED: "照片过曝",
+    SKIP_LOW_CONTRAST: "对比度过低",
+    SKIP_BLURRY: "照片模糊",
+}
+
+# 缩略图最长边；所有检查都在这张灰度缩略图上进行
+PREFILTER_THUMBNAIL_SIDE = 320
+
+# 默认检查顺序：曝光 → 对比度 → 模糊
+DEFAULT_PREFILTER_CHECKS = ("exposure", "contrast", "blur")
+
+
+class FramePrefilter:
+    """关键点检测前的快速预筛选：在灰度缩略图上依次运行一组向量化检查
+
+    缩略图和亮度直方图只计算一次，各检查共用；第一项未通过的检查决定跳过原因。
+    默认阈值较宽松，只排除明显不可用的照片（全黑、过曝、镜头被遮挡、严重模糊）。
+    """
+
+    def __init__(self, checks=DEFAULT_PREFILTER_CHECKS, thumbnail_side=PREFILTER_THUMBNAIL_SIDE,
+                 min_brightness=20.0, max_brightness=235.0, max_clipped=0.6,
+                 min_contrast=12.0, min_sharpness=15.0):
+        unknown = [name for name in checks if not hasattr(self, f"check_{name}")]
+        if unknown:
+            raise ValueError(f"未知的预筛选检查: {', '.join(unknown)}")
+        self.checks = tuple(checks)
+        self.thumbnail_side = thumbnail_side
+        self.min_brightness = min_brightness    # 平均亮度下限
+        self.max_brightness = max_brightness    # 平均亮度上限
+        self.max_clipped = max_clipped          # 纯黑或纯白像素占比上限（与平均亮度同时超限才跳过）
+        self.min_contrast = min_contrast        # 亮度 5%~95% 分位数之差的下限
+        self.min_sharpness = min_sharpness      # 拉普拉斯方差下限
+
+    def settings(self):
+        """预筛选参数（用于任务指纹）"""
+        return {
+            "checks": list(self.checks),
+            "thumbnail_side": self.thumbnail_side,
+            "min_brightness": self.min_brightness,
+            "max_brightness": self.max_brightness,
+            "max_clipped": self.max_clipped,
+            "min_contrast": self.min_contrast,
+            "min_sharpness": self.min_sharpness,
+        }
+
+    def thumbnail(self, image):
+        """BGR 或灰度图像缩小为灰度缩略图（先缩小再转灰度，只处理少量像素）"""
+        h, w = image.shape[:2]
+        # 大图先按步长抽样，再用 INTER_AREA 缩小，避免对全部像素求平均
+        step = int(max(h, w) / self.thumbnail_side // 3)
+        if step > 1:
+            image = image[::step, ::step]
+            h, w = image.shape[:2]
+        scale = self.thumbnail_side / max(h, w)
+        if scale < 1:
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image
+
+    def evaluate(self, image):
+        """运行检查链，全部通过时返回 None，否则返回 [原因代码, 详情]"""
+        gray = self.thumbnail(image)
+        hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        hist /= hist.sum()
+        for name in self.checks:
+            reason = getattr(self, f"check_{name}")(gray, hist)
+            if reason is not None:
+                return reason
+        return None
+
+    def check_exposure(self, gray, hist):
+        # 平均亮度超出范围且大部分像素被截断才跳过：黑色背景前的人像（平均亮度正常）
+        # 和整体偏暗但未截断的室内照片都能通过
+        mean = float(np.dot(hist, np.arange(256)))
+        dark = float(hist[:6].sum())
+        bright = float(hist[250:].sum())
+        if mean < self.min_brightness and dark > self.max_clipped:
+            return [SKIP_TOO_DARK, f"{mean:.1f} / {dark:.0%}"]
+        if mean > self.max_brightness and bright > self.max_clipped:
+            return [SKIP_OVEREXPOSED, f"{mean:.1f} / {bright:.0%}"]
+        return None
+
+    def check_contrast(self, gray, hist):
+        cumulative = np.cumsum(hist)
+        low, high = np.searchsorted(cumulative, [0.05, 0.95])
+        spread = float(high - low)
+        if spread < self.min_contrast:
+            return [SKIP_LOW_CONTRAST, f"{spread:.0f} < {self.min_contrast:g}"]
+        return None
+
+    def check_blur(self, gray, hist):
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        if sharpness < self.min_sharpness:
+            return [SKIP_BLURRY, f"{sharpness:.1f} < {self.min_sharpness:g}"]
+        return None
@@ -4,7 +4,9 @@ Build environment preparation script
 Creates PyInstaller spec file and hook configuration for GitHub Actions
 """
 
+import importlib.util
 import os
+import py_compile
 import site
 import platform
 import sys
@@ -71,7 +73,31 @@ def get_windows_mediapipe_binaries():
     
     return binaries
 
+def precompile_app_modules(paths):
+    """Precompile the application modules into __pycache__ so the bundled app
+    does not compile them on first launch.
+
+    Unchecked hash-based .pyc files stay valid even though PyInstaller does not
+    preserve the source modification times when copying data files.
+    """
+    compiled = []
+    for src, _ in paths:
+        if not src.endswith('.py') or os.path.isabs(src) or src == 'streamlit_app.py':
+            # streamlit executes the main script from source on every run
+            continue
+        cfile = importlib.util.cache_from_source(src)
+        py_compile.compile(src, cfile=cfile, doraise=True,
+                           invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+        compiled.append((cfile, '__pycache__'))
+        print(f"[PRECOMPILED] {cfile}")
+    return compiled
+
 def main():
+    # One-dir build: no per-launch extraction, pruned MediaPipe, precompiled app modules
+    onedir = '--onedir' in sys.argv
+    spec_name = 'HeadAlignmentToolDir.spec' if onedir else 'HeadAlignmentTool.spec'
+    print(f"Build mode: {'onedir' if onedir else 'onefile'}")
+    
     # Ensure hooks directory exists
     if not os.path.exists('hooks'):
         print("Creating hooks directory...")
@@ -99,26 +125,47 @@ print(f"[STREAMLIT HOOK] Included {len(hiddenimports)} hidden imports")
         f.write(streamlit_hook_content)
     
     # MediaPipe hook - let PyInstaller handle automatically, avoid manual path operations
-    mediapipe_hook_content = """from PyInstaller.utils.hooks import collect_data_files, collect_submodules
+    mediapipe_hook_content = """import os
 
-# Collect MediaPipe submodules
-hiddenimports = collect_submodules('mediapipe')
+from PyInstaller.utils.hooks import collect_data_files, collect_submodules
 
-# Use automatic collection only to avoid duplicates
-# This is the recommended approach, PyInstaller handles paths automatically
-datas = collect_data_files('mediapipe')
+# The one-dir spec sets DEFORUM_MEDIAPIPE_PRUNED=1 to bundle only what the
+# face_mesh / face_detection solutions need instead of every mediapipe module
+PRUNED = os.environ.get('DEFORUM_MEDIAPIPE_PRUNED') == '1'
 
-# Add necessary hidden imports
-additional_hiddenimports = [
-    'mediapipe.python._framework_bindings',
-    'mediapipe.python.solutions.face_mesh',
-    'mediapipe.python.solutions.drawing_utils',
-    'mediapipe.python.solutions.drawing_styles',
-    'google.protobuf.pyext._message',
-]
+if PRUNED:
+    # PyInstaller follows the static imports of these solutions on its own
+    hiddenimports = [
+        'mediapipe.python._framework_bindings',
+        'mediapipe.python.solutions.face_mesh',
+        'mediapipe.python.solutions.face_detection',
+        'google.protobuf.pyext._message',
+    ]
+    # Only the face detection / face landmark graphs and models
+    datas = collect_data_files('mediapipe', includes=[
+        'modules/face_detection/**',
+        'modules/face_landmark/**',
+    ])
+else:
+    # Collect MediaPipe submodules
+    hiddenimports = collect_submodules('mediapipe')
 
-hiddenimports.extend(additional_hiddenimports)
+    # Use automatic collection only to avoid duplicates
+    # This is the recommended approach, PyInstaller handles paths automatically
+    datas = collect_data_files('mediapipe')
 
+    # Add necessary hidden imports
+    additional_hiddenimports = [
+        'mediapipe.python._framework_bindings',
+        'mediapipe.python.solutions.face_mesh',
+        'mediapipe.python.solutions.drawing_utils',
+        'mediapipe.python.solutions.drawing_styles',
+        'google.protobuf.pyext._message',
+    ]
+
+    hiddenimports.extend(additional_hiddenimports)
+
+print(f"[MEDIAPIPE HOOK] Pruned: {PRUNED}")
 print(f"[MEDIAPIPE HOOK] Collected {len(datas)} data files")
 print(f"[MEDIAPIPE HOOK] Included {len(hiddenimports)} hidden imports")
 """
@@ -134,6 +181,19 @@ print(f"[MEDIAPIPE HOOK] Included {len(hiddenimports)} hidden imports")
     critical_paths = [
         ('streamlit_app.py', '.'),
         ('head_stabilizer.py', '.'),
+        ('face_landmarks.py', '.'),
+        ('watermark.py', '.'),
+        ('date_resolver.py', '.'),
+        ('folder_index.py', '.'),
+        ('video_export.py', '.'),
+        ('animated_export.py', '.'),
+        ('frame_store.py', '.'),
+        ('jobs.py', '.'),
+        ('checkpoint.py', '.'),
+        ('metrics.py', '.'),
+        ('prefilter.py', '.'),
+        ('dedup.py', '.'),
+        ('reference_manager.py', '.'),
     ]
     
     # Only add necessary Streamlit files
@@ -147,6 +207,9 @@ print(f"[MEDIAPIPE HOOK] Included {len(hiddenimports)} hidden imports")
         critical_paths.append((streamlit_runtime, 'streamlit/runtime'))
         print(f"[EXISTS] streamlit/runtime")
     
+    if onedir:
+        critical_paths.extend(precompile_app_modules(critical_paths))
+    
     # MediaPipe is completely handled by hook, don't add manually here
     print("[INFO] MediaPipe files will be handled automatically by hook")
     
@@ -188,8 +251,16 @@ print(f"[MEDIAPIPE HOOK] Included {len(hiddenimports)} hidden imports")
     hidden_imports_str = ",\n        ".join([f"'{imp}'" for imp in hidden_imports])
     
     # Create simplified PyInstaller spec file
-    spec_content = f"""# -*- mode: python ; coding: utf-8 -*-
+    spec_header = ""
+    if onedir:
+        spec_header = """import os
 
+# Bundle only the face_mesh / face_detection parts of MediaPipe (see hooks/hook-mediapipe.py)
+os.environ['DEFORUM_MEDIAPIPE_PRUNED'] = '1'
+"""
+    
+    spec_content = f"""# -*- mode: python ; coding: utf-8 -*-
+{spec_header}
 block_cipher = None
 
 a = Analysis(
@@ -235,16 +306,49 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+"""
+    if onedir:
+        # Binaries and data stay next to the executable instead of being extracted on
+        # every launch; UPX is disabled because it would decompress them on every launch.
+        # The folder gets its own name so it does not clash with the onefile binary in dist/
+        spec_content = spec_content[:spec_content.index("exe = EXE(")] + """exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='HeadAlignmentTool',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='HeadAlignmentToolDir',
+)
 """
     
     # Write spec file
-    with open('HeadAlignmentTool.spec', 'w', encoding='utf-8') as f:
+    with open(spec_name, 'w', encoding='utf-8') as f:
         f.write(spec_content)
     print('[SUCCESS] Build environment prepared successfully')
     
     # Verify spec file was created
-    if os.path.exists('HeadAlignmentTool.spec'):
-        spec_size = os.path.getsize('HeadAlignmentTool.spec')
+    if os.path.exists(spec_name):
+        spec_size = os.path.getsize(spec_name)
         print(f'[SUCCESS] Spec file created ({spec_size} bytes)')
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from face_landmarks import FaceLandmarks
+from folder_index import file_content_hash
+
+# 内存中最多保留的参考图片数量（最近使用的优先保留）
+MAX_REFERENCES = 8
+
+
+class ReferenceImage:
+    """一张参考图片：解码后的图像和按需检测的关键点
+
+    会话在 session_state 中直接持有该对象，管理器淘汰它之后会话仍可继续使用。
+    关键点检测只持有本图片的锁，不会阻塞其他参考图片的添加和检测。
+    """
+
+    def __init__(self, key, name, image):
+        self.key = key
+        self.name = name
+        self.image = image  # 解码后的参考图像（BGR），调用方不应修改
+        self._landmarks = None
+        self._detected = False  # 是否已经检测过（未检测到人脸时关键点仍为 None）
+        self._lock = threading.Lock()
+
+    def landmarks(self, stabilizer):
+        """参考图片的关键点，第一次调用时用 stabilizer 检测，之后直接返回缓存的结果"""
+        with self._lock:
+            if not self._detected:
+                self._landmarks = stabilizer.get_landmarks(self.image)
+                self._detected = True
+            return self._landmarks
+
+    def apply(self, stabilizer):
+        """将参考图片设置为稳定器的对齐基准，未检测到人脸时抛出 ValueError"""
+        landmarks = self.landmarks(stabilizer)
+        if landmarks is None:
+            raise ValueError("参考图片中未检测到面部关键点，请选择清晰的正面人像照片")
+        # 每个稳定器使用独立的关键点副本
+        return stabilizer.set_reference_from_landmarks(FaceLandmarks(landmarks.points.copy()), self.image)
+
+
+class ReferenceManager:
+    """参考图片管理：按内容哈希在内存中复用解码后的参考图像和关键点
+
+    同一参考图片（无论上传还是指定路径、来自哪个会话）只解码一次、只检测一次关键点，
+    不写入临时文件。管理器只保留最近使用的 max_references 张，
+    添加后返回的 ReferenceImage 由调用方持有，不受淘汰影响。
+    """
+
+    def __init__(self, max_references=MAX_REFERENCES):
+        self.max_references = max_references
+        self._references = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_bytes(self, data, name):
+        """添加图片数据，返回 ReferenceImage；无法解码时返回 None"""
+        key = file_content_hash(data)
+        with self._lock:
+            reference = self._references.get(key)
+            if reference is not None:
+                self._references.move_to_end(key)
+                return reference
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        with self._lock:
+            # 其他线程可能同时添加了同一图片，保留先添加的（可能已检测过关键点）
+            reference = self._references.setdefault(key, ReferenceImage(key, name, image))
+            self._references.move_to_end(key)
+            while len(self._references) > self.max_references:
+                self._references.popitem(last=False)
+        return reference
+
+    def add_path(self, path):
+        """添加图片文件，返回 ReferenceImage；无法读取时返回 None"""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        return self.add_bytes(data, path)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._references
+
+    def __len__(self):
+        with self._lock:
+            return len(self._references)
+
+
+_reference_manager = None
+_reference_manager_lock = threading.Lock()
+
+
+def get_reference_manager():
+    """进程内共享的参考图片管理器"""
+    global _reference_manager
+    with _reference_manager_lock:
+        if _reference_manager is None:
+            _reference_manager = ReferenceManager()
+        return _reference_manager
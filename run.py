@@ -4,6 +4,7 @@
 Head Alignment Tool Launcher
 """
 
+import importlib.util
 import subprocess
 import sys
 import os
@@ -13,7 +14,9 @@ def check_dependencies():
     try:
         import streamlit
         import cv2
-        import mediapipe
+        # mediapipe 导入很慢，这里只检查是否已安装，由应用在后台加载
+        if importlib.util.find_spec("mediapipe") is None:
+            raise ImportError("No module named 'mediapipe'")
         import numpy
         from PIL import Image
         print("✅ 所有依赖已安装")
@@ -2,13 +2,26 @@ import streamlit as st
 import cv2
 import numpy as np
 import os
-import glob
 from PIL import Image
 import io
-from datetime import datetime, timedelta
-from head_stabilizer import HeadStabilizer
-import PIL.ExifTags
-import re
+from datetime import datetime
+from head_stabilizer import AUTO_REFERENCE, SKIP_FAILED, SKIP_HEAD_TILT, HeadStabilizer, warm_up_models
+from face_landmarks import LandmarkCache
+from watermark import DateWatermarker
+from date_resolver import DateTable, DEFAULT_PATTERN_REGISTRY, DATE_SOURCE_METADATA, format_date
+from folder_index import file_content_hash, index_folder
+from checkpoint import BatchCheckpoint, job_fingerprint
+from prefilter import PREFILTER_REASON_TEXT, FramePrefilter
+from dedup import DEFAULT_MAX_DISTANCE, DuplicatePruner
+from reference_manager import get_reference_manager
+from animated_export import ANIMATION_FORMATS, export_animation, scaled_size, webp_frame_limit
+from jobs import (
+    JOB_CANCELLED, JOB_FAILED, JOB_KIND_DRAFT, get_job_manager, run_alignment
+)
+from video_export import (
+    VIDEO_CODECS, SCHEDULE_FORWARD, SCHEDULE_PING_PONG, CrossfadeSequence, FrameSchedule, SegmentedVideo,
+    find_ffmpeg, open_video_writer
+)
 
 # 语言配置
 LANGUAGES = {
@@ -26,6 +39,11 @@ LANGUAGES = {
         "reference_image": "参考图片",
         "upload_reference": "上传参考图片",
         "specify_reference_path": "指定参考图片路径",
+        "auto_reference": "自动选择参考帧",
+        "auto_reference_help": "从所有照片的关键点中选择倾角、眼距和鼻尖位置最接近整体中位数的一张作为参考，无需手动挑选；开启后忽略下方指定的参考图片",
+        "auto_reference_selected": "自动选择的参考帧: {}",
+        "auto_reference_progress": "正在选择参考帧: {}/{}",
+        "dedup_progress": "正在查重: {}/{}",
         "processing_settings": "⚙️ 处理设置",
         "processing_mode": "处理模式",
         "video_export": "🎬 视频导出 (可选)",
@@ -51,6 +69,11 @@ LANGUAGES = {
         "auto_sort_help": "处理图片前按日期顺序排序，确保时间顺序正确",
         "date_parse_pattern": "日期解析模式",
         "date_parse_pattern_help": "选择文件名中日期的格式模式",
+        "custom_date_pattern": "自定义日期模式",
+        "custom_date_pattern_help": "使用 YYYY、MM、DD、HH、MM、SS 占位符，HH 之后的 MM 表示分钟",
+        "custom_date_pattern_placeholder": "例如: IMG_YYYYMMDD_HHMMSS",
+        "invalid_date_pattern": "无效的日期模式: {}",
+        "custom_date_pattern_example": "示例文件名: {}",
         "sort_order": "排序方式",
         "sort_ascending": "从早到晚",
         "sort_descending": "从晚到早",
@@ -122,6 +145,11 @@ LANGUAGES = {
         "preserve_bg_help": "保留原始背景，但可能导致图片尺寸不一致",
         "debug_mode": "调试模式（显示关键点）",
         "debug_mode_help": "在图片上显示检测到的面部关键点",
+        "warp_quality": "插值质量",
+        "warp_quality_help": "快速适合预览，标准为默认质量，高质量使用 Lanczos 插值并预先缩小以避免混叠",
+        "warp_quality_fast": "快速",
+        "warp_quality_standard": "标准",
+        "warp_quality_high": "高质量",
         
         # 视频设置
         "video_description": "将处理后的图片制作成视频",
@@ -136,6 +164,11 @@ LANGUAGES = {
         # 操作按钮
         "process_all": "处理所有图片",
         "process_all_help": "根据当前设置处理所有图片",
+        "draft_preview": "草稿预览",
+        "draft_preview_help": "抽样部分图片，以低分辨率快速对齐，用于确认眼睛间距、参考图片和倾斜设置",
+        "draft_step": "草稿抽样间隔",
+        "draft_step_help": "每隔 N 张图片抽取一张用于草稿预览",
+        "draft_notice": "当前为草稿预览：抽样 {} 张（共 {} 张），低分辨率快速对齐。确认设置后点击「处理所有图片」开始完整处理，已检测的关键点会被复用",
         "previous": "上一张",
         "previous_help": "显示上一张图片",
         "next": "下一张",
@@ -155,6 +188,44 @@ LANGUAGES = {
         # 成功消息
         "all_images_saved": "✅ 所有图片已保存到当前目录",
         "video_exported": "✅ 视频已成功导出到当前目录",
+        "hold_first_frames": "首帧停留帧数",
+        "hold_last_frames": "末帧停留帧数",
+        "hold_frames_help": "在视频开头/结尾额外重复第一张/最后一张照片的帧数",
+        "crossfade_frames": "过渡帧数",
+        "crossfade_frames_help": "在相邻照片之间插入淡入淡出过渡帧，使低帧率视频更平滑；视频帧率会按比例提高，每张照片的停留时间不变",
+        "cancel_job": "取消任务",
+        "job_failed": "处理任务失败: {}",
+        "job_cancelled": "任务已取消，已载入完成的 {} 张图片",
+        "recent_jobs": "历史任务",
+        "load_job": "载入",
+        "load_job_help": "载入所选任务已完成的处理结果",
+        "job_status_completed": "已完成",
+        "job_status_failed": "失败",
+        "job_status_cancelled": "已取消",
+        "job_status_interrupted": "已中断",
+        "stage_metrics": "⏱️ 阶段耗时",
+        "stage_metrics_empty": "处理图片后显示各阶段的耗时",
+        "metrics_stage": "阶段",
+        "metrics_count": "次数",
+        "metrics_total": "总耗时(秒)",
+        "metrics_mean": "平均(毫秒)",
+        "metrics_share": "占比",
+        "metrics_counters": "事件计数: {}",
+        "download_metrics_json": "下载 JSON",
+        "download_metrics_prometheus": "下载 Prometheus 文本",
+        "segmented_export": "分段导出",
+        "segmented_export_help": "按固定帧数分段编码并缓存，再次导出时只重新编码发生变化的分段（需要 ffmpeg）",
+        "animation_format": "动图格式",
+        "animation_max_side": "动图最长边",
+        "animation_max_side_help": "导出动图时缩小到的最长边像素，动图体积随尺寸快速增长",
+        "export_animation": "导出为动图",
+        "export_animation_help": "将所有处理后的图片导出为 GIF/WebP 动图到程序目录（使用上方的帧率、循环和过渡设置）",
+        "animation_exported": "✅ 动图已成功导出到当前目录",
+        "download_animation": "下载动图 ({})",
+        "webp_too_many_frames": "WebP 动图在 {}x{} 尺寸下最多 {} 帧（当前 {} 帧），请减小动图最长边、关闭过渡帧或改用 GIF",
+        "export_segment_progress": "导出视频分段: {}/{}",
+        "segments_reused": "重新编码 {} 个分段，复用 {} 个分段",
+        "ffmpeg_not_found": "未找到 ffmpeg，已改为完整导出",
         "reference_updated": "已更新输出尺寸为参考图片尺寸: {}",
         "reference_features_set": "从参考图片中提取的稳定面部特征已设置为对齐基准",
         "reference_position_set": "参考人脸关键点已设置",
@@ -165,11 +236,26 @@ LANGUAGES = {
         "no_images_to_export": "没有处理过的图片可以导出为视频",
         "invalid_filename": "请输入有效的文件名",
         "reference_read_failed": "无法读取参考图片，使用默认参考设置",
+        "reference_no_face": "参考图片中未检测到人脸，使用默认参考设置",
         "save_failed": "保存图片失败 {}: {}",
         "export_failed": "导出视频失败: {}",
         "processing_failed": "处理图片失败 {}: {}",
         "head_tilt_skipped": "头部倾斜",
         "image_read_error": "无法读取图片",
+        "prefilter_too_dark": "照片过暗",
+        "prefilter_overexposed": "照片过曝",
+        "prefilter_low_contrast": "对比度过低",
+        "prefilter_blurry": "照片模糊",
+        "prefilter_enabled": "预先跳过不可用的照片",
+        "prefilter_enabled_help": "在关键点检测前用缩略图检查亮度、对比度和清晰度，跳过全黑、过曝或严重模糊的照片，节省检测时间",
+        "prefilter_sharpness": "清晰度阈值",
+        "prefilter_skip_count": "预筛选跳过了 {} 张照片（过暗、过曝、对比度过低或模糊），详见被跳过的图片列表",
+        "prefilter_sharpness_help": "缩略图拉普拉斯方差低于此值的照片视为模糊；调高会跳过更多照片",
+        "duplicate_frame": "近似重复，保留的照片",
+        "dedup_enabled": "跳过连拍中的重复照片",
+        "dedup_enabled_help": "处理前比较相邻照片的感知哈希，近似重复的一组照片只保留最清晰的一张；拍摄构图每天都相同时可能误删，请谨慎开启",
+        "dedup_distance": "重复判定距离",
+        "dedup_distance_help": "两张照片的哈希相差不超过这么多位时视为重复；调高会剔除更多照片",
         
         # 提示信息
         "click_to_process": "请点击「处理所有图片」按钮开始处理",
@@ -215,6 +301,11 @@ LANGUAGES = {
         "reference_image": "Reference Image",
         "upload_reference": "Upload Reference",
         "specify_reference_path": "Specify Reference Path",
+        "auto_reference": "Pick reference automatically",
+        "auto_reference_help": "Use the photo whose tilt, eye distance and nose position are closest to the median of all photos as the reference, no manual pick needed; the reference image below is ignored while enabled",
+        "auto_reference_selected": "Automatically picked reference: {}",
+        "auto_reference_progress": "Picking reference frame: {}/{}",
+        "dedup_progress": "Checking for duplicates: {}/{}",
         "processing_settings": "⚙️ Processing Settings",
         "processing_mode": "Processing Mode",
         "video_export": "🎬 Video Export (Optional)",
@@ -240,6 +331,11 @@ LANGUAGES = {
         "auto_sort_help": "Sort images by date before processing to ensure correct time order",
         "date_parse_pattern": "Date Parse Pattern",
         "date_parse_pattern_help": "Select date format pattern in filenames",
+        "custom_date_pattern": "Custom date pattern",
+        "custom_date_pattern_help": "Use YYYY, MM, DD, HH, MM, SS placeholders; MM after HH means minutes",
+        "custom_date_pattern_placeholder": "e.g.: IMG_YYYYMMDD_HHMMSS",
+        "invalid_date_pattern": "Invalid date pattern: {}",
+        "custom_date_pattern_example": "Example filename: {}",
         "sort_order": "Sort Order",
         "sort_ascending": "From Early to Late",
         "sort_descending": "From Late to Early",
@@ -311,6 +407,11 @@ LANGUAGES = {
         "preserve_bg_help": "Preserve original background, but may cause inconsistent image sizes",
         "debug_mode": "Debug mode (show landmarks)",
         "debug_mode_help": "Display detected facial landmarks on images",
+        "warp_quality": "Interpolation quality",
+        "warp_quality_help": "Fast suits previews, standard is the default, high uses Lanczos with area prefiltering to avoid aliasing",
+        "warp_quality_fast": "Fast",
+        "warp_quality_standard": "Standard",
+        "warp_quality_high": "High",
         
         # Video settings
         "video_description": "Create video from processed images",
@@ -325,6 +426,11 @@ LANGUAGES = {
         # Operation buttons
         "process_all": "Process All Images",
         "process_all_help": "Process all images with current settings",
+        "draft_preview": "Draft Preview",
+        "draft_preview_help": "Align a sample of images at low resolution to check eye distance, reference and tilt settings",
+        "draft_step": "Draft sampling interval",
+        "draft_step_help": "Take every Nth image for the draft preview",
+        "draft_notice": "Draft preview: {} sampled of {} images, aligned at low resolution. Click 'Process All Images' to run the full batch once the settings look right; detected landmarks will be reused",
         "previous": "Previous",
         "previous_help": "Show previous image",
         "next": "Next",
@@ -344,6 +450,44 @@ LANGUAGES = {
         # Success messages
         "all_images_saved": "✅ All images saved to current directory",
         "video_exported": "✅ Video successfully exported to current directory",
+        "hold_first_frames": "Hold First Frame",
+        "hold_last_frames": "Hold Last Frame",
+        "hold_frames_help": "Number of extra frames to repeat the first/last photo at the start/end of the video",
+        "crossfade_frames": "Crossfade Frames",
+        "crossfade_frames_help": "Insert crossfade frames between consecutive photos for smoother low-FPS videos; the frame rate is raised accordingly so each photo stays on screen just as long",
+        "cancel_job": "Cancel Job",
+        "job_failed": "Processing job failed: {}",
+        "job_cancelled": "Job cancelled, loaded {} completed images",
+        "recent_jobs": "Recent Jobs",
+        "load_job": "Load",
+        "load_job_help": "Load the completed results of the selected job",
+        "job_status_completed": "Completed",
+        "job_status_failed": "Failed",
+        "job_status_cancelled": "Cancelled",
+        "job_status_interrupted": "Interrupted",
+        "stage_metrics": "⏱️ Stage Timings",
+        "stage_metrics_empty": "Stage timings appear after images are processed",
+        "metrics_stage": "Stage",
+        "metrics_count": "Count",
+        "metrics_total": "Total (s)",
+        "metrics_mean": "Mean (ms)",
+        "metrics_share": "Share",
+        "metrics_counters": "Counters: {}",
+        "download_metrics_json": "Download JSON",
+        "download_metrics_prometheus": "Download Prometheus Text",
+        "segmented_export": "Segmented Export",
+        "segmented_export_help": "Encode and cache fixed-length segments so re-exports only re-encode segments that changed (requires ffmpeg)",
+        "animation_format": "Animation Format",
+        "animation_max_side": "Animation Max Side",
+        "animation_max_side_help": "Longest side in pixels for exported animations; file size grows quickly with dimensions",
+        "export_animation": "Export as Animation",
+        "export_animation_help": "Export all processed images as a GIF/WebP animation to program directory (uses the frame rate, loop and crossfade settings above)",
+        "animation_exported": "✅ Animation successfully exported to current directory",
+        "download_animation": "Download animation ({})",
+        "webp_too_many_frames": "WebP animations at {}x{} are limited to {} frames (currently {}); reduce the max side, disable crossfade or use GIF",
+        "export_segment_progress": "Exporting video segments: {}/{}",
+        "segments_reused": "Re-encoded {} segments, reused {} segments",
+        "ffmpeg_not_found": "ffmpeg not found, falling back to a full export",
         "reference_updated": "Output size updated to reference image size: {}",
         "reference_features_set": "Stable facial features from reference image set as alignment baseline",
         "reference_position_set": "Reference face landmarks set",
@@ -354,11 +498,26 @@ LANGUAGES = {
         "no_images_to_export": "No processed images to export as video",
         "invalid_filename": "Please enter a valid filename",
         "reference_read_failed": "Cannot read reference image, using default reference settings",
+        "reference_no_face": "No face detected in the reference image, using default reference settings",
         "save_failed": "Failed to save image {}: {}",
         "export_failed": "Video export failed: {}",
         "processing_failed": "Failed to process image {}: {}",
         "head_tilt_skipped": "Head tilt",
         "image_read_error": "Cannot read image",
+        "prefilter_too_dark": "Too dark",
+        "prefilter_overexposed": "Overexposed",
+        "prefilter_low_contrast": "Contrast too low",
+        "prefilter_blurry": "Blurry",
+        "prefilter_enabled": "Skip unusable photos early",
+        "prefilter_enabled_help": "Check brightness, contrast and sharpness on a thumbnail before landmark detection, skipping black, overexposed or heavily blurred photos to save detection time",
+        "prefilter_sharpness": "Sharpness threshold",
+        "prefilter_skip_count": "The prefilter skipped {} photos (too dark, overexposed, low contrast or blurry); see the skipped images list",
+        "prefilter_sharpness_help": "Photos whose thumbnail Laplacian variance is below this value count as blurry; raise it to skip more photos",
+        "duplicate_frame": "Near-duplicate, kept",
+        "dedup_enabled": "Skip duplicate burst photos",
+        "dedup_enabled_help": "Compare perceptual hashes of neighbouring photos before processing and keep only the sharpest of each near-identical group; may drop photos if your framing is identical every day, enable with care",
+        "dedup_distance": "Duplicate distance",
+        "dedup_distance_help": "Photos whose hashes differ in at most this many bits count as duplicates; raise it to drop more photos",
         
         # Info messages
         "click_to_process": "Please click 'Process All Images' button to start processing",
@@ -399,169 +558,6 @@ def get_text(key, *args):
         return text.format(*args)
     return text
 
-def parse_date_from_filename(filename, pattern):
-    """从文件名中解析日期"""
-    try:
-        # 移除文件扩展名
-        name_without_ext = os.path.splitext(filename)[0]
-        
-        if pattern == "YYYY-MM-DD":
-            match = re.search(r'(\d{4})-(\d{2})-(\d{2})', name_without_ext)
-            if match:
-                return datetime.strptime(f"{match.group(1)}-{match.group(2)}-{match.group(3)}", "%Y-%m-%d").date()
-        elif pattern == "YYYY_MM_DD":
-            match = re.search(r'(\d{4})_(\d{2})_(\d{2})', name_without_ext)
-            if match:
-                return datetime.strptime(f"{match.group(1)}-{match.group(2)}-{match.group(3)}", "%Y-%m-%d").date()
-        elif pattern == "YYYYMMDD":
-            match = re.search(r'(\d{8})', name_without_ext)
-            if match:
-                return datetime.strptime(match.group(1), "%Y%m%d").date()
-        elif pattern == "MM-DD-YYYY":
-            match = re.search(r'(\d{2})-(\d{2})-(\d{4})', name_without_ext)
-            if match:
-                return datetime.strptime(f"{match.group(3)}-{match.group(1)}-{match.group(2)}", "%Y-%m-%d").date()
-        elif pattern == "DD-MM-YYYY":
-            match = re.search(r'(\d{2})-(\d{2})-(\d{4})', name_without_ext)
-            if match:
-                return datetime.strptime(f"{match.group(3)}-{match.group(2)}-{match.group(1)}", "%Y-%m-%d").date()
-    except:
-        pass
-    return None
-
-def get_exif_date(image_path):
-    """从图片EXIF数据中获取拍摄日期"""
-    try:
-        image = Image.open(image_path)
-        exifdata = image.getexif()
-        
-        # 尝试获取拍摄日期
-        for tag_id in exifdata:
-            tag = PIL.ExifTags.TAGS.get(tag_id, tag_id)
-            if tag in ['DateTime', 'DateTimeOriginal', 'DateTimeDigitized']:
-                date_str = exifdata.get(tag_id)
-                if date_str:
-                    # EXIF日期格式通常是 "YYYY:MM:DD HH:MM:SS"
-                    return datetime.strptime(date_str.split()[0], "%Y:%m:%d").date()
-    except:
-        pass
-    return None
-
-def sort_images_by_date(image_paths, uploaded_files=None):
-    """根据日期对图片进行排序"""
-    image_with_dates = []
-    
-    # 处理文件路径
-    for path in image_paths:
-        if st.session_state.date_source == "date_from_filename":
-            date = parse_date_from_filename(os.path.basename(path), st.session_state.date_parse_pattern)
-        elif st.session_state.date_source == "date_from_metadata":
-            date = get_exif_date(path)
-        else:
-            date = None
-        
-        image_with_dates.append((path, date, "file"))
-    
-    # 处理上传文件
-    if uploaded_files:
-        for uploaded_file in uploaded_files:
-            if st.session_state.date_source == "date_from_filename":
-                date = parse_date_from_filename(uploaded_file.name, st.session_state.date_parse_pattern)
-            elif st.session_state.date_source == "date_from_metadata":
-                # 对于上传文件，暂时无法直接读取EXIF，使用文件名fallback
-                date = parse_date_from_filename(uploaded_file.name, st.session_state.date_parse_pattern)
-            else:
-                date = None
-            
-            image_with_dates.append((uploaded_file, date, "upload"))
-    
-    # 按日期排序
-    if st.session_state.auto_sort_by_date:
-        # 有日期的在前，无日期的在后
-        dated_items = [(item, date, type_) for item, date, type_ in image_with_dates if date is not None]
-        undated_items = [(item, date, type_) for item, date, type_ in image_with_dates if date is None]
-        
-        # 排序有日期的项目
-        reverse = st.session_state.sort_order == "sort_descending"
-        dated_items.sort(key=lambda x: x[1], reverse=reverse)
-        
-        # 合并结果
-        sorted_items = dated_items + undated_items
-    else:
-        sorted_items = image_with_dates
-    
-    # 分离文件路径和上传文件
-    sorted_paths = [item[0] for item in sorted_items if item[2] == "file"]
-    sorted_uploads = [item[0] for item in sorted_items if item[2] == "upload"]
-    
-    return sorted_paths, sorted_uploads
-
-def add_date_watermark(image, date_str, position, font_size, font_color, background_opacity, margin):
-    """在图片上添加日期水印"""
-    if not date_str:
-        return image
-    
-    # 复制图片以避免修改原图
-    img_with_date = image.copy()
-    h, w = img_with_date.shape[:2]
-    
-    # 设置字体
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    # 根据图片宽度的百分比计算字体大小
-    font_scale = (font_size / 100.0) * (w / 100.0)  # font_size现在是百分比
-    thickness = max(1, int(font_scale * 2))
-    
-    # 获取文字尺寸
-    (text_width, text_height), baseline = cv2.getTextSize(date_str, font, font_scale, thickness)
-    
-    # 根据位置计算坐标
-    if position == "position_top_left":
-        x = margin
-        y = margin + text_height
-    elif position == "position_top_right":
-        x = w - text_width - margin
-        y = margin + text_height
-    elif position == "position_bottom_left":
-        x = margin
-        y = h - margin
-    else:  # position_bottom_right
-        x = w - text_width - margin
-        y = h - margin
-    
-    # 颜色映射
-    color_map = {
-        "white": (255, 255, 255),
-        "black": (0, 0, 0),
-        "yellow": (0, 255, 255),
-        "red": (0, 0, 255)
-    }
-    text_color = color_map.get(font_color, (255, 255, 255))
-    
-    # 添加半透明背景
-    if background_opacity > 0:
-        # 创建背景矩形
-        padding = 5
-        bg_x1 = max(0, x - padding)
-        bg_y1 = max(0, y - text_height - padding)
-        bg_x2 = min(w, x + text_width + padding)
-        bg_y2 = min(h, y + padding)
-        
-        # 根据字体颜色选择背景颜色（对比色）
-        if font_color in ["white", "yellow"]:
-            bg_color = (0, 0, 0)  # 亮色字体用黑色背景
-        else:
-            bg_color = (255, 255, 255)  # 暗色字体用白色背景
-        
-        # 创建半透明背景
-        overlay = img_with_date.copy()
-        cv2.rectangle(overlay, (bg_x1, bg_y1), (bg_x2, bg_y2), bg_color, -1)
-        cv2.addWeighted(overlay, background_opacity, img_with_date, 1 - background_opacity, 0, img_with_date)
-    
-    # 添加文字
-    cv2.putText(img_with_date, date_str, (x, y), font, font_scale, text_color, thickness, cv2.LINE_AA)
-    
-    return img_with_date
-
 # 设置页面配置 - 保持最小化但必要的设置
 st.set_page_config(
     page_title=get_text("page_title"),
@@ -570,6 +566,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 在后台线程中导入 MediaPipe 并构建检测模型，页面无需等待即可交互
+warm_up_models(background=True)
+
 # CSS样式
 st.markdown("""
 <style>
@@ -645,11 +644,17 @@ if 'processed_images' not in st.session_state:
     st.session_state.processed_images = []
     st.session_state.successful_paths = []
     st.session_state.skipped_images = []
+    st.session_state.prefilter_skip_count = 0  # 最近载入任务中被预筛选跳过的图片数
     st.session_state.debug_images = []
+    st.session_state.frame_dates = []  # 每帧的日期（处理时日期表中的日期），保存时按当前格式生成文件名
     st.session_state.current_index = 0
-    st.session_state.stabilizer = None
+    st.session_state.landmark_cache = LandmarkCache()  # 会话内各任务共享的关键点缓存
     st.session_state.reference_image_path = None
+    st.session_state.reference = None  # 当前参考图片（ReferenceImage），会话持有引用，不受管理器淘汰影响
+    st.session_state.auto_reference = False  # 从批次关键点中自动选择参考帧
+    st.session_state.auto_reference_name = None  # 最近一次任务自动选择的参考帧
     st.session_state.folder_path = None
+    st.session_state.folder_index = None
     st.session_state.image_paths = []
     st.session_state.is_processed = False
     st.session_state.uploaded_files = []
@@ -664,6 +669,16 @@ if 'video_fps' not in st.session_state:
     st.session_state.video_loop = False
     st.session_state.video_filename = "aligned_video"
 
+if 'video_segmented' not in st.session_state:
+    st.session_state.video_segmented = False
+    st.session_state.video_crossfade = 0
+    st.session_state.video_hold_first = 0
+    st.session_state.video_hold_last = 0
+
+if 'animation_format' not in st.session_state:
+    st.session_state.animation_format = "GIF"
+    st.session_state.animation_max_side = 480
+
 # 日期设置的默认值
 if 'enable_date_naming' not in st.session_state:
     st.session_state.enable_date_naming = False
@@ -673,6 +688,8 @@ if 'enable_date_naming' not in st.session_state:
     st.session_state.date_source = "date_from_input"
     st.session_state.auto_sort_by_date = True
     st.session_state.date_parse_pattern = "YYYY-MM-DD"
+    st.session_state.custom_date_pattern = ""
+    st.session_state.date_pattern_registry = DEFAULT_PATTERN_REGISTRY.copy()  # 每个会话独立的模式表，自定义模式只在本会话中可选
     st.session_state.sort_order = "sort_ascending"
     st.session_state.date_position = "position_bottom_right"
     st.session_state.font_size = 8.0
@@ -680,20 +697,51 @@ if 'enable_date_naming' not in st.session_state:
     st.session_state.background_opacity = 0.0
     st.session_state.date_margin = 20
 
+# 后台任务的默认值
+if 'active_job_id' not in st.session_state:
+    st.session_state.active_job_id = None
+    st.session_state.job_notice = None
+    st.session_state.job_error = None
+    st.session_state.stage_metrics = None  # 当前或最近载入任务的阶段耗时（StageMetrics）
+
+# 预筛选设置的默认值
+if 'prefilter_enabled' not in st.session_state:
+    st.session_state.prefilter_enabled = False  # 默认关闭，与连拍查重一样由用户开启
+    st.session_state.prefilter_min_sharpness = 15.0
+
+# 连拍查重设置的默认值
+if 'dedup_enabled' not in st.session_state:
+    st.session_state.dedup_enabled = False
+    st.session_state.dedup_max_distance = DEFAULT_MAX_DISTANCE
+
+# 草稿预览设置的默认值
+if 'is_draft' not in st.session_state:
+    st.session_state.is_draft = False
+    st.session_state.draft_step = 10
+
+# 草稿预览输出的最长边（像素）
+DRAFT_MAX_SIDE = 384
+
+# 分段导出时每个视频分段的帧数
+VIDEO_SEGMENT_LENGTH = 60
+
+# 后台任务进度的刷新间隔（秒）
+JOB_POLL_INTERVAL = 1.0
+
 def initialize_stabilizer(output_size=(512, 512)):
-    """初始化HeadStabilizer实例"""
-    if st.session_state.stabilizer is None:
-        st.session_state.stabilizer = HeadStabilizer(
-            output_size=output_size,
-            preserve_background=st.session_state.preserve_bg,
-            force_reference_size=st.session_state.force_reference_size,
-            tilt_threshold=st.session_state.tilt_threshold
-        )
-    else:
-        # 更新已存在的实例
-        st.session_state.stabilizer.preserve_background = st.session_state.preserve_bg
-        st.session_state.stabilizer.force_reference_size = st.session_state.force_reference_size
-        st.session_state.stabilizer.tilt_threshold = st.session_state.tilt_threshold
+    """按当前设置创建HeadStabilizer实例并设置参考基准
+
+    每个后台任务使用独立的实例，关键点缓存在会话内共享（草稿预览的检测结果可复用）
+    """
+    stabilizer = HeadStabilizer(
+        output_size=output_size,
+        preserve_background=st.session_state.preserve_bg,
+        force_reference_size=st.session_state.force_reference_size,
+        tilt_threshold=st.session_state.tilt_threshold
+    )
+    stabilizer.landmark_cache = st.session_state.landmark_cache
+    apply_reference(stabilizer)
+    return stabilizer
 
 def load_image_from_path(image_path):
     """从路径加载图像，返回CV2和PIL格式"""
@@ -723,214 +771,292 @@ def load_image_from_bytes(image_bytes):
         st.error(f"无法加载图像: {e}")
         return None, None
 
+def upload_cache_key(data):
+    """上传图片的关键点缓存键：按内容哈希，名称和大小相同的不同图片不会共用检测结果"""
+    return f"upload:{file_content_hash(data)}"
+
+def apply_reference(stabilizer):
+    """根据当前设置为稳定器设置参考基准（自动参考帧模式下先使用默认基准，检测关键点后再选择）
+
+    参考图片的图像和关键点由参考图片管理器按内容缓存，每张参考图片只检测一次
+    """
+    reference = st.session_state.reference
+    if reference is not None and not st.session_state.auto_reference:
+        try:
+            reference.apply(stabilizer)
+            return
+        except ValueError:
+            st.warning(get_text("reference_no_face"))
+    stabilizer.set_reference_eyes_position(st.session_state.eye_distance)
+
+def create_prefilter():
+    """按当前设置创建预筛选器，未启用时返回 None"""
+    if not st.session_state.prefilter_enabled:
+        return None
+    return FramePrefilter(min_sharpness=st.session_state.prefilter_min_sharpness)
+
+def create_dedup():
+    """按当前设置创建查重器，未启用时返回 None"""
+    if not st.session_state.dedup_enabled:
+        return None
+    return DuplicatePruner(max_distance=st.session_state.dedup_max_distance)
+
+def collect_sources():
+    """当前输入集合：文件夹图片在前、上传图片在后，返回 [(名称, 路径或二进制数据, 关键点缓存键)]
+
+    上传图片的数据在提交时读出，任务不依赖会话
+    """
+    sources = [(path, path, LandmarkCache.key_for_path(path)) for path in st.session_state.image_paths]
+    for uploaded_file in st.session_state.uploaded_files:
+        data = uploaded_file.getvalue()
+        sources.append((uploaded_file.name, data, upload_cache_key(data)))
+    return sources
+
+def process_draft_preview():
+    """草稿预览：抽样部分图片，作为后台任务以低分辨率和快速插值对齐
+
+    与完整处理使用同一个对齐流程（run_alignment），关键点检测结果保存在会话共享的缓存中，正式处理时复用
+    """
+    if not st.session_state.image_paths and not st.session_state.uploaded_files:
+        st.error(get_text("no_images_to_process"))
+        return
+    
+    sources = collect_sources()
+    sampled = sources[::max(1, int(st.session_state.draft_step))]
+    
+    settings = dict(
+        stabilizer=initialize_stabilizer(),
+        sources=sampled,
+        filter_tilted=st.session_state.filter_tilted,
+        warp_quality="fast",
+        max_output_side=DRAFT_MAX_SIDE,
+        prefilter=create_prefilter(),
+        auto_reference=st.session_state.auto_reference
+    )
+    job = get_job_manager().submit(lambda job: run_alignment(job, **settings), total=len(sampled), kind=JOB_KIND_DRAFT)
+    st.session_state.active_job_id = job.id
+    st.session_state.stage_metrics = settings["stabilizer"].metrics
+    st.session_state.draft_total = len(sources)
+    # 重新运行页面，让按钮在任务运行期间保持禁用
+    st.rerun()
+
+def build_date_table(names=None, exif_sources=None):
+    """按当前日期设置计算日期表
+
+    默认为当前输入集合（文件夹图片在前、上传图片在后）；names/exif_sources 见 DateTable.resolve
+    """
+    if names is None:
+        names = list(st.session_state.image_paths) + [f.name for f in st.session_state.uploaded_files]
+        if st.session_state.date_source == DATE_SOURCE_METADATA:
+            exif_sources = list(st.session_state.image_paths) + [f.getvalue() for f in st.session_state.uploaded_files]
+    # 文件夹清单中已记录的EXIF日期无需再次读取；只有按EXIF取日期时才需要
+    known_dates = None
+    if st.session_state.folder_index and st.session_state.date_source == DATE_SOURCE_METADATA:
+        known_dates = st.session_state.folder_index.exif_dates()
+    return DateTable.resolve(
+        names,
+        exif_sources=exif_sources,
+        known_dates=known_dates,
+        source=st.session_state.date_source,
+        date_format=st.session_state.date_format,
+        parse_pattern=st.session_state.date_parse_pattern,
+        start_date=st.session_state.start_date,
+        interval_days=st.session_state.date_interval_days,
+        registry=st.session_state.date_pattern_registry
+    )
+
+def sort_sources_by_date(date_table):
+    """按日期表排序图片，返回与新顺序对应的日期表
+
+    文件夹图片和上传图片各自保持排序后的相对顺序，文件夹图片仍在前面
+    """
+    num_paths = len(st.session_state.image_paths)
+    order = date_table.sort_order(descending=st.session_state.sort_order == "sort_descending")
+    path_order = [i for i in order if i < num_paths]
+    upload_order = [i for i in order if i >= num_paths]
+    
+    st.session_state.image_paths = [st.session_state.image_paths[i] for i in path_order]
+    st.session_state.uploaded_files = [st.session_state.uploaded_files[i - num_paths] for i in upload_order]
+    return date_table.reordered(path_order + upload_order)
+
 def process_images():
-    """处理所有图片"""
+    """在后台任务中处理所有图片，界面通过轮询任务进度显示结果"""
     # 检查是否有图片可处理
     if not st.session_state.image_paths and not st.session_state.uploaded_files:
         st.error(get_text("no_images_to_process"))
         return
     
-    # 如果启用了日期排序，先对图片进行排序
-    if st.session_state.enable_date_naming and st.session_state.auto_sort_by_date and st.session_state.date_source != "date_from_input":
-        sorted_paths, sorted_uploads = sort_images_by_date(st.session_state.image_paths, st.session_state.uploaded_files)
-        st.session_state.image_paths = sorted_paths
-        st.session_state.uploaded_files = sorted_uploads
+    # 日期表：对整个输入集合只解析一次日期，排序、水印和文件名都从这里读取
+    date_table = build_date_table() if st.session_state.enable_date_naming else None
     
-    # 初始化或更新稳定器
-    initialize_stabilizer()
+    # 如果启用了日期排序，先对图片进行排序
+    if date_table and st.session_state.auto_sort_by_date and st.session_state.date_source != "date_from_input":
+        date_table = sort_sources_by_date(date_table)
+    
+    sources = collect_sources()
+    
+    # 水印精灵在整个任务内复用
+    watermarker = DateWatermarker(
+        st.session_state.date_position,
+        st.session_state.font_size,
+        st.session_state.font_color,
+        st.session_state.background_opacity,
+        st.session_state.date_margin
+    )
+    
+    stabilizer = initialize_stabilizer()
+    prefilter = create_prefilter()
+    dedup = create_dedup()
+    
+    # 断点：相同输入和参数的任务再次运行时跳过已完成的图片
+    fingerprint = job_fingerprint([cache_key for _, _, cache_key in sources], {
+        'reference': AUTO_REFERENCE if st.session_state.auto_reference else (st.session_state.reference.key if st.session_state.reference is not None else None),
+        'eye_distance': st.session_state.eye_distance,
+        'preserve_bg': st.session_state.preserve_bg,
+        'force_reference_size': st.session_state.force_reference_size,
+        'tilt_threshold': st.session_state.tilt_threshold,
+        'filter_tilted': st.session_state.filter_tilted,
+        'warp_quality': st.session_state.warp_quality,
+        'debug': st.session_state.debug_mode,
+        'prefilter': prefilter.settings() if prefilter else None,
+        'dedup': dedup.settings() if dedup else None,
+        'dates': [date_table.date_str_for(i, i) for i in range(len(sources))] if date_table else None,
+        'date_source': st.session_state.date_source if date_table else None,
+        'watermark': [
+            st.session_state.date_position,
+            st.session_state.font_size,
+            st.session_state.font_color,
+            st.session_state.background_opacity,
+            st.session_state.date_margin
+        ] if date_table else None,
+    })
+    checkpoint = BatchCheckpoint(get_job_manager().checkpoint_dir(fingerprint), fingerprint)
+    
+    settings = dict(
+        stabilizer=stabilizer,
+        sources=sources,
+        date_table=date_table,
+        watermarker=watermarker,
+        filter_tilted=st.session_state.filter_tilted,
+        warp_quality=st.session_state.warp_quality,
+        debug=st.session_state.debug_mode,
+        checkpoint=checkpoint,
+        prefilter=prefilter,
+        dedup=dedup,
+        auto_reference=st.session_state.auto_reference
+    )
+    job = get_job_manager().submit(lambda job: run_alignment(job, **settings), total=len(sources))
+    st.session_state.active_job_id = job.id
+    st.session_state.stage_metrics = stabilizer.metrics
+    st.session_state.is_draft = False
+    # 重新运行页面，让按钮在任务运行期间保持禁用
+    st.rerun()
+
+def format_skip_reason(reason):
+    """将任务记录的 [原因代码, 详情] 转换为当前语言的说明"""
+    if not isinstance(reason, (list, tuple)):
+        return reason
+    code, detail = reason
+    if code == SKIP_HEAD_TILT:
+        return f"{get_text('head_tilt_skipped')}: {detail}"
+    if code == SKIP_FAILED:
+        return get_text("processing_failed", "", detail)
+    return f"{get_text(code)}: {detail}" if detail else get_text(code)
+
+def load_job_results(job):
+    """将任务目录中的结果载入会话：会话只保存帧库，图像在显示、导出时才按序号从磁盘读取"""
+    frames = job.frames
+    st.session_state.processed_images = frames
+    st.session_state.successful_paths = [frame["source"] for frame in frames.frames]
+    st.session_state.frame_dates = [frames.frame_date(i) for i in range(len(frames))]
+    st.session_state.debug_images = job.debug_frames
+    st.session_state.skipped_images = [
+        (entry["source"], format_skip_reason(entry["reason"])) for entry in frames.skipped.values()
+    ]
+    st.session_state.prefilter_skip_count = sum(
+        1 for entry in frames.skipped.values()
+        if isinstance(entry["reason"], (list, tuple)) and entry["reason"][0] in PREFILTER_REASON_TEXT
+    )
+    st.session_state.is_draft = job.kind == JOB_KIND_DRAFT
+    st.session_state.is_processed = not st.session_state.is_draft
+    st.session_state.current_index = 0
+    st.session_state.stage_metrics = job.load_metrics() or st.session_state.stage_metrics
+    st.session_state.auto_reference_name = job.reference
+
+def format_job_current(current):
+    """任务当前步骤的说明：文件名原样显示，[代码, 参数...] 按当前语言格式化"""
+    if isinstance(current, (list, tuple)):
+        return get_text(current[0], *current[1:])
+    return current or ""
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_active_job():
+    """显示后台任务进度：作为片段定时刷新，不阻塞页面其余部分；任务结束后载入结果并重新运行整个页面"""
+    job_id = st.session_state.active_job_id
+    if job_id is None:
+        return
+    job = get_job_manager().get(job_id)
     
-    # 清空结果
-    st.session_state.processed_images = []
-    st.session_state.successful_paths = []
-    st.session_state.skipped_images = []
-    st.session_state.debug_images = []
+    if job is not None and job.is_active:
+        st.progress(job.progress)
+        st.text(get_text("processing_progress", job.done, job.total, format_job_current(job.current)))
+        if st.button(get_text("cancel_job")):
+            job.cancel()
+        return
     
-    # 设置参考图片
-    if st.session_state.reference_image_path:
-        ref_img = cv2.imread(st.session_state.reference_image_path)
-        if ref_img is not None:
-            st.session_state.stabilizer.set_reference_from_image(ref_img)
+    st.session_state.active_job_id = None
+    if job is not None:
+        if job.status == JOB_FAILED:
+            st.session_state.job_error = get_text("job_failed", job.error)
         else:
-            st.warning(get_text("reference_read_failed"))
-            st.session_state.stabilizer.set_reference_eyes_position(st.session_state.eye_distance)
-    else:
-        st.session_state.stabilizer.set_reference_eyes_position(st.session_state.eye_distance)
-    
-    # 创建进度条
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    # 处理从文件夹加载的图片
-    total_files = len(st.session_state.image_paths) + len(st.session_state.uploaded_files)
-    processed_images = []
-    successful_paths = []
-    debug_images = []
-    skipped_images = []
-    processed_count = 0
-    
-    # 首先处理从路径加载的图片
-    for i, img_path in enumerate(st.session_state.image_paths):
-        # 更新进度
-        processed_count += 1
-        progress = processed_count / total_files
-        progress_bar.progress(progress)
-        status_text.text(get_text("processing_progress", processed_count, total_files, os.path.basename(img_path)))
-        
-        try:
-            img = cv2.imread(img_path)
-            if img is None:
-                skipped_images.append((img_path, get_text("image_read_error")))
-                continue
-            
-            # 如果启用了头部倾斜筛选
-            if st.session_state.filter_tilted:
-                is_straight, tilt_info, reason = st.session_state.stabilizer.check_head_tilt(img)
-                if not is_straight:
-                    skipped_images.append((img_path, f"{get_text('head_tilt_skipped')}: {reason}"))
-                    continue
-            
-            # 处理图片
-            if st.session_state.debug_mode:
-                aligned, debug_img = st.session_state.stabilizer.align_and_crop_face(img, show_landmarks=True)
-                debug_images.append(debug_img)
-            else:
-                aligned = st.session_state.stabilizer.align_and_crop_face(img)
-            
-            # 添加日期水印（如果启用）
-            if st.session_state.enable_date_naming:
-                date_str = None
-                current_image_index = len(processed_images)  # 当前图片的索引
-                
-                # 根据不同的日期来源获取日期
-                if st.session_state.date_source == "date_from_input" and st.session_state.start_date:
-                    # 用户输入模式：按顺序递增
-                    current_date = st.session_state.start_date + timedelta(days=current_image_index * st.session_state.date_interval_days)
-                    
-                elif st.session_state.date_source == "date_from_filename":
-                    # 从文件名解析日期
-                    filename_to_parse = os.path.basename(img_path)
-                    current_date = parse_date_from_filename(filename_to_parse, st.session_state.date_parse_pattern)
-                        
-                elif st.session_state.date_source == "date_from_metadata":
-                    # 从EXIF数据获取日期
-                    current_date = get_exif_date(img_path)
-                else:
-                    current_date = None
-                
-                # 格式化日期字符串
-                if current_date:
-                    if st.session_state.date_format == "YYYY-MM-DD":
-                        date_str = current_date.strftime("%Y-%m-%d")
-                    elif st.session_state.date_format == "MM-DD-YYYY":
-                        date_str = current_date.strftime("%m-%d-%Y")
-                    else:  # DD-MM-YYYY
-                        date_str = current_date.strftime("%d-%m-%Y")
-                
-                # 添加水印
-                if date_str:
-                    aligned = add_date_watermark(
-                        aligned, date_str, 
-                        st.session_state.date_position,
-                        st.session_state.font_size,
-                        st.session_state.font_color,
-                        st.session_state.background_opacity,
-                        st.session_state.date_margin
-                    )
-            
-            processed_images.append(aligned)
-            successful_paths.append(img_path)
-            
-        except Exception as e:
-            skipped_images.append((img_path, get_text("processing_failed", "", str(e))))
-    
-    # 然后处理上传的图片
-    for i, uploaded_file in enumerate(st.session_state.uploaded_files):
-        # 更新进度
-        processed_count += 1
-        progress = processed_count / total_files
-        progress_bar.progress(progress)
-        status_text.text(get_text("processing_progress", processed_count, total_files, uploaded_file.name))
-        
-        try:
-            # 读取上传的图片
-            file_bytes = uploaded_file.getvalue()
-            img, _ = load_image_from_bytes(file_bytes)
-            
-            if img is None:
-                skipped_images.append((uploaded_file.name, get_text("image_read_error")))
-                continue
-            
-            # 如果启用了头部倾斜筛选
-            if st.session_state.filter_tilted:
-                is_straight, tilt_info, reason = st.session_state.stabilizer.check_head_tilt(img)
-                if not is_straight:
-                    skipped_images.append((uploaded_file.name, f"{get_text('head_tilt_skipped')}: {reason}"))
-                    continue
-            
-            # 处理图片
-            if st.session_state.debug_mode:
-                aligned, debug_img = st.session_state.stabilizer.align_and_crop_face(img, show_landmarks=True)
-                debug_images.append(debug_img)
-            else:
-                aligned = st.session_state.stabilizer.align_and_crop_face(img)
-            
-            # 添加日期水印（如果启用）
-            if st.session_state.enable_date_naming:
-                date_str = None
-                current_image_index = len(processed_images)  # 当前图片的索引
-                
-                # 根据不同的日期来源获取日期
-                if st.session_state.date_source == "date_from_input" and st.session_state.start_date:
-                    # 用户输入模式：按顺序递增
-                    current_date = st.session_state.start_date + timedelta(days=current_image_index * st.session_state.date_interval_days)
-                    
-                elif st.session_state.date_source == "date_from_filename":
-                    # 从文件名解析日期
-                    filename_to_parse = os.path.basename(uploaded_file.name)
-                    current_date = parse_date_from_filename(filename_to_parse, st.session_state.date_parse_pattern)
-                        
-                elif st.session_state.date_source == "date_from_metadata":
-                    # 从EXIF数据获取日期
-                    current_date = get_exif_date(uploaded_file.name)
-                else:
-                    current_date = None
-                
-                # 格式化日期字符串
-                if current_date:
-                    if st.session_state.date_format == "YYYY-MM-DD":
-                        date_str = current_date.strftime("%Y-%m-%d")
-                    elif st.session_state.date_format == "MM-DD-YYYY":
-                        date_str = current_date.strftime("%m-%d-%Y")
-                    else:  # DD-MM-YYYY
-                        date_str = current_date.strftime("%d-%m-%Y")
-                
-                # 添加水印
-                if date_str:
-                    aligned = add_date_watermark(
-                        aligned, date_str, 
-                        st.session_state.date_position,
-                        st.session_state.font_size,
-                        st.session_state.font_color,
-                        st.session_state.background_opacity,
-                        st.session_state.date_margin
-                    )
-            
-            processed_images.append(aligned)
-            successful_paths.append(uploaded_file.name)  # 存储文件名而不是路径
-            
-        except Exception as e:
-            skipped_images.append((uploaded_file.name, get_text("processing_failed", "", str(e))))
-    
-    # 保存结果
-    st.session_state.processed_images = processed_images
-    st.session_state.successful_paths = successful_paths
-    st.session_state.debug_images = debug_images
-    st.session_state.skipped_images = skipped_images
-    st.session_state.is_processed = True
-    
-    # 重置当前索引
-    if processed_images:
-        st.session_state.current_index = 0
+            load_job_results(job)
+            if job.status == JOB_CANCELLED:
+                st.session_state.job_notice = get_text("job_cancelled", len(st.session_state.processed_images))
+    # 重新运行整个页面，让结果区显示载入的结果并恢复按钮
+    st.rerun()
+
+def show_stage_metrics():
+    """在侧边栏显示各阶段耗时（按总耗时排序）和事件计数，可下载 JSON / Prometheus 文本"""
+    metrics = st.session_state.stage_metrics
+    rows = metrics.summary_rows() if metrics is not None else []
+    if not rows:
+        st.caption(get_text("stage_metrics_empty"))
+        return
+    st.table([
+        {
+            get_text("metrics_stage"): stage,
+            get_text("metrics_count"): count,
+            get_text("metrics_total"): f"{total:.2f}",
+            get_text("metrics_mean"): f"{mean_ms:.1f}",
+            get_text("metrics_share"): f"{share:.0%}",
+        }
+        for stage, count, total, mean_ms, share in rows
+    ])
+    counters = metrics.snapshot()["counters"]
+    if counters:
+        st.caption(get_text("metrics_counters", ", ".join(f"{name}={value}" for name, value in sorted(counters.items()))))
+    metrics_col1, metrics_col2 = st.columns(2)
+    with metrics_col1:
+        st.download_button(get_text("download_metrics_json"), metrics.to_json(indent=1),
+                           file_name="stage_metrics.json", mime="application/json")
+    with metrics_col2:
+        st.download_button(get_text("download_metrics_prometheus"), metrics.to_prometheus(),
+                           file_name="stage_metrics.prom", mime="text/plain")
+
+def build_export_frames(images, fps, loop):
+    """按导出设置构建帧序列，返回 (播放顺序, 帧序列, 输出帧率)"""
+    # 播放顺序：按索引引用已处理的图片，循环时往返播放，不复制帧列表
+    schedule = FrameSchedule(
+        len(images),
+        mode=SCHEDULE_PING_PONG if loop else SCHEDULE_FORWARD,
+        hold_first=st.session_state.video_hold_first,
+        hold_last=st.session_state.video_hold_last
+    )
+    
+    # 可选的淡入淡出插帧：过渡帧在编码时逐帧生成，帧率按插帧数同比提高以保持每张照片的停留时间
+    crossfade_steps = st.session_state.video_crossfade
+    frames = CrossfadeSequence(lambda i: images[schedule[i]], len(schedule), crossfade_steps)
+    return schedule, frames, fps * (crossfade_steps + 1)
 
 def export_video():
     """导出处理后的图片为视频到程序运行目录"""
@@ -948,14 +1074,7 @@ def export_video():
         st.error(get_text("invalid_filename"))
         return
     
-    # 映射质量选项到编码器参数
-    quality_map = {
-        "低": {"codec": "XVID", "ext": "avi"},
-        "中": {"codec": "MP4V", "ext": "mp4"},
-        "高": {"codec": "H264", "ext": "mp4"}
-    }
-    
-    codec_info = quality_map.get(quality, quality_map["高"])
+    codec_info = VIDEO_CODECS.get(quality, VIDEO_CODECS["高"])
     
     # 使用当前程序运行目录
     current_dir = os.getcwd()
@@ -970,43 +1089,51 @@ def export_video():
     status_text.text(get_text("start_export"))
     
     try:
-        # 获取图像尺寸
-        h, w = st.session_state.processed_images[0].shape[:2]
-        
-        # 设置编解码器
-        if codec_info["codec"] == "H264":
-            fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264编码
-        elif codec_info["codec"] == "MP4V":
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # MP4V编码
+        images = st.session_state.processed_images
+        
+        schedule, frames, output_fps = build_export_frames(images, fps, loop)
+        total_frames = len(frames)
+        
+        if st.session_state.video_segmented and find_ffmpeg() is not None:
+            # 分段导出：只重新编码内容发生变化的分段，其余分段直接复用
+            image_hashes = images.frame_hashes()
+            video = SegmentedVideo(
+                output_path,
+                os.path.join(output_dir, ".segments", f"{filename}.{codec_info['ext']}"),
+                fps=output_fps,
+                segment_length=VIDEO_SEGMENT_LENGTH,
+                fourcc=codec_info["fourcc"]
+            )
+            
+            def update_progress(done, total):
+                progress_bar.progress(done / total)
+                status_text.text(get_text("export_segment_progress", done, total))
+            
+            encoded, reused = video.export(
+                total_frames,
+                frames.read,
+                frame_hashes=frames.frame_hashes([image_hashes[i] for i in schedule]),
+                progress=update_progress
+            )
+            st.info(get_text("segments_reused", encoded, reused))
         else:
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')  # AVI编码
+            if st.session_state.video_segmented:
+                st.info(get_text("ffmpeg_not_found"))
             
-        # 创建VideoWriter对象
-        video = cv2.VideoWriter(output_path, fourcc, fps, (w, h))
-        
-        # 准备图像序列
-        images_to_write = st.session_state.processed_images.copy()
-        
-        # 如果启用循环，添加反向序列
-        if loop:
-            reversed_images = st.session_state.processed_images.copy()
-            reversed_images.reverse()
-            # 删除第一帧和最后一帧以避免重复
-            if len(reversed_images) > 2:
-                reversed_images = reversed_images[1:-1]
-            images_to_write.extend(reversed_images)
-        
-        # 写入视频帧
-        total_frames = len(images_to_write)
-        for i, img in enumerate(images_to_write):
-            video.write(img)
-            # 更新进度
-            progress = (i + 1) / total_frames
-            progress_bar.progress(progress)
-            status_text.text(get_text("export_progress", i+1, total_frames))
-        
-        # 释放视频写入器
-        video.release()
+            # 获取图像尺寸
+            h, w = images[0].shape[:2]
+            video = open_video_writer(output_path, codec_info["fourcc"], output_fps, (w, h))
+            
+            # 写入视频帧
+            for i in range(total_frames):
+                video.write(frames.read(i))
+                # 更新进度
+                progress = (i + 1) / total_frames
+                progress_bar.progress(progress)
+                status_text.text(get_text("export_progress", i+1, total_frames))
+            
+            # 释放视频写入器
+            video.release()
         
         # 更新状态
         st.success(get_text("video_exported"))
@@ -1023,6 +1150,89 @@ def export_video():
     except Exception as e:
         st.error(get_text("export_failed", str(e)))
 
+def export_animated_image():
+    """导出处理后的图片为动图（GIF/WebP）到程序运行目录"""
+    if not st.session_state.processed_images:
+        st.error(get_text("no_images_to_export"))
+        return
+    
+    filename = st.session_state.video_filename
+    if not filename:
+        st.error(get_text("invalid_filename"))
+        return
+    
+    format_info = ANIMATION_FORMATS[st.session_state.animation_format]
+    
+    # 使用当前程序运行目录
+    output_dir = os.path.join(os.getcwd(), "deforum_videos")
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"{filename}.{format_info['ext']}")
+    
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    status_text.text(get_text("start_export"))
+    
+    try:
+        _, frames, output_fps = build_export_frames(
+            st.session_state.processed_images, st.session_state.video_fps, st.session_state.video_loop
+        )
+        
+        # WebP 需要在内存中保留全部帧，超过上限时提前提示而不是编码到一半失败
+        if st.session_state.animation_format == "WebP":
+            h, w = st.session_state.processed_images[0].shape[:2]
+            size = scaled_size(w, h, st.session_state.animation_max_side)
+            if len(frames) > webp_frame_limit(size):
+                progress_bar.empty()
+                status_text.empty()
+                st.error(get_text("webp_too_many_frames", size[0], size[1], webp_frame_limit(size), len(frames)))
+                return
+        
+        def update_progress(done, total):
+            progress_bar.progress(done / total)
+            status_text.text(get_text("export_progress", done, total))
+        
+        export_animation(
+            output_path,
+            frames.read,
+            len(frames),
+            output_fps,
+            fmt=st.session_state.animation_format,
+            max_side=st.session_state.animation_max_side,
+            progress=update_progress
+        )
+        
+        st.success(get_text("animation_exported"))
+        
+        with open(output_path, "rb") as file:
+            st.download_button(
+                label=get_text("download_animation", format_info['ext']),
+                data=file,
+                file_name=f"{filename}.{format_info['ext']}",
+                mime=format_info['mime']
+            )
+    
+    except Exception as e:
+        st.error(get_text("export_failed", str(e)))
+
+def resolve_frame_dates():
+    """已处理各帧的日期
+
+    优先使用处理时日期表中的日期（与水印一致）；处理时未启用日期命名时按当前日期设置解析
+    """
+    dates = st.session_state.frame_dates
+    if any(date is not None for date in dates):
+        return dates
+    names = st.session_state.successful_paths
+    exif_sources = None
+    if st.session_state.date_source == DATE_SOURCE_METADATA:
+        uploads = {f.name: f for f in st.session_state.uploaded_files}
+        exif_sources = [
+            name if os.path.isfile(name) else uploads[name].getvalue() if name in uploads else None
+            for name in names
+        ]
+    date_table = build_date_table(names, exif_sources)
+    return [date_table.date_for(i, i) for i in range(len(names))]
+
 def save_all_images():
     """保存所有处理过的图片到程序运行目录"""
     if not st.session_state.processed_images:
@@ -1040,6 +1250,8 @@ def save_all_images():
     
     count = 0
     total = len(st.session_state.processed_images)
+    # 文件名中的日期在保存时按当前日期格式生成
+    frame_dates = resolve_frame_dates() if st.session_state.enable_date_naming else []
     
     for i, img in enumerate(st.session_state.processed_images):
         try:
@@ -1057,42 +1269,7 @@ def save_all_images():
             
             # 生成文件名
             if st.session_state.enable_date_naming:
-                date_str = None
-                
-                # 根据不同的日期来源获取日期
-                if st.session_state.date_source == "date_from_input" and st.session_state.start_date:
-                    # 用户输入模式：按顺序递增
-                    current_date = st.session_state.start_date + timedelta(days=i * st.session_state.date_interval_days)
-                    
-                elif st.session_state.date_source == "date_from_filename":
-                    # 从文件名解析日期
-                    if i < len(st.session_state.successful_paths):
-                        path_or_name = st.session_state.successful_paths[i]
-                        filename_to_parse = os.path.basename(path_or_name) if os.path.isfile(path_or_name) else path_or_name
-                        current_date = parse_date_from_filename(filename_to_parse, st.session_state.date_parse_pattern)
-                    else:
-                        current_date = None
-                        
-                elif st.session_state.date_source == "date_from_metadata":
-                    # 从EXIF数据获取日期
-                    if i < len(st.session_state.successful_paths):
-                        path_or_name = st.session_state.successful_paths[i]
-                        if os.path.isfile(path_or_name):
-                            current_date = get_exif_date(path_or_name)
-                        else:
-                            # 对于上传文件，尝试从文件名解析
-                            current_date = parse_date_from_filename(path_or_name, st.session_state.date_parse_pattern)
-                    else:
-                        current_date = None
-                
-                # 格式化日期字符串
-                if current_date:
-                    if st.session_state.date_format == "YYYY-MM-DD":
-                        date_str = current_date.strftime("%Y-%m-%d")
-                    elif st.session_state.date_format == "MM-DD-YYYY":
-                        date_str = current_date.strftime("%m-%d-%Y")
-                    else:  # DD-MM-YYYY
-                        date_str = current_date.strftime("%d-%m-%Y")
+                date_str = format_date(frame_dates[i], st.session_state.date_format) if i < len(frame_dates) else None
                 
                 # 生成最终文件名
                 if date_str:
@@ -1265,10 +1442,9 @@ with st.sidebar:
             if folder_path and folder_path != st.session_state.folder_path:
                 if os.path.exists(folder_path):
                     st.session_state.folder_path = folder_path
-                    # 查找所有图片
-                    st.session_state.image_paths = glob.glob(os.path.join(folder_path, "*.jpg")) + \
-                                                  glob.glob(os.path.join(folder_path, "*.jpeg")) + \
-                                                  glob.glob(os.path.join(folder_path, "*.png"))
+                    # 递归查找所有图片（扩展名不区分大小写），只读取目录项；清单保存在程序的清单目录中
+                    st.session_state.folder_index = index_folder(folder_path)
+                    st.session_state.image_paths = st.session_state.folder_index.paths()
                     
                     if st.session_state.image_paths:
                         st.success(get_text("found_count", len(st.session_state.image_paths)))
@@ -1283,6 +1459,14 @@ with st.sidebar:
     with st.expander(get_text("reference_settings"), expanded=True):
         st.markdown(f'<div class="sidebar-section-title">{get_text("reference_image")}</div>', unsafe_allow_html=True)
         
+        st.session_state.auto_reference = st.checkbox(
+            get_text("auto_reference"),
+            value=st.session_state.auto_reference,
+            help=get_text("auto_reference_help")
+        )
+        if st.session_state.auto_reference and st.session_state.auto_reference_name:
+            st.caption(get_text("auto_reference_selected", st.session_state.auto_reference_name))
+        
         # 也允许上传参考图片
         ref_tab1, ref_tab2 = st.tabs([get_text("upload_reference"), get_text("specify_reference_path")])
         
@@ -1294,20 +1478,13 @@ with st.sidebar:
             )
             
             if uploaded_ref:
-                # 保存上传的参考图片到临时文件
-                ref_bytes = uploaded_ref.getvalue()
-                ref_cv, ref_pil = load_image_from_bytes(ref_bytes)
+                # 参考图片只在内存中保存，按内容哈希复用已解码的图像和已检测的关键点
+                reference = get_reference_manager().add_bytes(uploaded_ref.getvalue(), uploaded_ref.name)
                 
-                if ref_cv is not None:
-                    temp_dir = os.path.join(os.path.expanduser("~"), ".temp_ref_images")
-                    os.makedirs(temp_dir, exist_ok=True)
-                    temp_ref_path = os.path.join(temp_dir, f"ref_{uploaded_ref.name}")
-                    cv2.imwrite(temp_ref_path, ref_cv)
-                    
-                    st.session_state.reference_image_path = temp_ref_path
-                    if ref_pil:
-                        st.image(ref_pil, caption=get_text("reference_image"), width=150)
-                        st.success(get_text("reference_uploaded", uploaded_ref.name))
+                if reference is not None:
+                    st.session_state.reference = reference
+                    st.image(reference.image, channels="BGR", caption=get_text("reference_image"), width=150)
+                    st.success(get_text("reference_uploaded", uploaded_ref.name))
                 else:
                     st.error(get_text("reference_read_error"))
         
@@ -1322,9 +1499,10 @@ with st.sidebar:
             if reference_path and reference_path != st.session_state.reference_image_path:
                 if os.path.exists(reference_path):
                     st.session_state.reference_image_path = reference_path
-                    ref_cv, ref_pil = load_image_from_path(reference_path)
-                    if ref_pil:
-                        st.image(ref_pil, caption=get_text("reference_image"), width=150)
+                    reference = get_reference_manager().add_path(reference_path)
+                    if reference is not None:
+                        st.session_state.reference = reference
+                        st.image(reference.image, channels="BGR", caption=get_text("reference_image"), width=150)
                         st.success(get_text("reference_selected", os.path.basename(reference_path)))
                     else:
                         st.error(get_text("reference_read_error", reference_path))
@@ -1357,13 +1535,21 @@ with st.sidebar:
             st.session_state.tilt_threshold = 5
             st.session_state.preserve_bg = False
             st.session_state.debug_mode = False
+            st.session_state.warp_quality = "standard"
+            st.session_state.prefilter_min_sharpness = 15.0
+            st.session_state.dedup_enabled = False
             
-            # 只保留头部倾斜筛选这一个重要选项
+            # 只保留头部倾斜筛选和预筛选两个选项
             st.session_state.filter_tilted = st.checkbox(
                 get_text("filter_tilted"), 
                 value=True,
                 help=get_text("filter_tilted_help")
             )
+            st.session_state.prefilter_enabled = st.checkbox(
+                get_text("prefilter_enabled"),
+                value=st.session_state.prefilter_enabled,
+                help=get_text("prefilter_enabled_help")
+            )
             
             st.info(get_text("smart_mode_info"))
             
@@ -1398,6 +1584,37 @@ with st.sidebar:
                 help=get_text("tilt_threshold_help")
             )
             
+            # 预筛选
+            st.session_state.prefilter_enabled = st.checkbox(
+                get_text("prefilter_enabled"),
+                value=st.session_state.prefilter_enabled,
+                help=get_text("prefilter_enabled_help")
+            )
+            st.session_state.prefilter_min_sharpness = st.slider(
+                get_text("prefilter_sharpness"),
+                min_value=0.0,
+                max_value=100.0,
+                value=float(st.session_state.prefilter_min_sharpness),
+                step=1.0,
+                disabled=not st.session_state.prefilter_enabled,
+                help=get_text("prefilter_sharpness_help")
+            )
+            
+            # 连拍查重
+            st.session_state.dedup_enabled = st.checkbox(
+                get_text("dedup_enabled"),
+                value=st.session_state.dedup_enabled,
+                help=get_text("dedup_enabled_help")
+            )
+            st.session_state.dedup_max_distance = st.slider(
+                get_text("dedup_distance"),
+                min_value=0,
+                max_value=12,
+                value=st.session_state.dedup_max_distance,
+                disabled=not st.session_state.dedup_enabled,
+                help=get_text("dedup_distance_help")
+            )
+            
             # 其他选项
             st.subheader(get_text("other_options"))
             st.session_state.preserve_bg = st.checkbox(
@@ -1410,6 +1627,18 @@ with st.sidebar:
                 value=False,
                 help=get_text("debug_mode_help")
             )
+            
+            # 插值质量档位 - 使用映射避免多语言问题
+            warp_quality_keys = ["fast", "standard", "high"]
+            warp_quality_options = [get_text(f"warp_quality_{key}") for key in warp_quality_keys]
+            selected_warp_quality = st.radio(
+                get_text("warp_quality"),
+                options=warp_quality_options,
+                index=1,
+                horizontal=True,
+                help=get_text("warp_quality_help")
+            )
+            st.session_state.warp_quality = warp_quality_keys[warp_quality_options.index(selected_warp_quality)]
     
     st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
     
@@ -1459,10 +1688,28 @@ with st.sidebar:
                 
             elif st.session_state.date_source == "date_from_filename":
                 # 从文件名解析日期
+                # 自定义模式注册到模式表后即可在下拉框中选择
+                st.session_state.custom_date_pattern = st.text_input(
+                    get_text("custom_date_pattern"),
+                    value=st.session_state.custom_date_pattern,
+                    placeholder=get_text("custom_date_pattern_placeholder"),
+                    help=get_text("custom_date_pattern_help")
+                ).strip()
+                if st.session_state.custom_date_pattern:
+                    try:
+                        st.session_state.date_pattern_registry.register(st.session_state.custom_date_pattern)
+                        st.caption(get_text(
+                            "custom_date_pattern_example",
+                            st.session_state.date_pattern_registry.format(datetime.now(), st.session_state.custom_date_pattern)
+                        ))
+                    except ValueError:
+                        st.error(get_text("invalid_date_pattern", st.session_state.custom_date_pattern))
+                
+                pattern_options = st.session_state.date_pattern_registry.names()
                 st.session_state.date_parse_pattern = st.selectbox(
                     get_text("date_parse_pattern"),
-                    options=["YYYY-MM-DD", "YYYY_MM_DD", "YYYYMMDD", "MM-DD-YYYY", "DD-MM-YYYY"],
-                    index=["YYYY-MM-DD", "YYYY_MM_DD", "YYYYMMDD", "MM-DD-YYYY", "DD-MM-YYYY"].index(st.session_state.date_parse_pattern),
+                    options=pattern_options,
+                    index=pattern_options.index(st.session_state.date_parse_pattern) if st.session_state.date_parse_pattern in pattern_options else 0,
                     help=get_text("date_parse_pattern_help")
                 )
                 
@@ -1626,11 +1873,60 @@ with st.sidebar:
             help=get_text("loop_playback_help")
         )
         
+        hold_col1, hold_col2 = st.columns(2)
+        with hold_col1:
+            st.session_state.video_hold_first = st.number_input(
+                get_text("hold_first_frames"),
+                min_value=0,
+                max_value=100,
+                value=st.session_state.video_hold_first,
+                help=get_text("hold_frames_help")
+            )
+        with hold_col2:
+            st.session_state.video_hold_last = st.number_input(
+                get_text("hold_last_frames"),
+                min_value=0,
+                max_value=100,
+                value=st.session_state.video_hold_last,
+                help=get_text("hold_frames_help")
+            )
+        
+        st.session_state.video_crossfade = st.slider(
+            get_text("crossfade_frames"),
+            min_value=0,
+            max_value=7,
+            value=st.session_state.video_crossfade,
+            help=get_text("crossfade_frames_help")
+        )
+        
         st.session_state.video_filename = st.text_input(
             get_text("filename"), 
             value=st.session_state.video_filename,
             placeholder=get_text("filename_placeholder")
         )
+        
+        st.session_state.video_segmented = st.checkbox(
+            get_text("segmented_export"),
+            value=st.session_state.video_segmented,
+            help=get_text("segmented_export_help")
+        )
+        
+        anim_col1, anim_col2 = st.columns(2)
+        with anim_col1:
+            st.session_state.animation_format = st.selectbox(
+                get_text("animation_format"),
+                options=list(ANIMATION_FORMATS.keys()),
+                index=list(ANIMATION_FORMATS.keys()).index(st.session_state.animation_format)
+            )
+        with anim_col2:
+            st.session_state.animation_max_side = st.number_input(
+                get_text("animation_max_side"),
+                min_value=64,
+                max_value=2048,
+                step=32,
+                value=st.session_state.animation_max_side,
+                help=get_text("animation_max_side_help")
+            )
     
     st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
     
@@ -1641,11 +1937,28 @@ with st.sidebar:
         if st.button(
             get_text("process_all"), 
             type="primary", 
-            disabled=not has_images,
+            disabled=not has_images or st.session_state.active_job_id is not None,
             help=get_text("process_all_help")
         ):
             process_images()
         
+        draft_col1, draft_col2 = st.columns(2)
+        with draft_col1:
+            st.session_state.draft_step = st.number_input(
+                get_text("draft_step"),
+                min_value=1,
+                max_value=100,
+                value=st.session_state.draft_step,
+                help=get_text("draft_step_help")
+            )
+        with draft_col2:
+            if st.button(
+                get_text("draft_preview"),
+                disabled=not has_images or st.session_state.active_job_id is not None,
+                help=get_text("draft_preview_help")
+            ):
+                process_draft_preview()
+        
         nav_col1, nav_col2 = st.columns(2)
         with nav_col1:
             if st.button(
@@ -1667,7 +1980,7 @@ with st.sidebar:
         with action_col1:
             if st.button(
                 get_text("save_all"), 
-                disabled=not st.session_state.processed_images,
+                disabled=not st.session_state.processed_images or st.session_state.is_draft,
                 help=get_text("save_all_help")
             ):
                 save_all_images()
@@ -1675,17 +1988,54 @@ with st.sidebar:
         with action_col2:
             if st.button(
                 get_text("export_video"), 
-                disabled=not st.session_state.processed_images,
+                disabled=not st.session_state.processed_images or st.session_state.is_draft,
                 help=get_text("export_video_help")
             ):
                 export_video()
+        
+        if st.button(
+            get_text("export_animation"),
+            disabled=not st.session_state.processed_images or st.session_state.is_draft,
+            help=get_text("export_animation_help")
+        ):
+            export_animated_image()
+        
+        # 之前的任务（例如浏览器断开期间完成的任务）可以重新载入结果
+        finished_jobs = [job for job in get_job_manager().list_jobs() if not job.is_active and job.kind != JOB_KIND_DRAFT]
+        if finished_jobs:
+            job_labels = {job.id: f"{job.id} · {get_text('job_status_' + job.status)} · {job.done}/{job.total}" for job in finished_jobs}
+            job_col1, job_col2 = st.columns([3, 1])
+            with job_col1:
+                selected_job_id = st.selectbox(
+                    get_text("recent_jobs"),
+                    options=list(job_labels.keys()),
+                    format_func=job_labels.get
+                )
+            with job_col2:
+                if st.button(get_text("load_job"), help=get_text("load_job_help")):
+                    load_job_results(get_job_manager().get(selected_job_id))
+    
+    # 阶段耗时（任务结束后显示载入任务的统计）
+    with st.expander(get_text("stage_metrics"), expanded=False):
+        show_stage_metrics()
     
     # 版本信息
     st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
     st.caption(get_text("version"))
 
 # 主区域 - 仅显示图片和结果
+# 后台任务进度显示在结果上方
+job_container = st.container()
+if st.session_state.job_notice:
+    job_container.warning(st.session_state.job_notice)
+    st.session_state.job_notice = None
+if st.session_state.job_error:
+    job_container.error(st.session_state.job_error)
+    st.session_state.job_error = None
+
 if st.session_state.processed_images:
+    if st.session_state.is_draft:
+        st.info(get_text("draft_notice", len(st.session_state.processed_images), st.session_state.draft_total))
     st.write(f"#### {get_text('display_count', st.session_state.current_index + 1, len(st.session_state.processed_images))}")
     show_current_image()
     
@@ -1721,6 +2071,13 @@ else:
         """, unsafe_allow_html=True)
 
 # 显示跳过的图片
+if st.session_state.prefilter_skip_count:
+    st.warning(get_text("prefilter_skip_count", st.session_state.prefilter_skip_count))
 if st.session_state.skipped_images:
     with st.expander(get_text('skipped_images', len(st.session_state.skipped_images))):
-        show_skipped_images() 
\ No newline at end of file
+        show_skipped_images() 
+
+# 后台任务进度片段：只有片段定时刷新，页面其余部分不随之重新运行
+if st.session_state.active_job_id:
+    with job_container:
+        show_active_job()
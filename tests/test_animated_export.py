@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import animated_export
+from animated_export import build_global_palette, export_animation, webp_frame_limit
+
+
+def _frame(width, height, value):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def test_palette_accepts_frames_of_different_sizes():
+    frames = [_frame(160, 120, 40), _frame(120, 160, 200)]
+    palette = build_global_palette(lambda i: frames[i], len(frames))
+    assert palette.mode == "P"
+
+
+def test_gif_export_with_mixed_frame_sizes(tmp_path):
+    frames = [_frame(160, 120, 40), _frame(120, 160, 200), _frame(160, 120, 120)]
+    path = export_animation(str(tmp_path / "out.gif"), lambda i: frames[i], len(frames), fps=4)
+    with Image.open(path) as image:
+        assert image.n_frames == 3
+        assert image.size == (160, 120)
+
+
+def test_webp_export_rejects_too_many_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr(animated_export, "WEBP_MAX_BUFFER_BYTES", 10 * 10 * 3 * 2)
+    assert webp_frame_limit((10, 10)) == 2
+    frames = [_frame(10, 10, i * 50) for i in range(3)]
+    with pytest.raises(ValueError):
+        export_animation(str(tmp_path / "out.webp"), lambda i: frames[i], len(frames), fps=4, fmt="WebP")
+    assert not (tmp_path / "out.webp").exists()
@@ -0,0 +1,34 @@
+import os
+from types import SimpleNamespace
+
+from checkpoint import BatchCheckpoint
+from face_landmarks import LANDMARK_NAMES, LandmarkCache
+
+
+def _landmarks():
+    return {name: (float(i), float(i)) for i, name in enumerate(LANDMARK_NAMES)}
+
+
+def test_attach_restores_and_merges_the_caller_cache(tmp_path):
+    cache = LandmarkCache()
+    cache.put("existing", None)
+    stabilizer = SimpleNamespace(landmark_cache=cache)
+    checkpoint = BatchCheckpoint(str(tmp_path / "ckpt"), "fingerprint")
+
+    with checkpoint.attach(stabilizer):
+        assert stabilizer.landmark_cache is checkpoint.landmark_cache
+        assert "existing" in stabilizer.landmark_cache
+        stabilizer.landmark_cache.put("detected", _landmarks())
+
+    assert stabilizer.landmark_cache is cache
+    assert "detected" in cache
+    checkpoint.save()
+    assert "detected" in LandmarkCache(os.path.join(str(tmp_path / "ckpt"), "landmarks.npz"))
+
+
+def test_remove_deletes_checkpoint_directory(tmp_path):
+    checkpoint = BatchCheckpoint(str(tmp_path / "ckpt"), "fingerprint")
+    checkpoint.record_skip(0, ["reason", ""])
+    checkpoint.save()
+    checkpoint.remove()
+    assert not (tmp_path / "ckpt").exists()
@@ -0,0 +1,93 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from date_resolver import (
+    BUILTIN_DATE_PATTERNS, DATE_PARSE_CACHE_SIZE, DATE_SOURCE_FILENAME, DEFAULT_PATTERN_REGISTRY,
+    DateTable, DatePatternRegistry, argsort_dates, compile_date_template, parse_filename_datetime
+)
+
+
+@pytest.mark.parametrize("template", BUILTIN_DATE_PATTERNS)
+def test_builtin_patterns_round_trip(template):
+    registry = DatePatternRegistry()
+    value = datetime(2024, 1, 31)
+    filename = f"selfie_{registry.format(value, template)}.jpg"
+    assert registry.parse(filename, template) == value.date()
+
+
+def test_custom_pattern_round_trip_with_time():
+    registry = DatePatternRegistry()
+    registry.register("IMG_YYYYMMDD_HHMMSS")
+    value = datetime(2023, 12, 5, 8, 15, 42)
+    filename = registry.format(value, "IMG_YYYYMMDD_HHMMSS") + ".JPG"
+    assert filename == "IMG_20231205_081542.JPG"
+    assert registry.parse_datetime(filename, "IMG_YYYYMMDD_HHMMSS") == value
+
+
+def test_invalid_templates_are_rejected():
+    registry = DatePatternRegistry()
+    with pytest.raises(ValueError):
+        registry.register("YYYY-MM")
+    with pytest.raises(ValueError):
+        compile_date_template("YYYY-DD-DD-MM")
+    assert "YYYY-MM" not in registry
+
+
+def test_invalid_dates_and_unknown_patterns_parse_to_none():
+    registry = DatePatternRegistry()
+    assert registry.parse("2024-02-30.jpg", "YYYY-MM-DD") is None
+    assert registry.parse("no_date_here.jpg", "YYYY-MM-DD") is None
+    assert registry.parse("IMG_20240101_120000.jpg", "IMG_YYYYMMDD_HHMMSS") is None
+
+
+def test_session_registries_do_not_leak_custom_patterns():
+    session_a = DEFAULT_PATTERN_REGISTRY.copy()
+    session_b = DEFAULT_PATTERN_REGISTRY.copy()
+    session_a.register("PXL_YYYYMMDD")
+    assert "PXL_YYYYMMDD" in session_a.names()
+    assert "PXL_YYYYMMDD" not in session_b.names()
+    assert "PXL_YYYYMMDD" not in DEFAULT_PATTERN_REGISTRY.names()
+
+
+def test_parse_cache_is_bounded():
+    assert parse_filename_datetime.cache_info().maxsize == DATE_PARSE_CACHE_SIZE
+
+
+def test_parse_many_and_argsort_keep_undated_last():
+    registry = DatePatternRegistry()
+    names = ["b_2024-03-01.jpg", "x.jpg", "a_2024-01-15.jpg", "y.jpg", "c_2024-02-10.jpg"]
+    values = registry.parse_many(names, "YYYY-MM-DD")
+    assert np.isnat(values[1]) and np.isnat(values[3])
+    assert argsort_dates(values).tolist() == [2, 4, 0, 1, 3]
+    assert argsort_dates(values, descending=True).tolist() == [0, 4, 2, 1, 3]
+
+
+def test_date_table_from_filenames_sorts_and_reorders():
+    names = ["/photos/2024-03-01.jpg", "/photos/2024-01-15.jpg", "/photos/misc.jpg"]
+    table = DateTable.resolve(names, source=DATE_SOURCE_FILENAME, parse_pattern="YYYY-MM-DD",
+                              date_format="DD-MM-YYYY")
+    assert table.input_dates == [date(2024, 3, 1), date(2024, 1, 15), None]
+    order = table.sort_order()
+    assert order == [1, 0, 2]
+    reordered = table.reordered(order)
+    assert reordered.date_str_for(0, 0) == "15-01-2024"
+    assert reordered.date_str_for(2, 0) is None
+
+
+def test_date_table_uses_session_registry():
+    registry = DatePatternRegistry()
+    registry.register("IMG_YYYYMMDD_HHMMSS")
+    table = DateTable.resolve(["IMG_20240102_235959.jpg"], source=DATE_SOURCE_FILENAME,
+                              parse_pattern="IMG_YYYYMMDD_HHMMSS", registry=registry)
+    assert table.input_dates == [date(2024, 1, 2)]
+    assert table.sort_values[0] == np.datetime64("2024-01-02T23:59:59")
+
+
+def test_date_table_from_input_counts_from_start_date():
+    table = DateTable.resolve(["a.jpg", "b.jpg", "c.jpg"], start_date=date(2024, 1, 30), interval_days=2)
+    assert table.date_str_for(0, 0) == "2024-01-30"
+    # 日期按成功处理的帧序号递增，被跳过的图片不占用日期
+    assert table.date_for(2, 1) == date(2024, 2, 1)
+    assert DateTable.resolve(["a.jpg"]).date_for(0, 0) is None
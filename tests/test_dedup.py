@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+from dedup import DuplicatePruner, cluster_hashes, hamming_distance
+
+
+def _drifting_hashes(count):
+    """每个哈希与前一个相差 1 位，累积漂移"""
+    hashes, value = [], 0
+    for i in range(count):
+        hashes.append(value)
+        value ^= 1 << (i % 64)
+    return hashes
+
+
+def test_slow_drift_does_not_collapse_into_one_cluster():
+    hashes = _drifting_hashes(41)
+    assert hamming_distance(hashes[0], hashes[-1]) == 40
+    clusters = cluster_hashes(hashes, max_distance=4, window=10)
+    assert len(clusters) > 1
+    for cluster in clusters:
+        assert all(hamming_distance(hashes[cluster[0]], hashes[i]) <= 4 for i in cluster)
+
+
+def test_pruned_frames_stay_close_to_the_kept_frame():
+    hashes = _drifting_hashes(41)
+    scores = [float(i % 7) for i in range(len(hashes))]
+    duplicates = DuplicatePruner(max_distance=4, window=10).duplicates_from_hashes(hashes, scores)
+    assert len(duplicates) < len(hashes) - 1
+    for index, keep in duplicates.items():
+        assert hamming_distance(hashes[index], hashes[keep]) <= 4
+
+
+def test_unreadable_and_distant_frames_are_kept():
+    clusters = cluster_hashes([0, None, 0, (1 << 64) - 1], max_distance=4, window=None)
+    assert clusters == [[0, 2], [1], [3]]
+
+
+def test_window_limits_comparisons():
+    assert cluster_hashes([0, 0xFFFF, 0xFFFF0000, 0], max_distance=2, window=1) == [[0], [1], [2], [3]]
+    assert cluster_hashes([0, 0xFFFF, 0xFFFF0000, 0], max_distance=2, window=None) == [[0, 3], [1], [2]]
+
+
+def test_find_duplicates_reuses_cached_hashes(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, size=(256, 256, 3), dtype=np.uint8)
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"{i}.png")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    cache = {}
+    sources = [(path, path, path) for path in paths]
+    pruner = DuplicatePruner()
+    assert pruner.find_duplicates(sources, cache=cache) == {1: 0}
+    assert set(cache) == set(paths)
+
+    missing = [(name, str(tmp_path / "missing.png"), key) for name, _, key in sources]
+    assert pruner.find_duplicates(missing, cache=cache) == {1: 0}
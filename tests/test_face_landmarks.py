@@ -0,0 +1,50 @@
+import math
+
+import numpy as np
+
+from face_landmarks import LANDMARK_INDEX, NUM_LANDMARKS, select_reference_frame
+
+
+def _face(tilt=0.0, eye_distance=100.0, nose_x=0.0, nose_y=0.5):
+    """按几何特征构造一帧关键点：双眼倾角（度）、眼距、鼻尖偏移（以眼距为单位）"""
+    points = np.zeros((NUM_LANDMARKS, 2), np.float32)
+    left = np.array([200.0, 200.0])
+    unit = np.array([math.cos(math.radians(tilt)), math.sin(math.radians(tilt))])
+    normal = np.array([-unit[1], unit[0]])
+    right = left + unit * eye_distance
+    points[LANDMARK_INDEX['left_eye']] = left
+    points[LANDMARK_INDEX['right_eye']] = right
+    points[LANDMARK_INDEX['nose_tip']] = (left + right) / 2 + (unit * nose_x + normal * nose_y) * eye_distance
+    return points
+
+
+def _stack(*frames):
+    stacked = np.full((len(frames), NUM_LANDMARKS, 2), np.nan, np.float32)
+    for i, frame in enumerate(frames):
+        if frame is not None:
+            stacked[i] = frame
+    return stacked
+
+
+def test_nan_rows_are_never_chosen():
+    stacked = _stack(None, _face(), None)
+    assert select_reference_frame(stacked) == 1
+
+
+def test_no_usable_frames_returns_none():
+    assert select_reference_frame(_stack(None, None)) is None
+    # 眼距为 0 的退化检测结果也不可用
+    assert select_reference_frame(_stack(_face(eye_distance=0.0))) is None
+
+
+def test_outliers_do_not_shift_the_choice():
+    stacked = _stack(
+        _face(tilt=1.5, eye_distance=98, nose_x=0.03),
+        None,
+        _face(tilt=-1.0, eye_distance=103, nose_x=-0.02),
+        _face(tilt=0.1, eye_distance=100, nose_x=0.0),
+        _face(tilt=35.0, eye_distance=300, nose_x=0.4),
+        _face(tilt=-40.0, eye_distance=20, nose_x=-0.5),
+        None,
+    )
+    assert select_reference_frame(stacked) == 3
@@ -0,0 +1,38 @@
+import os
+
+from folder_index import FolderIndex, file_content_hash, index_folder, manifest_path_for
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_manifest_is_kept_out_of_the_photo_folder(tmp_path):
+    photos = tmp_path / "photos"
+    _write(str(photos / "a.jpg"), b"a")
+    manifest_dir = tmp_path / "index"
+    index = index_folder(str(photos), manifest_path=manifest_path_for(str(photos), str(manifest_dir)))
+    assert os.listdir(photos) == ["a.jpg"]
+    assert os.path.exists(index.manifest_path)
+    assert manifest_path_for(str(photos), str(manifest_dir)) != manifest_path_for(str(tmp_path), str(manifest_dir))
+
+
+def test_refresh_only_stats_and_hashes_on_demand(tmp_path):
+    photos = tmp_path / "photos"
+    _write(str(photos / "a.jpg"), b"first")
+    _write(str(photos / "sub" / "b.PNG"), b"second")
+    index = FolderIndex(str(photos), manifest_path=str(tmp_path / "manifest.json"))
+    added, changed, removed = index.refresh()
+    assert sorted(added) == ["a.jpg", os.path.join("sub", "b.PNG")]
+    assert all("hash" not in entry for entry in index.entries.values())
+
+    path = str(photos / "a.jpg")
+    assert index.content_hash(path) == file_content_hash(b"first")
+    index.save()
+
+    _write(path, b"changed!")
+    reloaded = FolderIndex(str(photos), manifest_path=str(tmp_path / "manifest.json"))
+    assert reloaded.refresh() == ([], ["a.jpg"], [])
+    assert reloaded.content_hash(path) == file_content_hash(b"changed!")
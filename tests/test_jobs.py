@@ -0,0 +1,165 @@
+import os
+from datetime import date
+
+import cv2
+import numpy as np
+import pytest
+
+from checkpoint import BatchCheckpoint
+from date_resolver import DateTable
+from face_landmarks import FaceLandmarks, LandmarkCache
+from frame_store import FrameStore
+from head_stabilizer import SKIP_READ_ERROR, HeadStabilizer
+from jobs import JOB_COMPLETED, JobManager, run_alignment
+
+
+class FixedLandmarksStabilizer(HeadStabilizer):
+    """不依赖 MediaPipe：每张图片都返回画面中间的一组固定关键点"""
+
+    def _get_stable_landmarks(self, image):
+        h, w = image.shape[:2]
+        return FaceLandmarks.from_detected(
+            [(w * 0.35, h * 0.4), (w * 0.45, h * 0.4), (w * 0.55, h * 0.4), (w * 0.65, h * 0.4), (w * 0.5, h * 0.55)]
+        )
+
+
+def _stabilizer():
+    stabilizer = FixedLandmarksStabilizer(output_size=(32, 32), preserve_background=False, force_reference_size=False)
+    stabilizer.set_reference_eyes_position(30)
+    return stabilizer
+
+
+def _images(directory, count):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{i:03d}.png")
+        cv2.imwrite(path, rng.integers(30, 230, size=(48, 64, 3), dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+def test_prune_keeps_most_recent_finished_jobs(tmp_path):
+    manager = JobManager(root=str(tmp_path), keep=10)
+    jobs = [manager.submit(lambda job: None, total=0) for _ in range(4)]
+    for job in jobs:
+        job.thread.join()
+    assert all(job.status == JOB_COMPLETED for job in jobs)
+    os.makedirs(tmp_path / "checkpoints")
+
+    removed = manager.prune(keep=2)
+    remaining = [job.id for job in manager.list_jobs()]
+    assert len(remaining) == 2
+    assert sorted(removed + remaining) == sorted(job.id for job in jobs)
+    assert (tmp_path / "checkpoints").is_dir()
+
+
+def test_frame_store_reads_frames_lazily_by_index(tmp_path):
+    store = FrameStore(str(tmp_path))
+    for value in (10, 20, 30):
+        store.append(f"{value}.jpg", np.full((4, 4, 3), value, dtype=np.uint8))
+    store.save()
+
+    reloaded = FrameStore(str(tmp_path))
+    assert int(reloaded[0][0, 0, 0]) == 10
+    assert int(reloaded[-1][0, 0, 0]) == 30
+    assert [int(frame[0, 0, 0]) for frame in reloaded] == [10, 20, 30]
+    with pytest.raises(IndexError):
+        reloaded[3]
+
+
+def test_frame_store_keeps_skip_reasons_of_same_named_inputs(tmp_path):
+    store = FrameStore(str(tmp_path))
+    store.skip("photo.jpg", [SKIP_READ_ERROR, ""], input_index=0)
+    store.skip("photo.jpg", ["no_face", ""], input_index=1)
+    store.skip("/watch/a.jpg", ["no_face", ""])
+    store.save()
+
+    reloaded = FrameStore(str(tmp_path))
+    assert [entry["reason"][0] for entry in reloaded.skipped.values()] == [SKIP_READ_ERROR, "no_face", "no_face"]
+    reloaded.unskip("/watch/a.jpg")
+    assert reloaded.known_sources() == {"photo.jpg"}
+
+
+def test_process_batch_reports_coded_reasons_and_removes_finished_checkpoint(tmp_path):
+    paths = _images(str(tmp_path), 3)
+    with open(paths[1], "wb") as f:
+        f.write(b"not an image")
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    aligned, successful, skipped = _stabilizer().process_batch(paths, eye_distance_percent=None, checkpoint_dir=checkpoint_dir)
+    assert successful == [paths[0], paths[2]]
+    assert skipped == [(paths[1], [SKIP_READ_ERROR, ""])]
+    assert not os.path.exists(checkpoint_dir)
+
+
+def test_run_alignment_resumes_from_checkpoint(tmp_path):
+    paths = _images(str(tmp_path), 4)
+    sources = [(path, path, LandmarkCache.key_for_path(path)) for path in paths]
+    manager = JobManager(root=str(tmp_path / "jobs"))
+    checkpoint_dir = manager.checkpoint_dir("fingerprint")
+
+    def cancel_after_two(job):
+        report = job.report
+
+        def cancelling_report(done, current=None):
+            if done >= 2:
+                job.cancel()
+            return report(done, current)
+
+        job.report = cancelling_report
+        run_alignment(job, _stabilizer(), sources, checkpoint=BatchCheckpoint(checkpoint_dir, "fingerprint"))
+
+    first = manager.submit(cancel_after_two, total=len(sources))
+    first.thread.join()
+    assert len(first.frames) < len(sources)
+    assert os.path.exists(checkpoint_dir)
+
+    stabilizer = _stabilizer()
+    second = manager.submit(
+        lambda job: run_alignment(job, stabilizer, sources, checkpoint=BatchCheckpoint(checkpoint_dir, "fingerprint")),
+        total=len(sources)
+    )
+    second.thread.join()
+    assert second.status == JOB_COMPLETED
+    assert [frame["source"] for frame in second.frames.frames] == paths
+    assert stabilizer.metrics.snapshot()["counters"]["resumed"] == len(first.frames)
+    assert not os.path.exists(checkpoint_dir)
+
+
+def test_input_dates_follow_aligned_frames_across_resume(tmp_path):
+    paths = _images(str(tmp_path), 4)
+    sources = [(path, path, LandmarkCache.key_for_path(path)) for path in paths]
+    table = DateTable.resolve(paths, start_date=date(2024, 1, 1), interval_days=1)
+    manager = JobManager(root=str(tmp_path / "jobs"))
+    checkpoint_dir = manager.checkpoint_dir("fingerprint")
+
+    class FailingStabilizer(FixedLandmarksStabilizer):
+        fail_key = None
+
+        def get_landmarks(self, image, cache_key=None):
+            if cache_key == self.fail_key:
+                raise ValueError("未检测到面部关键点")
+            return super().get_landmarks(image, cache_key=cache_key)
+
+    def run(fail_second):
+        stabilizer = FailingStabilizer(output_size=(32, 32), preserve_background=False, force_reference_size=False)
+        stabilizer.set_reference_eyes_position(30)
+        stabilizer.fail_key = sources[1][2] if fail_second else None
+        job = manager.submit(
+            lambda job: run_alignment(job, stabilizer, sources, date_table=table,
+                                      checkpoint=BatchCheckpoint(checkpoint_dir, "fingerprint")),
+            total=len(sources)
+        )
+        job.thread.join()
+        return job, stabilizer
+
+    first, _ = run(fail_second=True)
+    # 失败的图片不占用日期，日期仍然连续
+    assert [frame["date"] for frame in first.frames.frames] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert os.path.exists(checkpoint_dir)
+
+    second, stabilizer = run(fail_second=False)
+    assert [frame["source"] for frame in second.frames.frames] == paths
+    assert [frame["date"] for frame in second.frames.frames] == ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]
+    # 只有第一帧的日期没有变化，可以复用；其后的帧日期后移，重新处理
+    assert stabilizer.metrics.snapshot()["counters"]["resumed"] == 1
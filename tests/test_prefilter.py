@@ -0,0 +1,35 @@
+import numpy as np
+
+from prefilter import SKIP_BLURRY, SKIP_OVEREXPOSED, SKIP_TOO_DARK, FramePrefilter
+
+
+def _textured(value, size=(240, 320), seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(-40, 41, size=size + (3,))
+    return np.clip(value + noise, 0, 255).astype(np.uint8)
+
+
+def test_black_frame_is_too_dark():
+    assert FramePrefilter().evaluate(np.zeros((240, 320, 3), np.uint8))[0] == SKIP_TOO_DARK
+
+
+def test_white_frame_is_overexposed():
+    assert FramePrefilter().evaluate(np.full((240, 320, 3), 255, np.uint8))[0] == SKIP_OVEREXPOSED
+
+
+def test_portrait_on_black_backdrop_passes():
+    image = np.zeros((240, 320, 3), np.uint8)
+    # 画面中间 30% 为正常曝光、有纹理的人像，其余为纯黑背景
+    image[40:200, 100:220] = _textured(140, size=(160, 120))
+    assert FramePrefilter().evaluate(image) is None
+
+
+def test_dim_but_unclipped_photo_passes():
+    image = _textured(16, seed=1)
+    image = np.maximum(image, 8)
+    assert FramePrefilter().evaluate(image) is None
+
+
+def test_flat_photo_is_blurry_or_low_contrast():
+    reason = FramePrefilter(checks=("blur",)).evaluate(np.full((240, 320, 3), 128, np.uint8))
+    assert reason[0] == SKIP_BLURRY
@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+
+from face_landmarks import FaceLandmarks, NUM_LANDMARKS
+from reference_manager import ReferenceManager
+
+
+class CountingStabilizer:
+    def __init__(self):
+        self.detections = 0
+        self.reference = None
+
+    def get_landmarks(self, image):
+        self.detections += 1
+        return FaceLandmarks(np.ones((NUM_LANDMARKS, 2), np.float32))
+
+    def set_reference_from_landmarks(self, landmarks, image):
+        self.reference = landmarks
+
+
+def _png(value):
+    ok, data = cv2.imencode(".png", np.full((8, 8, 3), value, np.uint8))
+    assert ok
+    return data.tobytes()
+
+
+def test_same_content_is_shared_and_detected_once():
+    manager = ReferenceManager()
+    stabilizer = CountingStabilizer()
+    first = manager.add_bytes(_png(10), "a.png")
+    second = manager.add_bytes(_png(10), "b.png")
+    assert first is second
+    first.apply(stabilizer)
+    second.apply(CountingStabilizer())
+    assert stabilizer.detections == 1
+    assert stabilizer.reference is not None
+
+
+def test_held_reference_survives_eviction():
+    manager = ReferenceManager(max_references=2)
+    held = manager.add_bytes(_png(1), "held.png")
+    for value in range(2, 6):
+        manager.add_bytes(_png(value), f"{value}.png")
+    assert held.key not in manager
+    assert len(manager) == 2
+    stabilizer = CountingStabilizer()
+    held.apply(stabilizer)
+    assert held.image.shape == (8, 8, 3)
+    assert stabilizer.reference is not None
+
+
+def test_undecodable_data_returns_none():
+    assert ReferenceManager().add_bytes(b"not an image", "broken.png") is None
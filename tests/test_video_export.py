@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from video_export import (
+    SCHEDULE_CUSTOM, SCHEDULE_FORWARD, SCHEDULE_PING_PONG, CrossfadeSequence, FrameSchedule
+)
+
+
+def test_forward_schedule_holds_first_and_last_photo():
+    schedule = FrameSchedule(4, mode=SCHEDULE_FORWARD, hold_first=2, hold_last=3)
+    assert list(schedule) == [0, 0, 0, 1, 2, 3, 3, 3, 3]
+    assert schedule[-1] == 3
+
+
+def test_ping_pong_schedule_holds_last_photo_at_turnaround():
+    schedule = FrameSchedule(4, mode=SCHEDULE_PING_PONG, hold_first=1, hold_last=2)
+    assert list(schedule) == [0, 0, 1, 2, 3, 3, 3, 2, 1]
+
+
+@pytest.mark.parametrize("frame_count, expected", [
+    (1, [0, 0, 0]),
+    (2, [0, 1, 1, 1, 0]),
+    (3, [0, 1, 2, 2, 1]),
+])
+def test_ping_pong_short_batches(frame_count, expected):
+    assert list(FrameSchedule(frame_count, mode=SCHEDULE_PING_PONG, hold_last=1)) == expected
+
+
+def test_custom_schedule_holds_last_entry():
+    schedule = FrameSchedule(5, mode=SCHEDULE_CUSTOM, indices=[4, 0, 2], hold_first=1, hold_last=1)
+    assert list(schedule) == [4, 4, 0, 2, 2]
+    with pytest.raises(ValueError):
+        FrameSchedule(2, mode=SCHEDULE_CUSTOM, indices=[0, 2])
+
+
+def test_empty_schedule():
+    schedule = FrameSchedule(0, hold_first=3, hold_last=3)
+    assert len(schedule) == 0
+    with pytest.raises(IndexError):
+        schedule[0]
+
+
+def _frames(count):
+    return [np.full((2, 2, 3), 30 * i, dtype=np.uint8) for i in range(count)]
+
+
+@pytest.mark.parametrize("steps", [0, 1, 3])
+def test_crossfade_gives_every_photo_a_full_slot(steps):
+    frames = _frames(3)
+    sequence = CrossfadeSequence(lambda i: frames[i], len(frames), steps)
+    assert len(sequence) == len(frames) * (steps + 1)
+    shown = [int(sequence.read(i)[0, 0, 0]) for i in range(len(sequence))]
+    # 最后一张照片和其他照片一样完整停留 steps + 1 个输出帧
+    assert shown[-(steps + 1):] == [60] * (steps + 1)
+    assert shown[::steps + 1] == [0, 30, 60]
+
+
+def test_crossfade_blends_between_photos():
+    frames = _frames(2)
+    sequence = CrossfadeSequence(lambda i: frames[i], 2, 1)
+    assert int(sequence.read(1)[0, 0, 0]) == 15
+
+
+def test_crossfade_blends_frames_of_different_sizes():
+    frames = [np.zeros((4, 6, 3), np.uint8), np.full((8, 10, 3), 30, np.uint8)]
+    sequence = CrossfadeSequence(lambda i: frames[i], 2, 1)
+    blended = sequence.read(1)
+    assert blended.shape == (4, 6, 3)
+    assert int(blended[0, 0, 0]) == 15
+
+
+def test_hold_duration_does_not_depend_on_crossfade():
+    fps = 4
+    for steps in (0, 1, 4):
+        frames = _frames(3)
+        schedule = FrameSchedule(len(frames), hold_last=8)
+        sequence = CrossfadeSequence(lambda i: frames[schedule[i]], len(schedule), steps)
+        shown = [int(sequence.read(i)[0, 0, 0]) for i in range(len(sequence))]
+        trailing = len(shown) - max(i for i, value in enumerate(shown) if value != 60) - 1
+        # 末帧（含停留）在屏幕上的时间始终为 (1 + hold_last) / fps 秒
+        assert trailing / (fps * (steps + 1)) == pytest.approx(9 / fps)
+
+
+def test_crossfade_hashes_match_sequence_length():
+    sequence = CrossfadeSequence(lambda i: None, 3, 2)
+    hashes = sequence.frame_hashes(["a", "b", "c"])
+    assert len(hashes) == len(sequence)
+    assert hashes[0] == "a" and hashes[3] == "b" and hashes[-3:] == ["c", "c", "c"]
+    assert hashes[1] == "a>b@1/3"
@@ -0,0 +1,270 @@
+import hashlib
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+# 视频质量选项对应的编码器（fourcc）和扩展名
+VIDEO_CODECS = {
+    "低": {"codec": "XVID", "fourcc": "XVID", "ext": "avi"},
+    "中": {"codec": "MP4V", "fourcc": "mp4v", "ext": "mp4"},
+    "高": {"codec": "H264", "fourcc": "avc1", "ext": "mp4"},
+}
+
+
+def open_video_writer(path, fourcc, fps, size):
+    """创建 VideoWriter，无法打开时抛出异常"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"无法创建视频文件: {path}")
+    return writer
+
+
+def find_ffmpeg():
+    """查找 ffmpeg 可执行文件，找不到时返回 None"""
+    return shutil.which("ffmpeg")
+
+
+def frame_hash(frame):
+    """计算单帧图像内容的哈希（包含尺寸信息）"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(frame.shape).encode())
+    digest.update(np.ascontiguousarray(frame).data)
+    return digest.hexdigest()
+
+
+# 帧播放顺序模式
+SCHEDULE_FORWARD = "forward"
+SCHEDULE_PING_PONG = "ping_pong"
+SCHEDULE_CUSTOM = "custom"
+
+
+class FrameSchedule:
+    """帧播放顺序：第 i 个输出位置对应哪一个源帧，按需计算而不复制帧列表
+
+    支持正向、往返（ping-pong）、自定义索引列表，以及首帧/末帧额外停留若干帧。
+    末帧停留在最后一张照片上：正向和自定义顺序为最后一个位置，往返时为折返点。
+    """
+
+    def __init__(self, frame_count, mode=SCHEDULE_FORWARD, hold_first=0, hold_last=0, indices=None):
+        self.frame_count = frame_count
+        self.mode = mode
+        self.hold_first = max(0, int(hold_first))
+        self.hold_last = max(0, int(hold_last))
+        self.indices = None
+        if mode == SCHEDULE_CUSTOM:
+            if indices is None:
+                raise ValueError("自定义播放顺序需要提供索引列表")
+            self.indices = np.asarray(indices, dtype=np.int64)
+            if self.indices.size and (self.indices.min() < 0 or self.indices.max() >= frame_count):
+                raise ValueError("自定义播放顺序中的索引超出范围")
+        elif mode not in (SCHEDULE_FORWARD, SCHEDULE_PING_PONG):
+            raise ValueError(f"未知的播放顺序: {mode}")
+
+    def _base_length(self):
+        if self.mode == SCHEDULE_CUSTOM:
+            return len(self.indices)
+        if self.mode == SCHEDULE_PING_PONG and self.frame_count:
+            # 反向部分去掉首尾两帧以避免重复（不足3帧时整段反向）
+            return self.frame_count * 2 - 2 if self.frame_count > 2 else self.frame_count * 2
+        return self.frame_count
+
+    def _base(self, position):
+        if self.mode == SCHEDULE_CUSTOM:
+            return int(self.indices[position])
+        if position < self.frame_count:
+            return position
+        back = position - self.frame_count
+        return self.frame_count - 2 - back if self.frame_count > 2 else self.frame_count - 1 - back
+
+    def _hold_last_position(self):
+        # 末帧停留所在的基础位置：往返时停在折返点（最后一张照片），否则停在最后一个位置
+        if self.mode == SCHEDULE_PING_PONG:
+            return self.frame_count - 1
+        return self._base_length() - 1
+
+    def __len__(self):
+        base_length = self._base_length()
+        if base_length == 0:
+            return 0
+        return self.hold_first + base_length + self.hold_last
+
+    def __getitem__(self, position):
+        length = len(self)
+        if position < 0:
+            position += length
+        if not 0 <= position < length:
+            raise IndexError("播放位置超出范围")
+        if position < self.hold_first:
+            return self._base(0)
+        position -= self.hold_first
+        last_position = self._hold_last_position()
+        if position <= last_position:
+            return self._base(position)
+        extra = position - last_position
+        if extra <= self.hold_last:
+            return self._base(last_position)
+        return self._base(last_position + extra - self.hold_last)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+
+class SegmentedVideo:
+    """分段编码的视频：按固定帧数切分，每段独立编码并按帧哈希缓存，最后无需重新编码直接拼接
+
+    每个分段是独立的视频文件，都从关键帧开始（GOP 与分段边界对齐），
+    因此可以用 ffmpeg 的 concat 直接拼接。某一帧变化或在末尾追加帧时，
+    只有哈希发生变化的分段需要重新编码。没有 ffmpeg 时退回到整体重新编码。
+    """
+
+    def __init__(self, output_path, cache_dir, fps, segment_length=60, fourcc="mp4v"):
+        self.output_path = output_path
+        self.cache_dir = cache_dir
+        self.fps = fps
+        self.segment_length = segment_length
+        self.fourcc = fourcc
+        self.ext = os.path.splitext(output_path)[1] or ".mp4"
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def segment_key(self, hashes):
+        """分段缓存键：由分段内所有帧的哈希和编码参数决定"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{self.fourcc}|{self.fps}|".encode())
+        for h in hashes:
+            digest.update(h.encode())
+        return digest.hexdigest()
+
+    def segment_path(self, key):
+        return os.path.join(self.cache_dir, f"segment_{key}{self.ext}")
+
+    def _encode_frames(self, path, indices, read_frame):
+        writer = None
+        tmp_path = f"{path}.tmp{self.ext}"
+        try:
+            for i in indices:
+                frame = read_frame(i)
+                if writer is None:
+                    h, w = frame.shape[:2]
+                    writer = open_video_writer(tmp_path, self.fourcc, self.fps, (w, h))
+                writer.write(frame)
+        finally:
+            if writer is not None:
+                writer.release()
+        os.replace(tmp_path, path)
+
+    def export(self, frame_count, read_frame, frame_hashes=None, progress=None):
+        """导出视频，返回 (重新编码的分段数, 复用的分段数)
+
+        read_frame(i) 返回第 i 帧（BGR 图像）；frame_hashes 为每帧的哈希，
+        未提供时读取每帧计算；progress(已完成分段, 总分段) 用于报告进度
+        """
+        if frame_count == 0:
+            raise ValueError("没有可导出的帧")
+        if find_ffmpeg() is None:
+            # 没有 ffmpeg 无法无损拼接，直接整体重新编码
+            self._encode_frames(self.output_path, range(frame_count), read_frame)
+            return 1, 0
+        if frame_hashes is None:
+            frame_hashes = [frame_hash(read_frame(i)) for i in range(frame_count)]
+
+        num_segments = (frame_count + self.segment_length - 1) // self.segment_length
+        segment_paths = []
+        encoded = reused = 0
+        for segment_index in range(num_segments):
+            start = segment_index * self.segment_length
+            end = min(start + self.segment_length, frame_count)
+            path = self.segment_path(self.segment_key(frame_hashes[start:end]))
+            if os.path.exists(path):
+                reused += 1
+            else:
+                self._encode_frames(path, range(start, end), read_frame)
+                encoded += 1
+            segment_paths.append(path)
+            if progress:
+                progress(segment_index + 1, num_segments)
+
+        self._concat(segment_paths)
+        self._prune(segment_paths)
+        return encoded, reused
+
+    def _concat(self, segment_paths):
+        list_path = os.path.join(self.cache_dir, "segments.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in segment_paths:
+                segment = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{segment}'\n")
+        subprocess.run(
+            [find_ffmpeg(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_path, "-c", "copy", self.output_path],
+            check=True
+        )
+
+    def _prune(self, keep_paths):
+        """删除本次导出未使用的旧分段"""
+        keep = {os.path.abspath(path) for path in keep_paths}
+        for name in os.listdir(self.cache_dir):
+            path = os.path.abspath(os.path.join(self.cache_dir, name))
+            if name.startswith("segment_") and path not in keep:
+                os.remove(path)
+
+
+class CrossfadeSequence:
+    """在相邻两帧之间插入 steps 个淡入淡出过渡帧的帧序列
+
+    按输出帧序号随机访问，过渡帧在读取时才用 cv2.addWeighted 混合生成，
+    不会预先生成整段序列；混合结果写入复用的缓冲区，
+    因此 read() 返回的帧只在下一次调用前有效，需要保留时请自行复制。
+    最后一帧同样占满 steps + 1 个输出帧，使每个源帧（包括末帧停留）的时长都与插帧数无关。
+    """
+
+    def __init__(self, read_frame, frame_count, steps):
+        self.read_frame = read_frame
+        self.frame_count = frame_count
+        self.steps = max(0, int(steps))
+        self._source_cache = {}
+        self._buffer = None
+
+    def __len__(self):
+        if self.frame_count == 0:
+            return 0
+        return self.frame_count * (self.steps + 1)
+
+    def _source(self, index):
+        # 顺序读取时只需保留当前这一对源帧
+        frame = self._source_cache.get(index)
+        if frame is None:
+            frame = self.read_frame(index)
+            self._source_cache = {k: v for k, v in self._source_cache.items() if k == index - 1}
+            self._source_cache[index] = frame
+        return frame
+
+    def read(self, index):
+        """返回第 index 个输出帧"""
+        source_index, offset = divmod(index, self.steps + 1)
+        if offset == 0 or source_index == self.frame_count - 1:
+            return self._source(source_index)
+        a = self._source(source_index)
+        b = self._source(source_index + 1)
+        if b.shape != a.shape:
+            # 保留背景且不强制参考尺寸时各帧尺寸可能不同，过渡时把下一帧缩放到当前帧的尺寸
+            b = cv2.resize(b, (a.shape[1], a.shape[0]), interpolation=cv2.INTER_AREA)
+        if self._buffer is None or self._buffer.shape != a.shape:
+            self._buffer = np.empty_like(a)
+        t = offset / (self.steps + 1)
+        cv2.addWeighted(a, 1.0 - t, b, t, 0.0, dst=self._buffer)
+        return self._buffer
+
+    def frame_hashes(self, source_hashes):
+        """由源帧哈希推导每个输出帧的哈希，无需生成过渡帧"""
+        hashes = []
+        for index in range(len(self)):
+            source_index, offset = divmod(index, self.steps + 1)
+            if offset == 0 or source_index == self.frame_count - 1:
+                hashes.append(source_hashes[source_index])
+            else:
+                hashes.append(f"{source_hashes[source_index]}>{source_hashes[source_index + 1]}@{offset}/{self.steps + 1}")
+        return hashes
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+监视文件夹，持续增量对齐新加入的照片
+Watch a folder and incrementally align new photos against a fixed reference
+
+用法: python watch_folder.py /path/to/photos --reference ref.jpg --output-dir deforum_watch
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import sys
+import time
+
+import cv2
+
+from face_landmarks import LandmarkCache
+from folder_index import FolderIndex
+from frame_store import FrameStore
+from head_stabilizer import HeadStabilizer
+from video_export import SegmentedVideo
+
+# inotify 事件：文件写入完成、移入目录、新建（用于发现新子目录）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+logger = logging.getLogger(__name__)
+
+
+class InotifyWaiter:
+    """基于 Linux inotify 的唤醒器：被监视目录中有文件写入或移入时立即返回"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.watched = set()
+
+    def add_directory(self, path):
+        if path in self.watched:
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watched.add(path)
+
+    def wait(self, timeout):
+        """等待事件或超时，有事件时返回 True"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # 读空事件队列，只关心"有变化"这一事实
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWaiter:
+    """轮询唤醒器：不支持 inotify 的平台上按固定间隔重新扫描"""
+
+    def add_directory(self, path):
+        pass
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return False
+
+    def close(self):
+        pass
+
+
+def create_waiter():
+    """优先使用 inotify，不可用时退回到轮询"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWaiter()
+        except (OSError, AttributeError):
+            pass
+    return PollingWaiter()
+
+
+def list_directories(root):
+    """列出 root 及其所有非隐藏子目录"""
+    directories = [root]
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as iterator:
+                for entry in iterator:
+                    if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                        directories.append(entry.path)
+                        stack.append(entry.path)
+        except OSError:
+            continue
+    return directories
+
+
+class IncrementalAligner:
+    """增量对齐：只处理帧库中尚未出现的图片，追加到帧库并更新视频尾部"""
+
+    def __init__(self, stabilizer, store, video=None, filter_tilted=True, warp_quality=None):
+        self.stabilizer = stabilizer
+        self.store = store
+        self.video = video
+        self.filter_tilted = filter_tilted
+        self.warp_quality = warp_quality
+        # 帧库有视频中还没有的新帧（上次导出失败时保持为 True，下一轮重试）
+        self.video_outdated = False
+
+    def pending(self, image_paths):
+        """返回尚未处理过的图片路径"""
+        known = self.store.known_sources()
+        return [path for path in image_paths if path not in known]
+
+    def retry(self, image_paths):
+        """清除这些图片的跳过记录，使内容变化后的文件重新处理"""
+        for path in image_paths:
+            self.store.unskip(path)
+
+    def process(self, image_paths):
+        """对齐新图片并追加到帧库，返回新增的帧数
+
+        调用方只传入大小和修改时间已稳定的文件，此时仍无法解码的图片记为跳过，
+        文件之后再变化时由 retry() 重新处理
+        """
+        first_new = len(self.store)
+        for path in image_paths:
+            img = cv2.imread(path)
+            if img is None:
+                self.store.skip(path, "无法读取图片")
+                continue
+            try:
+                landmarks = self.stabilizer.get_landmarks(img, cache_key=LandmarkCache.key_for_path(path))
+                if self.filter_tilted:
+                    is_straight, _, reason = self.stabilizer.check_head_tilt(img, landmarks=landmarks)
+                    if not is_straight:
+                        self.store.skip(path, f"头部倾斜: {reason}")
+                        continue
+                aligned = self.stabilizer.align_and_crop_face(img, landmarks=landmarks, quality=self.warp_quality)
+            except Exception as e:
+                self.store.skip(path, f"处理失败: {e}")
+                continue
+            self.store.append(path, aligned)
+        self.store.save()
+
+        added = len(self.store) - first_new
+        if added:
+            self.video_outdated = True
+        self.update_video()
+        return added
+
+    def update_video(self):
+        """视频落后于帧库时重新导出；导出失败（如 ffmpeg 不可用、磁盘已满）只记录日志，下一轮再试"""
+        if self.video is None or not self.video_outdated:
+            return
+        try:
+            encoded, reused = self.video.export(len(self.store), self.store.read_frame, self.store.frame_hashes())
+        except Exception as e:
+            logger.warning("视频导出失败，将在下一轮重试: %s", e)
+            return
+        self.video_outdated = False
+        print(f"🎬 视频已更新：重新编码 {encoded} 段，复用 {reused} 段")
+
+
+def watch(aligner, folder, poll_interval=30.0, settle_time=2.0, once=False):
+    """监视文件夹：有新文件时增量对齐；inotify 不可用时按 poll_interval 轮询
+
+    新文件要在相隔 settle_time 的两次扫描中大小和修改时间都不变才处理，
+    避免对齐仍在复制中的文件
+    """
+    index = FolderIndex(folder)
+    waiter = create_waiter()
+    print(f"👀 正在监视: {folder} ({type(waiter).__name__})")
+    previous = {}
+    try:
+        while True:
+            for directory in list_directories(index.root):
+                waiter.add_directory(directory)
+            added, changed, removed = index.refresh()
+            if added or changed or removed:
+                index.save()
+            if changed:
+                aligner.retry([os.path.join(index.root, rel_path) for rel_path in changed])
+
+            signatures = index.signatures()
+            new_paths = aligner.pending(index.paths())
+            stable_paths = [path for path in new_paths if previous.get(path) == signatures[path]]
+            previous = signatures
+            if stable_paths:
+                count = aligner.process(stable_paths)
+                print(f"✅ 新增 {count} 帧，共 {len(aligner.store)} 帧")
+            else:
+                # 重试之前失败的视频导出（视频已是最新时不做任何事）
+                aligner.update_video()
+
+            if len(stable_paths) < len(new_paths):
+                # 还有文件在写入，等待稳定后重新扫描（--once 时也要等它们处理完）
+                time.sleep(settle_time)
+                continue
+            if once:
+                break
+            waiter.wait(poll_interval)
+    except KeyboardInterrupt:
+        print("\n👋 已停止监视")
+    finally:
+        waiter.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="监视文件夹并增量对齐新照片")
+    parser.add_argument("folder", help="要监视的照片文件夹")
+    parser.add_argument("--reference", help="固定的参考图片路径（输出尺寸与参考图片相同）")
+    parser.add_argument("--eye-distance", type=int, default=30, help="未提供参考图片时的眼睛间距百分比")
+    parser.add_argument("--output-size", type=int, nargs=2, metavar=("W", "H"),
+                        help="输出尺寸，默认 512 512；不能与 --reference 同时使用")
+    parser.add_argument("--output-dir", default="deforum_watch", help="帧库和视频的输出目录（不能位于被监视的文件夹内）")
+    parser.add_argument("--fps", type=int, default=8, help="输出视频帧率")
+    parser.add_argument("--segment-length", type=int, default=60, help="视频分段的帧数")
+    parser.add_argument("--no-tilt-filter", action="store_true", help="不过滤倾斜头部的照片")
+    parser.add_argument("--no-video", action="store_true", help="只对齐，不更新视频")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="轮询/重新扫描的间隔（秒）")
+    parser.add_argument("--once", action="store_true", help="只处理一次当前的新照片后退出")
+    parser.add_argument("--verbose", action="store_true", help="输出每张图片的处理日志（DEBUG 级别）")
+    args = parser.parse_args(argv)
+
+    # 输出目录在被监视的文件夹内时，对齐结果会被当作新照片再次对齐
+    folder = os.path.realpath(args.folder)
+    if os.path.commonpath([folder, os.path.realpath(args.output_dir)]) == folder:
+        parser.error("--output-dir 不能位于被监视的文件夹内")
+
+    # 参考关键点以参考图片的像素坐标表示，输出尺寸必须与参考图片一致
+    if args.reference and args.output_size:
+        parser.error("--output-size 不能与 --reference 同时使用：输出尺寸取参考图片的尺寸")
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+    stabilizer = HeadStabilizer(output_size=tuple(args.output_size or (512, 512)), preserve_background=False)
+    if args.reference:
+        ref_img = cv2.imread(args.reference)
+        if ref_img is None:
+            parser.error(f"无法读取参考图片: {args.reference}")
+        stabilizer.set_reference_from_image(ref_img)
+    else:
+        stabilizer.set_reference_eyes_position(args.eye_distance)
+
+    store = FrameStore(args.output_dir)
+    video = None
+    if not args.no_video:
+        video = SegmentedVideo(
+            os.path.join(args.output_dir, "timelapse.mp4"),
+            os.path.join(args.output_dir, "segments"),
+            fps=args.fps,
+            segment_length=args.segment_length
+        )
+    aligner = IncrementalAligner(stabilizer, store, video=video, filter_tilted=not args.no_tilt_filter)
+    watch(aligner, args.folder, poll_interval=args.poll_interval, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# 字体颜色映射（BGR）
+COLOR_MAP = {
+    "white": (255, 255, 255),
+    "black": (0, 0, 0),
+    "yellow": (0, 255, 255),
+    "red": (0, 0, 255)
+}
+
+# 背景矩形相对文字的内边距（像素）
+BACKGROUND_PADDING = 5
+
+
+class DateWatermarker:
+    """日期水印：每个日期字符串只渲染一次透明度精灵，之后只在水印区域内原地混合
+
+    与逐帧复制整幅图片再 addWeighted 相比，每帧只处理水印所在的小矩形。
+    """
+
+    def __init__(self, position, font_size, font_color, background_opacity, margin, max_sprites=256):
+        self.position = position
+        self.font_size = font_size
+        self.font_color = font_color
+        self.background_opacity = background_opacity
+        self.margin = margin
+        self.max_sprites = max_sprites
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.text_color = np.array(COLOR_MAP.get(font_color, (255, 255, 255)), dtype=np.float32)
+        # 根据字体颜色选择背景颜色（对比色）：亮色字体用黑色背景，暗色字体用白色背景
+        if font_color in ["white", "yellow"]:
+            self.bg_color = np.zeros(3, dtype=np.float32)
+        else:
+            self.bg_color = np.full(3, 255, dtype=np.float32)
+        self._sprites = OrderedDict()
+
+    def _render_sprite(self, date_str, w, h):
+        """渲染精灵：返回水印区域 (x0, y0, x1, y1)、文字透明度和背景透明度"""
+        # 根据图片宽度的百分比计算字体大小
+        font_scale = (self.font_size / 100.0) * (w / 100.0)
+        thickness = max(1, int(font_scale * 2))
+        (text_width, text_height), baseline = cv2.getTextSize(date_str, self.font, font_scale, thickness)
+
+        # 根据位置计算文字基线坐标
+        if self.position == "position_top_left":
+            x, y = self.margin, self.margin + text_height
+        elif self.position == "position_top_right":
+            x, y = w - text_width - self.margin, self.margin + text_height
+        elif self.position == "position_bottom_left":
+            x, y = self.margin, h - self.margin
+        else:  # position_bottom_right
+            x, y = w - text_width - self.margin, h - self.margin
+
+        # 水印区域：文字笔画范围与背景矩形的并集，并裁剪到图片内
+        stroke = thickness + 2
+        x0, y0 = x - stroke, y - text_height - stroke
+        x1, y1 = x + text_width + stroke, y + baseline + stroke
+        padding = BACKGROUND_PADDING
+        bg_x1, bg_y1 = max(0, x - padding), max(0, y - text_height - padding)
+        bg_x2, bg_y2 = min(w, x + text_width + padding), min(h, y + padding)
+        if self.background_opacity > 0:
+            x0, y0 = min(x0, bg_x1), min(y0, bg_y1)
+            x1, y1 = max(x1, bg_x2 + 1), max(y1, bg_y2 + 1)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(w, x1), min(h, y1)
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        text_alpha = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.putText(text_alpha, date_str, (x - x0, y - y0), self.font, font_scale, 255, thickness, cv2.LINE_AA)
+
+        bg_alpha = None
+        if self.background_opacity > 0:
+            bg_alpha = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+            # cv2.rectangle 的填充包含两个端点
+            bg_alpha[max(0, bg_y1 - y0):bg_y2 - y0 + 1, max(0, bg_x1 - x0):bg_x2 - x0 + 1] = self.background_opacity
+
+        return (x0, y0, x1, y1), text_alpha, bg_alpha
+
+    def _get_sprite(self, date_str, w, h):
+        key = (date_str, w, h)
+        sprite = self._sprites.get(key)
+        if sprite is None and key not in self._sprites:
+            sprite = self._render_sprite(date_str, w, h)
+            self._sprites[key] = sprite
+            if len(self._sprites) > self.max_sprites:
+                self._sprites.popitem(last=False)
+        else:
+            self._sprites.move_to_end(key)
+        return sprite
+
+    def apply(self, image, date_str):
+        """在图片上原地添加日期水印，返回同一个图片对象"""
+        if not date_str:
+            return image
+        h, w = image.shape[:2]
+        sprite = self._get_sprite(date_str, w, h)
+        if sprite is None:
+            return image
+
+        (x0, y0, x1, y1), text_alpha, bg_alpha = sprite
+        roi = image[y0:y1, x0:x1]
+        a_text = (text_alpha.astype(np.float32) * (1.0 / 255.0))[..., None]
+
+        # 先叠加半透明背景，再叠加抗锯齿文字
+        blended = roi.astype(np.float32)
+        if bg_alpha is not None:
+            a_bg = bg_alpha[..., None]
+            blended *= 1.0 - a_bg
+            blended += self.bg_color * a_bg
+        blended *= 1.0 - a_text
+        blended += self.text_color * a_text
+        blended += 0.5
+        np.copyto(roi, blended, casting='unsafe')
+        return image
+
+
+def add_date_watermark(image, date_str, position, font_size, font_color, background_opacity, margin):
+    """在图片上添加日期水印（返回新图片，不修改原图）"""
+    if not date_str:
+        return image
+    watermarker = DateWatermarker(position, font_size, font_color, background_opacity, margin)
+    return watermarker.apply(image.copy(), date_str)